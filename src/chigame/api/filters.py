@@ -1,12 +1,21 @@
 import django_filters
+from django_filters.widgets import BooleanWidget
 
-from chigame.games.models import Game
+from chigame.games.fuzzy import fuzzy_search_games
+from chigame.games.models import Game, playable_with
+from chigame.games.search import search_games
 
 
 class GameFilter(django_filters.FilterSet):
     # https://www.w3schools.com/django/ref_lookups_icontains.php
     # icontains: case-insensitive containment test
-    name = django_filters.CharFilter(lookup_expr="icontains")
+    # With fuzzy=1, names are matched with typo tolerance instead (see chigame/games/fuzzy.py)
+    name = django_filters.CharFilter(method="filter_name")
+    fuzzy = django_filters.BooleanFilter(method="filter_fuzzy", widget=BooleanWidget())
+
+    # full-text search over names, descriptions, categories, mechanics, people and publishers,
+    # ordered by relevance (see chigame/games/search.py)
+    search = django_filters.CharFilter(method="filter_search")
 
     year_published = django_filters.NumberFilter(lookup_expr="exact")
     year_published__gte = django_filters.NumberFilter(field_name="year_published", lookup_expr="gte")
@@ -36,12 +45,30 @@ class GameFilter(django_filters.FilterSet):
     max_players__gte = django_filters.NumberFilter(field_name="max_players", lookup_expr="gte")
     max_players__lte = django_filters.NumberFilter(field_name="max_players", lookup_expr="lte")
 
+    # games playable with this many players (an indexed lookup, see playable_with)
+    players = django_filters.NumberFilter(method="filter_players")
+
     complexity = django_filters.NumberFilter(lookup_expr="exact")
     complexity__gte = django_filters.NumberFilter(field_name="complexity", lookup_expr="gte")
     complexity__lte = django_filters.NumberFilter(field_name="complexity", lookup_expr="lte")
 
     BGG_id = django_filters.NumberFilter(lookup_expr="exact")
 
+    def filter_name(self, queryset, name, value):
+        if self.form.cleaned_data.get("fuzzy"):
+            return fuzzy_search_games(value, queryset)
+        return queryset.filter(name__icontains=value)
+
+    def filter_fuzzy(self, queryset, name, value):
+        # fuzzy only changes how `name` is matched, see filter_name
+        return queryset
+
+    def filter_players(self, queryset, name, value):
+        return queryset.filter(playable_with(int(value)))
+
+    def filter_search(self, queryset, name, value):
+        return search_games(value, queryset)
+
     class Meta:
         model = Game
         fields = [
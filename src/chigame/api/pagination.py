@@ -0,0 +1,78 @@
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from chigame.games.pagination import KeysetPaginator, MatchHistoryPaginator, resolve_sort
+
+
+class GameCursorPagination(BasePagination):
+    """
+    Cursor pagination for games, sharing the sort modes and cursor tokens of the game grid
+    (see chigame/games/pagination.py). Unlike PageNumberPagination it runs no COUNT(*) and no
+    OFFSET, so every page costs the same.
+
+    Query parameters:
+        sort_by: a sort mode of the game grid, e.g. "name-asc", "year_published-desc" or
+            "rating_score-desc" (top rated, see chigame/games/ratings.py). Defaults
+            to "relevance" for full-text and fuzzy searches, and to the game id otherwise.
+        cursor: the token from a previous response's `next` or `previous` link.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    sort_query_param = "sort_by"
+    cursor_query_param = "cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.sort = resolve_sort(queryset, request.query_params.get(self.sort_query_param) or "relevance", "id-asc")
+        paginator = KeysetPaginator(queryset, self.sort, self.page_size)
+        self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page.previous_cursor is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.page.previous_cursor)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class MatchHistoryCursorPagination(GameCursorPagination):
+    """
+    Cursor pagination for a user's match history, newest match first (see MatchHistoryPaginator).
+
+    Query parameters:
+        cursor: the token from a previous response's `next` or `previous` link.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = MatchHistoryPaginator(queryset, self.page_size)
+        self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
@@ -1,13 +1,67 @@
 from rest_framework import serializers
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.utils import model_meta
 
-from chigame.games.models import Category, Chat, Game, Lobby, Mechanic, Message, Tournament, User
+from chigame.games.models import (
+    Category,
+    Chat,
+    Game,
+    Lobby,
+    Mechanic,
+    Message,
+    Player,
+    PlayerRating,
+    ReviewSummary,
+    Tournament,
+    User,
+)
+from chigame.games.results import record_match_results
 from chigame.users.models import Group
 
 
+class ReviewSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReviewSummary
+        fields = ("review_count", "rating_count", "rating_mean", "histogram")
+
+
 class GameSerializer(serializers.ModelSerializer):
+    """
+    Creating a game with the BGG_id of an existing game updates that game instead (an upsert), so
+    posting the same BoardGameGeek game twice doesn't fail or create a duplicate.
+    """
+
+    # None until the game's first review
+    review_summary = ReviewSummarySerializer(read_only=True, allow_null=True)
+
     class Meta:
         model = Game
         fields = "__all__"
+        # Creating checks for an existing game itself (see create), updating in validate_BGG_id
+        extra_kwargs = {"BGG_id": {"validators": []}}
+
+    def validate_BGG_id(self, value):
+        if self.instance is not None and value is not None:
+            if Game.objects.filter(BGG_id=value).exclude(pk=self.instance.pk).exists():
+                raise serializers.ValidationError("Another game has this BGG id.")
+        return value
+
+    def create(self, validated_data):
+        if validated_data.get("BGG_id") is None:
+            return super().create(validated_data)
+        relations = model_meta.get_field_info(Game).relations
+        many_to_many = {
+            name: validated_data.pop(name)
+            for name in list(validated_data)
+            if name in relations and relations[name].to_many
+        }
+        game = Game(**validated_data)
+        # Only the posted fields overwrite an existing game
+        if not Game.upsert_one(game, update_fields=list(validated_data)):
+            game.refresh_from_db()
+        for name, value in many_to_many.items():
+            getattr(game, name).set(value)
+        return game
 
 
 class LobbySerializer(serializers.ModelSerializer):
@@ -96,3 +150,110 @@ class MessageFeedSerializer(serializers.ModelSerializer):
 
     def get_sender(self, obj):
         return obj.sender.name
+
+
+class PlayerRatingSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source="user.username", read_only=True)
+    game_name = serializers.CharField(source="game.name", read_only=True)
+
+    class Meta:
+        model = PlayerRating
+        fields = ("user", "username", "game", "game_name", "rating", "matches_rated")
+
+
+class OpponentSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source="user_id")
+    username = serializers.CharField(source="user.username")
+    outcome = serializers.CharField(source="get_outcome_display", allow_null=True)
+
+    class Meta:
+        model = Player
+        fields = ("id", "username", "outcome", "team")
+
+
+class MatchHistorySerializer(serializers.ModelSerializer):
+    """
+    A match in a user's history (see Player.match_history), from the user's point of view.
+    """
+
+    match = serializers.IntegerField(source="match_id")
+    lobby = serializers.IntegerField(source="match.lobby_id")
+    game = serializers.SerializerMethodField()
+    outcome = serializers.CharField(source="get_outcome_display", allow_null=True)
+    opponents = OpponentSerializer(many=True)
+
+    class Meta:
+        model = Player
+        fields = ("match", "lobby", "game", "date_played", "outcome", "team", "role", "victory_type", "opponents")
+
+    def get_game(self, obj):
+        return {"id": obj.match.game_id, "name": obj.match.game.name}
+
+
+class PlayerResultSerializer(serializers.Serializer):
+    user = serializers.IntegerField(min_value=1)
+    outcome = serializers.ChoiceField(choices=Player.OUTCOMES)
+    team = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    role = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    victory_type = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class MatchResultSerializer(serializers.Serializer):
+    lobby = serializers.IntegerField(min_value=1)
+    date_played = serializers.DateTimeField(required=False)
+    players = PlayerResultSerializer(many=True, allow_empty=False)
+
+    def validate_players(self, value):
+        user_ids = [player["user"] for player in value]
+        if len(set(user_ids)) != len(user_ids):
+            raise serializers.ValidationError("A player is reported more than once.")
+        return value
+
+
+class MatchResultsSerializer(serializers.Serializer):
+    """
+    The results of many matches in progress, recorded at once (see chigame/games/results.py).
+    Every player must be a member of the match's lobby, and so must the user reporting them
+    unless they are staff; checking this takes two queries for the whole batch.
+    """
+
+    # Results per request
+    MAX_MATCHES = 1000
+
+    matches = MatchResultSerializer(many=True, allow_empty=False, max_length=MAX_MATCHES)
+
+    def validate_matches(self, value):
+        lobby_ids = [match["lobby"] for match in value]
+        if len(set(lobby_ids)) != len(lobby_ids):
+            raise serializers.ValidationError("A lobby is reported more than once.")
+        lobbies = Lobby.objects.only("game_id", "member_count", "match_status").in_bulk(lobby_ids)
+        missing = [lobby_id for lobby_id in lobby_ids if lobby_id not in lobbies]
+        if missing:
+            raise serializers.ValidationError(f"Unknown lobbies: {', '.join(map(str, missing))}.")
+        # Lobbies that haven't started, or are over (played or cancelled), take no results
+        closed = [lobby_id for lobby_id in lobby_ids if lobbies[lobby_id].match_status != Lobby.Viewable]
+        if closed:
+            raise serializers.ValidationError(f"Lobbies not in progress: {', '.join(map(str, closed))}.")
+        reporter = self.context["request"].user
+        user_ids = {player["user"] for match in value for player in match["players"]} | {reporter.pk}
+        members = set(
+            Lobby.members.through.objects.filter(lobby_id__in=lobby_ids, user_id__in=user_ids).values_list(
+                "lobby_id", "user_id"
+            )
+        )
+        if not reporter.is_staff:
+            outside = [lobby_id for lobby_id in lobby_ids if (lobby_id, reporter.pk) not in members]
+            if outside:
+                raise PermissionDenied(f"You aren't a member of lobbies {', '.join(map(str, outside))}.")
+        for match in value:
+            for player in match["players"]:
+                if (match["lobby"], player["user"]) not in members:
+                    raise serializers.ValidationError(
+                        f"User {player['user']} isn't a member of lobby {match['lobby']}."
+                    )
+                player["user_id"] = player.pop("user")
+            match["lobby"] = lobbies[match["lobby"]]
+        return value
+
+    def create(self, validated_data):
+        return record_match_results(validated_data["matches"])
@@ -20,7 +20,7 @@ class MechanicFactory(DjangoModelFactory):
     class Meta:
         model = Mechanic
 
-    name = Faker("word")
+    name = Sequence(lambda n: f"Mechanic {n + 1}")
     description = Faker("text", max_nb_chars=200)
 
 
@@ -49,7 +49,8 @@ class GameFactory(DjangoModelFactory):
 
     complexity = Faker("pyint", min_value=1, max_value=5)
 
-    BGG_id = Faker("pyint", min_value=1, max_value=1000000)
+    # Unique, and far from the small ids tests give their own games
+    BGG_id = Sequence(lambda n: 1000000 + n)
 
     @post_generation
     def categories(self, create, extracted, **kwargs):
@@ -2,7 +2,10 @@
 
 # Create your tests here.
 # Compare this snippet from src/chigame/api/tests.py:
+from datetime import timedelta
+
 from django.urls import reverse
+from django.utils import timezone
 
 # Related third party imports
 from rest_framework import status
@@ -11,8 +14,8 @@ from rest_framework.utils.serializer_helpers import ReturnDict
 
 # Local application/library specific imports
 from chigame.api.serializers import GameSerializer
-from chigame.api.tests.factories import ChatFactory, GameFactory, TournamentFactory, UserFactory
-from chigame.games.models import Game, Message, User
+from chigame.api.tests.factories import ChatFactory, GameFactory, LobbyFactory, TournamentFactory, UserFactory
+from chigame.games.models import Game, Lobby, Match, Message, Player, PlayerRating, User
 
 
 class GameTests(APITestCase):
@@ -153,6 +156,35 @@ class GameTests(APITestCase):
         self.assertIsNotNone(updated_game)
         self.check_equal(updated_game, updated_data)
 
+    def test_create_game_with_existing_bgg_id_updates_it(self):
+        """
+        Ensure posting a game with the BGG id of an existing game updates that game.
+        """
+        game = GameFactory(BGG_id=13)
+        url = reverse("api-game-list")
+        data = {
+            "name": "Catan",
+            "description": "Trade and build.",
+            "min_players": 3,
+            "max_players": 4,
+            "complexity": "2.30",
+            "BGG_id": 13,
+        }
+
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["id"], game.id)
+        self.assertEqual(Game.objects.count(), 1)
+        self.check_equal(Game.objects.get(), {"name": "Catan", "BGG_id": 13})
+        # Fields that weren't posted are kept
+        self.assertEqual(response.data["categories"], list(game.categories.values_list("pk", flat=True)))
+        self.assertEqual(response.data["rating_score"], game.rating_score)
+
+        # Another game can't take the BGG id of an existing one
+        other = GameFactory()
+        response = self.client.patch(reverse("api-game-detail", args=[other.id]), {"BGG_id": 13}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_delete_game(self):
         """
         Ensure we can delete a game object.
@@ -169,6 +201,24 @@ class GameTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Game.objects.count(), 0)
 
+    def test_game_autocomplete(self):
+        """
+        Ensure the autocomplete endpoint suggests games by name or word prefix, up to the limit.
+        """
+        catan = GameFactory(name="Catan")
+        cards = GameFactory(name="Exploding Cats")
+        GameFactory(name="Chess")
+
+        url = reverse("api-game-autocomplete")
+        response = self.client.get(url, {"q": "cat"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([game["id"] for game in response.data["results"]], [catan.id, cards.id])
+        self.assertEqual(response.data["results"][0]["url"], reverse("game-detail", args=[catan.id]))
+
+        response = self.client.get(url, {"q": "cat", "limit": 1}, format="json")
+        self.assertEqual([game["name"] for game in response.data["results"]], ["Catan"])
+
     # def test_get_game_list(self):
     #     """
     #     Ensure we can get a list of game objects.
@@ -571,3 +621,136 @@ class UserTests(APITestCase):
         self.assertEqual(response.data[3]["update_on"], data4["update_on"])
         self.assertEqual(response.data[4]["update_on"], delete1["update_on"])
         self.assertEqual(response.data[5]["update_on"], delete2["update_on"])
+
+
+class MatchResultsTests(APITestCase):
+    def setUp(self):
+        self.users = [UserFactory() for _ in range(3)]
+        self.lobbies = [LobbyFactory(match_status=Lobby.Viewable, max_players=10) for _ in range(2)]
+        for lobby in self.lobbies:
+            lobby.members.add(*self.users)
+        self.endpoint = reverse("api-match-results")
+        self.client.force_authenticate(self.users[0])
+
+    def results(self, lobby, *outcomes):
+        return {
+            "lobby": lobby.pk,
+            "players": [{"user": user.pk, "outcome": outcome} for user, outcome in zip(self.users, outcomes)],
+        }
+
+    def test_record_match_results(self):
+        first, second = self.lobbies
+        data = {"matches": [self.results(first, Player.WIN, Player.LOSE), self.results(second, Player.DRAW)]}
+        response = self.client.post(self.endpoint, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"created": 3, "updated": 0, "finished": []})
+        self.assertEqual(Match.objects.get(lobby=first).reported_count, 2)
+        self.assertEqual(Match.objects.get(lobby=second).reported_count, 1)
+
+        # Reporting a player again replaces their outcome without counting them twice
+        data = {"matches": [self.results(first, Player.LOSE, Player.WIN, Player.DRAW)]}
+        response = self.client.post(self.endpoint, data, format="json")
+
+        self.assertEqual(response.data, {"created": 1, "updated": 2, "finished": [first.pk]})
+        match = Match.objects.get(lobby=first)
+        self.assertEqual(match.reported_count, 3)
+        self.assertEqual(
+            sorted(match.player_set.values_list("user_id", "outcome")),
+            sorted(zip([user.pk for user in self.users], [Player.LOSE, Player.WIN, Player.DRAW])),
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.match_status, Lobby.Finished)
+        self.assertEqual(second.match_status, Lobby.Viewable)
+
+    def test_record_match_results_checks_the_players(self):
+        outsider = UserFactory()
+        first, second = self.lobbies
+        invalid = [
+            [{"lobby": first.pk, "players": [{"user": outsider.pk, "outcome": Player.WIN}]}],
+            [self.results(first, Player.WIN), self.results(first, Player.LOSE)],
+            [{"lobby": first.pk, "players": [{"user": self.users[0].pk, "outcome": Player.WIN}] * 2}],
+            [{"lobby": first.pk, "players": [{"user": self.users[0].pk, "outcome": 9}]}],
+            [{"lobby": first.pk, "players": []}],
+        ]
+        for matches in invalid:
+            response = self.client.post(self.endpoint, {"matches": matches}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, matches)
+        self.assertFalse(Match.objects.exists())
+
+    def test_record_match_results_of_lobbies_in_progress_only(self):
+        first, second = self.lobbies
+        for match_status in (Lobby.Lobbied, Lobby.Finished):
+            Lobby.objects.filter(pk=second.pk).update(match_status=match_status)
+            data = {"matches": [self.results(first, Player.WIN), self.results(second, Player.WIN)]}
+            response = self.client.post(self.endpoint, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Match.objects.exists())
+
+    def test_record_match_results_checks_the_reporter(self):
+        data = {"matches": [self.results(self.lobbies[0], Player.WIN)]}
+        self.client.force_authenticate(None)
+        response = self.client.post(self.endpoint, data, format="json")
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+        self.client.force_authenticate(UserFactory())
+        response = self.client.post(self.endpoint, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Match.objects.exists())
+
+        # Staff may report results of lobbies they aren't in
+        self.client.force_authenticate(UserFactory(is_staff=True))
+        response = self.client.post(self.endpoint, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class MatchHistoryTests(APITestCase):
+    def test_user_matches(self):
+        user, opponent = UserFactory(), UserFactory()
+        game = GameFactory()
+        start = timezone.now() - timedelta(days=30)
+        for i in range(12):
+            lobby = LobbyFactory(game=game, match_status=Lobby.Finished, min_players=2, max_players=2)
+            match = Match.objects.create(game=game, lobby=lobby, date_played=start + timedelta(days=i))
+            Player.objects.create(match=match, user=user, outcome=Player.WIN)
+            Player.objects.create(match=match, user=opponent, outcome=Player.LOSE)
+
+        response = self.client.get(reverse("api-user-matches", kwargs={"pk": user.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results[0]["game"], {"id": game.pk, "name": game.name})
+        self.assertEqual(results[0]["outcome"], "win")
+        self.assertEqual(
+            results[0]["opponents"],
+            [{"id": opponent.pk, "username": opponent.username, "outcome": "lose", "team": None}],
+        )
+        dates = [result["date_played"] for result in results]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(
+            self.client.get(reverse("api-user-matches", kwargs={"pk": 0})).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+
+class PlayerRatingTests(APITestCase):
+    def test_game_and_user_ratings(self):
+        game, other_game = GameFactory(), GameFactory()
+        first, second = UserFactory(), UserFactory()
+        PlayerRating.objects.create(user=first, game=game, rating=1550, matches_rated=3)
+        PlayerRating.objects.create(user=second, game=game, rating=1620, matches_rated=4)
+        PlayerRating.objects.create(user=first, game=other_game, rating=1400, matches_rated=1)
+
+        response = self.client.get(reverse("api-game-ratings", kwargs={"pk": game.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([rating["user"] for rating in response.data["results"]], [second.pk, first.pk])
+        self.assertEqual(response.data["results"][0]["username"], second.username)
+        self.assertEqual(response.data["results"][0]["rating"], 1620)
+
+        response = self.client.get(reverse("api-user-ratings", kwargs={"pk": first.pk}))
+        self.assertEqual([rating["game"] for rating in response.data["results"]], [game.pk, other_game.pk])
+        self.assertEqual(response.data["results"][1]["matches_rated"], 1)
@@ -4,9 +4,11 @@ from . import views
 
 game_patterns = [
     path("", views.GameListView.as_view(), name="api-game-list"),
+    path("autocomplete/", views.GameAutocompleteView.as_view(), name="api-game-autocomplete"),
     path("<int:pk>/", views.GameDetailView.as_view(), name="api-game-detail"),
     path("<int:pk>/categories/", views.GameCategoriesAPIView.as_view(), name="api-game-categories"),
     path("<int:pk>/mechanics/", views.GameMechanicsAPIView.as_view(), name="api-game-mechanics"),
+    path("<int:pk>/ratings/", views.GameRatingsView.as_view(), name="api-game-ratings"),
 ]
 
 lobby_patterns = [
@@ -14,11 +16,17 @@ lobby_patterns = [
     path("<int:pk>/", views.LobbyDetailView.as_view(), name="api-lobby-detail"),
 ]
 
+match_patterns = [
+    path("results/", views.MatchResultsView.as_view(), name="api-match-results"),
+]
+
 user_patterns = [
     path("", views.UserListView.as_view(), name="api-user-list"),
     path("<slug:slug>/", views.UserDetailView.as_view(), name="api-user-detail"),
     path("<slug:slug>/groups/", views.UserGroupsView.as_view(), name="api-user-groups"),
     path("<int:pk>/friends/", views.UserFriendsAPIView.as_view(), name="api-user-friends"),
+    path("<int:pk>/matches/", views.UserMatchesView.as_view(), name="api-user-matches"),
+    path("<int:pk>/ratings/", views.UserRatingsView.as_view(), name="api-user-ratings"),
 ]
 
 tournament_patterns = [
@@ -35,6 +43,7 @@ group_patterns = [
 urlpatterns = [
     path("games/", include(game_patterns)),
     path("lobbies/", include(lobby_patterns)),
+    path("matches/", include(match_patterns)),
     path("users/", include(user_patterns)),
     path("tournaments/", include(tournament_patterns)),
     path("groups/", include(group_patterns)),
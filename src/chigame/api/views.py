@@ -1,23 +1,30 @@
 # from django.shortcuts import render
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from chigame.api.filters import GameFilter
+from chigame.api.pagination import GameCursorPagination, MatchHistoryCursorPagination
 from chigame.api.serializers import (
     CategorySerializer,
     GameSerializer,
     GroupSerializer,
     LobbySerializer,
+    MatchHistorySerializer,
+    MatchResultsSerializer,
     MechanicSerializer,
     MessageFeedSerializer,
     MessageSerializer,
+    PlayerRatingSerializer,
     UserSerializer,
 )
-from chigame.games.models import Game, Lobby, Message, User
+from chigame.games.autocomplete import MAX_RESULTS, autocomplete_game_names
+from chigame.games.models import Game, Lobby, Message, Player, PlayerRating, User
 from chigame.users.models import Group, UserProfile
 
 
@@ -32,15 +39,35 @@ def get_user(lookup_value):
 
 
 class GameListView(generics.ListCreateAPIView):
-    queryset = Game.objects.all()
+    queryset = Game.objects.select_related("review_summary")
     serializer_class = GameSerializer
     filter_backends = (DjangoFilterBackend,)  # Enable DjangoFilterBackend
     filterset_class = GameFilter  # Specify the filter class for this view
-    pagination_class = PageNumberPagination
+    pagination_class = GameCursorPagination  # Keyset pagination, see chigame/games/pagination.py
+
+
+class GameAutocompleteView(APIView):
+    """
+    Suggests game names for the search bar: returns at most `limit` games whose names
+    (or a word in them) start with `q`. Served from an in-memory index, see autocomplete.py.
+    """
+
+    def get(self, request, *args, **kwargs):
+        prefix = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", MAX_RESULTS))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [
+            {"id": game_id, "name": name, "url": reverse("game-detail", kwargs={"pk": game_id})}
+            for game_id, name in autocomplete_game_names(prefix, limit)
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class GameDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Game.objects.all()
+    queryset = Game.objects.select_related("review_summary")
     serializer_class = GameSerializer
 
 
@@ -64,6 +91,19 @@ class GameMechanicsAPIView(generics.ListAPIView):
         return game.mechanics.all()
 
 
+class GameRatingsView(generics.ListAPIView):
+    """
+    The leaderboard of a game: its players' Elo ratings, highest first (see chigame/games/elo.py).
+    """
+
+    serializer_class = PlayerRatingSerializer
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        game = get_object_or_404(Game, pk=self.kwargs["pk"])
+        return PlayerRating.objects.filter(game=game).select_related("user", "game").order_by("-rating", "pk")
+
+
 class UserFriendsAPIView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
 
@@ -84,6 +124,21 @@ class LobbyDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = LobbySerializer
 
 
+class MatchResultsView(APIView):
+    """
+    Records the outcomes of a batch of matches, finishing the lobbies whose every member has
+    reported. Returns how many players were created and updated, and the lobbies finished.
+    Only staff and members of every lobby in the batch may report results.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = MatchResultsSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+
+
 class UserListView(generics.ListCreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -101,6 +156,32 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
         return get_user(lookup_value)
 
 
+class UserMatchesView(generics.ListAPIView):
+    """
+    The matches a user played, newest first, with the game, the user's outcome and their
+    opponents. Cursor paginated, so deep pages cost the same as the first.
+    """
+
+    serializer_class = MatchHistorySerializer
+    pagination_class = MatchHistoryCursorPagination
+
+    def get_queryset(self):
+        return Player.match_history(get_object_or_404(User, pk=self.kwargs["pk"]))
+
+
+class UserRatingsView(generics.ListAPIView):
+    """
+    A user's Elo ratings, one per game they played, highest first.
+    """
+
+    serializer_class = PlayerRatingSerializer
+    pagination_class = PageNumberPagination
+
+    def get_queryset(self):
+        user = get_object_or_404(User, pk=self.kwargs["pk"])
+        return PlayerRating.objects.filter(user=user).select_related("user", "game").order_by("-rating", "pk")
+
+
 class MessageView(generics.CreateAPIView):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
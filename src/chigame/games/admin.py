@@ -36,6 +36,9 @@ class MatchProposalAdmin(admin.ModelAdmin):
 models = apps.get_models()
 
 for model in models:
+    # Unmanaged models (e.g. the search index) are maintained automatically and not editable
+    if not model._meta.managed:
+        continue
     try:
         admin.site.register(model)
     except admin.sites.AlreadyRegistered:
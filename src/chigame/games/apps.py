@@ -14,6 +14,9 @@ class GamesConfig(AppConfig):
         The point of the try/expect is to make sure the database is created beforehand
               This is necessary because `python3 manage.py check` is run before the migrations on the CI
         """
+        # Connects the signal handlers that keep the search index and other denormalized data up to date
+        from . import signals  # noqa: F401
+
         try:
             # Connection is used to make queries
             with connection.cursor() as cursor:
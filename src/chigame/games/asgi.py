@@ -0,0 +1,145 @@
+"""
+Serves the lobby event streams (the lobby-events URL) as Server-Sent Events, in front of Django's
+ASGI application (see config/asgi.py).
+
+A stream starts with a "lobby" event giving the lobby's current member count and match status,
+then relays the events published for the lobby (see lobby_events.py), with a comment every
+KEEPALIVE_INTERVAL seconds so proxies keep idle connections open. Streams are served here rather
+than by a Django view so they end as soon as the client disconnects. A stream touches the
+database when it starts and, if the lobby is open, once more when its time is up: it closes the
+lobby itself then (as the lobby timers would), so the "status" event reaches its viewers
+whichever process runs the timers.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from .lobby_events import RESET, get_backend, lobby_channel, publish_lobby_events
+from .models import Lobby
+
+# How often (in seconds) an idle stream sends a comment
+KEEPALIVE_INTERVAL = 15
+
+# How long (in milliseconds) browsers wait before reconnecting a dropped stream
+RECONNECT_DELAY = 3000
+
+
+def format_event(event):
+    """
+    Returns `event` (a dict with a "type") as a Server-Sent Event.
+    """
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+@sync_to_async
+def read_lobby(lobby_id):
+    # Outside of Django's request handling, stale connections must be closed by hand
+    close_old_connections()
+    try:
+        return Lobby.objects.filter(pk=lobby_id).values("member_count", "match_status", "expires_at").first()
+    finally:
+        close_old_connections()
+
+
+@sync_to_async
+def close_expired_lobby(lobby_id):
+    close_old_connections()
+    try:
+        if Lobby.expire(Lobby.objects.filter(pk=lobby_id)):
+            publish_lobby_events("status", [lobby_id])
+    finally:
+        close_old_connections()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_lobby_events(lobby_id, receive, send):
+    """
+    Serves the event stream of a lobby until the client disconnects (or falls too far behind).
+    """
+    with get_backend().subscribe(lobby_channel(lobby_id)) as subscription:
+        # Subscribed first, so nothing published after reading the lobby is missed
+        lobby = await read_lobby(lobby_id)
+        if lobby is None:
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # Stops nginx from buffering the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        expires_at = lobby.pop("expires_at")
+        if lobby["match_status"] != Lobby.Lobbied:
+            expires_at = None  # Only open lobbies expire
+        initial = format_event({"type": "lobby", "lobby": lobby_id, **lobby})
+        await send(
+            {"type": "http.response.body", "body": f"retry: {RECONNECT_DELAY}\n".encode() + initial, "more_body": True}
+        )
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                timeout = KEEPALIVE_INTERVAL
+                if expires_at is not None:
+                    timeout = min(timeout, max(0, (expires_at - timezone.now()).total_seconds()))
+                next_event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    next_event.cancel()
+                    return
+                if next_event not in done:
+                    next_event.cancel()
+                    if expires_at is not None and expires_at <= timezone.now():
+                        expires_at = None
+                        await close_expired_lobby(lobby_id)
+                    else:
+                        await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+                    continue
+                event = next_event.result()
+                await send({"type": "http.response.body", "body": format_event(event), "more_body": True})
+                if event is RESET:
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                if event.get("match_status", Lobby.Lobbied) != Lobby.Lobbied:
+                    expires_at = None
+        finally:
+            disconnected.cancel()
+
+
+class LobbyEventsRouter:
+    """
+    An ASGI application that serves the lobby event streams and passes every other request on
+    to `application`.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            try:
+                match = resolve(scope["path"])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name == "lobby-events":
+                return await stream_lobby_events(match.kwargs["pk"], receive, send)
+        return await self.application(scope, receive, send)
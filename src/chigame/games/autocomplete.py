@@ -0,0 +1,128 @@
+"""
+Autocompletion of game names for the search bar.
+
+Names are kept in memory in two sorted lists: the full names, and every word-start suffix of
+each name ("ticket to ride", "to ride", "ride"). Finding the names starting with what the user
+typed is then a binary search followed by a short scan, instead of loading and serializing the
+whole catalog into every page.
+"""
+
+import bisect
+import re
+import threading
+import time
+
+from .models import Game
+
+# Maximum number of suggestions returned per keystroke
+MAX_RESULTS = 10
+
+# Like the fuzzy index, the autocomplete index is rebuilt after a game is saved or deleted in this
+# process (see signals.py) and once it is older than this (in seconds).
+INDEX_MAX_AGE = 300
+
+
+def normalize(text):
+    """
+    Lowercases `text` and collapses punctuation and whitespace into single spaces.
+    """
+    return " ".join(re.findall(r"[^\W_]+", text.lower()))
+
+
+class PrefixIndex:
+    """
+    An immutable index answering "which names start with this prefix" over (key, name) pairs.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries (iterable of (key, str)): the keys (e.g. game ids) and the names to index
+        """
+        names = []
+        words = []
+        for key, name in entries:
+            normalized = normalize(name)
+            names.append((normalized, key, name))
+            # Every word-start suffix except the full name itself, which is already in `names`
+            starts = [match.start() for match in re.finditer(r" ", normalized)]
+            words.extend((normalized[start + 1 :], key, name) for start in starts)
+        names.sort()
+        words.sort()
+        self.names = names
+        self.words = words
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, prefix, limit=MAX_RESULTS):
+        """
+        Returns the entries whose name, or one of the words in it, starts with `prefix`. Names
+        that start with the prefix come first, in alphabetical order.
+
+        Args:
+            prefix (str): what the user has typed so far
+            limit (int): the maximum number of results
+
+        Returns:
+            list of (key, str): the matching keys and their (original) names
+        """
+        prefix = normalize(prefix)
+        if not prefix or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+        for entries in (self.names, self.words):
+            position = bisect.bisect_left(entries, (prefix,))
+            while position < len(entries) and len(results) < limit:
+                normalized, key, name = entries[position]
+                if not normalized.startswith(prefix):
+                    break
+                if key not in seen:
+                    seen.add(key)
+                    results.append((key, name))
+                position += 1
+        return results
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_autocomplete_index():
+    """
+    Returns the prefix index over the names of all games, building it if necessary.
+    """
+    global _index, _index_built_at
+
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_built_at > INDEX_MAX_AGE:
+            _index = PrefixIndex(Game.objects.values_list("pk", "name").iterator())
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def invalidate_autocomplete_index():
+    """
+    Discards the prefix index so it is rebuilt (lazily) on the next autocomplete request.
+    """
+    global _index
+
+    with _index_lock:
+        _index = None
+
+
+def autocomplete_game_names(prefix, limit=MAX_RESULTS):
+    """
+    Returns up to `limit` (at most MAX_RESULTS) games whose names start with `prefix`.
+
+    Args:
+        prefix (str): what the user has typed so far
+        limit (int): the number of suggestions wanted
+
+    Returns:
+        list of (int, str): the ids and names of the matching games
+    """
+    return get_autocomplete_index().search(prefix or "", limit=min(limit, MAX_RESULTS))
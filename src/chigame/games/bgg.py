@@ -0,0 +1,273 @@
+"""
+Client for the BoardGameGeek (BGG) XML API, used to autofill games when creating them.
+API documentation: https://boardgamegeek.com/wiki/page/BGG_XML_API2
+ChiGame's documentation: https://github.com/uchicago-cs/chigame/wiki/Games-~-BoardGameGeek-(BGG)-API
+
+A search only returns ids and names, so the details of every hit must be fetched as well.
+Instead of one request per hit, the ids are fetched in batches (the `thing` endpoint accepts
+many comma-separated ids), the batches are fetched concurrently, and all requests share a
+pooled Session so connections are reused. Callers give a time budget; whatever has not arrived
+when it runs out is left out rather than holding up the web request.
+
+Searches and game details are also kept in a persistent cache (see bgg_cache), so repeated
+lookups don't reach BGG at all, and cached ones still work while BGG is down.
+
+Responses are parsed as they arrive (see iter_items) rather than read into memory whole:
+`thing` responses with statistics can be megabytes long.
+"""
+
+import logging
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import bgg_cache
+
+logger = logging.getLogger(__name__)
+
+# The most ids BGG accepts in a single `thing` request
+THING_BATCH_SIZE = 20
+
+# The most requests sent to BGG at the same time (and connections kept open to it)
+MAX_CONCURRENT_REQUESTS = 4
+
+DEFAULT_IMAGE = "/static/images/no_picture_available.png"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Returns the requests Session shared by all BGG requests, creating it if necessary.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def bgg_get(endpoint, params, timeout):
+    """
+    Sends a GET request to a BGG API endpoint (e.g. "thing") and returns the response, without
+    reading its body: read it from `response.raw` (e.g. with iter_items), then close the
+    response.
+
+    Raises:
+        requests.RequestException: if BGG can't be reached in time or returns an error status
+    """
+    url = settings.BGG_BASE_URL.rstrip("/") + "/" + endpoint
+    response = get_session().get(url, params=params, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
+    # Let the raw stream undo any gzip or deflate encoding
+    response.raw.decode_content = True
+    return response
+
+
+def iter_items(stream):
+    """
+    Parses a BGG response from a binary file object as it is read, yielding its top-level
+    <item> elements one at a time. Each element is complete when yielded, and is freed as soon
+    as the caller asks for the next one, so memory use doesn't grow with the number of items.
+    """
+    events = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(events)
+    depth = 0
+    for event, element in events:
+        if element.tag != "item":
+            continue
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            yield element
+            element.clear()
+            # Drop the parsed items (cleared but still attached) from the root
+            root.clear()
+
+
+def _get_value(element, tag, attribute="value", default=None):
+    # Safely gets the value of the first `tag` under `element`
+    child = element.find(f".//{tag}")
+    if child is not None:
+        return child.get(attribute) if attribute else child.text
+    return default
+
+
+def parse_game(item):
+    """
+    Returns the fields of a game from an <item> element of a BGG `thing` response.
+    """
+    # The complexity rounded to two decimal places, or None if it is missing
+    complexity_value = _get_value(item, "averageweight")
+    rounded_complexity = round(float(complexity_value), 2) if complexity_value else None
+
+    return {
+        "BGG_id": item.get("id"),
+        "name": _get_value(item, "name"),
+        "image": _get_value(item, "image", attribute=None, default=DEFAULT_IMAGE),
+        "description": _get_value(item, "description", attribute=None),
+        "year_published": int(_get_value(item, "yearpublished", default=0)) or None,
+        "min_players": _get_value(item, "minplayers"),
+        "max_players": _get_value(item, "maxplayers"),
+        "expected_playtime": _get_value(item, "playingtime"),
+        "min_playtime": _get_value(item, "minplaytime"),
+        "max_playtime": _get_value(item, "maxplaytime"),
+        "suggested_age": _get_value(item, "minage"),
+        "complexity": rounded_complexity,
+        # By name; see bgg_links for resolving them to Category and Mechanic rows
+        "categories": [link.get("value") for link in item.iter("link") if link.get("type") == "boardgamecategory"],
+        "mechanics": [link.get("value") for link in item.iter("link") if link.get("type") == "boardgamemechanic"],
+        # No rules field in BGG API
+    }
+
+
+def _search_key(query, exact):
+    return f"search:{int(exact)}:{query.strip().casefold()}"
+
+
+def _search(query, exact, timeout):
+    params = {"type": "boardgame", "query": query}
+    if exact:
+        params["exact"] = 1
+    with bgg_get("search", params, timeout) as response:
+        hits = [
+            {
+                "BGG_id": item.get("id"),
+                "name": _get_value(item, "name"),
+                "year_published": int(_get_value(item, "yearpublished", default=0)) or None,
+            }
+            for item in iter_items(response.raw)
+        ]
+    cache = bgg_cache.get_cache()
+    if cache is not None:
+        cache.set(_search_key(query, exact), hits, settings.BGG_CACHE_TTL)
+    return hits
+
+
+def search_games(query, exact=True, timeout=None):
+    """
+    Searches BGG for board games by name, or returns the cached hits of the same search.
+
+    Returns:
+        list of dict: the "BGG_id", "name" and "year_published" of each hit
+
+    Raises:
+        requests.RequestException: if BGG fails and the search isn't cached
+    """
+    cache = bgg_cache.get_cache()
+    cached = cache.get(_search_key(query, exact)) if cache is not None else None
+    if cached is not None:
+        hits, state = cached
+        if state == bgg_cache.FRESH:
+            return hits
+        if state == bgg_cache.STALE:
+            bgg_cache.refresh_in_background([_search_key(query, exact)], lambda keys: _search(query, exact, timeout))
+            return hits
+
+    try:
+        return _search(query, exact, timeout)
+    except requests.RequestException as error:
+        if cached is None:
+            raise
+        logger.warning("BGG search failed, using the cached hits: %s", error)
+        return cached[0]
+
+
+def _fetch_batch(bgg_ids, deadline):
+    timeout = max(deadline - time.monotonic(), 0.01)
+    with bgg_get("thing", {"id": ",".join(bgg_ids), "stats": 1}, timeout) as response:
+        games = [parse_game(item) for item in iter_items(response.raw)]
+    cache = bgg_cache.get_cache()
+    if cache is not None:
+        for game in games:
+            cache.set(_thing_key(game["BGG_id"]), game, settings.BGG_CACHE_TTL)
+    return games
+
+
+def _thing_key(bgg_id):
+    return f"thing:{bgg_id}"
+
+
+def _fetch_details(bgg_ids, budget):
+    if not bgg_ids:
+        return {}
+    deadline = time.monotonic() + (settings.BGG_REQUEST_BUDGET if budget is None else budget)
+    batches = [bgg_ids[i : i + THING_BATCH_SIZE] for i in range(0, len(bgg_ids), THING_BATCH_SIZE)]
+
+    executor = ThreadPoolExecutor(max_workers=min(len(batches), MAX_CONCURRENT_REQUESTS))
+    futures = [executor.submit(_fetch_batch, batch, deadline) for batch in batches]
+    done, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    # Don't wait for late batches; their requests time out at the deadline on their own
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    details = {}
+    for future in done:
+        if future.exception() is not None:
+            logger.warning("BGG lookup failed: %s", future.exception())
+            continue
+        for game in future.result():
+            details[game["BGG_id"]] = game
+    if not_done:
+        logger.warning("BGG lookup ran out of time with %d of %d batches missing", len(not_done), len(batches))
+    return details
+
+
+def _refresh_details(keys):
+    _fetch_details([key.removeprefix("thing:") for key in keys], budget=None)
+
+
+def get_game_details(bgg_ids, budget=None):
+    """
+    Retrieves the details of games, from the cache or else from BGG in batches of
+    THING_BATCH_SIZE ids, fetched concurrently.
+
+    Args:
+        bgg_ids (list of str): the BGG ids of the games
+        budget (float): how long to wait for BGG in total, in seconds (BGG_REQUEST_BUDGET by
+            default). Batches that fail or don't arrive in time are left out, unless an expired
+            copy of them is cached.
+
+    Returns:
+        dict: the details of each game (see parse_game), by BGG id
+    """
+    bgg_ids = [str(bgg_id) for bgg_id in dict.fromkeys(bgg_ids)]
+    cache = bgg_cache.get_cache()
+    if cache is None:
+        return _fetch_details(bgg_ids, budget)
+
+    details, expired, stale, missing = {}, {}, [], []
+    for bgg_id in bgg_ids:
+        cached = cache.get(_thing_key(bgg_id))
+        if cached is None:
+            missing.append(bgg_id)
+        elif cached[1] == bgg_cache.EXPIRED:
+            expired[bgg_id] = cached[0]
+            missing.append(bgg_id)
+        else:
+            details[bgg_id] = cached[0]
+            if cached[1] == bgg_cache.STALE:
+                stale.append(_thing_key(bgg_id))
+
+    if stale:
+        bgg_cache.refresh_in_background(stale, _refresh_details)
+    fetched = _fetch_details(missing, budget)
+    # Expired copies are better than nothing when BGG fails
+    details.update({bgg_id: game for bgg_id, game in expired.items() if bgg_id not in fetched})
+    details.update(fetched)
+    return {bgg_id: details[bgg_id] for bgg_id in bgg_ids if bgg_id in details}
@@ -0,0 +1,206 @@
+"""
+A persistent cache of BoardGameGeek responses, so repeated lookups (e.g. autofilling the same
+game twice) don't go back to BGG, and lookups keep working while BGG is down.
+
+Entries are stored in a small SQLite database on disk, shared by all processes, as the parsed
+JSON of a response keyed by what was asked (e.g. "thing:13" for the details of game 13). Each
+entry is:
+
+- fresh for its TTL: served straight from disk;
+- stale for STALE_WINDOW after that: still served, while a background thread fetches a new copy
+  (stale-while-revalidate);
+- too old after that: fetched again before being served, but still served if BGG fails.
+
+The database is kept under a maximum size by evicting the least recently used entries. Its
+total size is kept in a one-row table by triggers, so a write doesn't sum every entry.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# How long entries stay stale (served while being refreshed in the background) after their TTL
+STALE_WINDOW = 30 * 24 * 3600
+
+# Reading an entry only records the access (for LRU eviction) if the last one is older than this,
+# so most reads don't write to the database
+ACCESS_RESOLUTION = 60
+
+# Entries evicted at a time when the cache is over its size
+EVICTION_BATCH_SIZE = 100
+
+FRESH, STALE, EXPIRED = "fresh", "stale", "expired"
+
+
+class ResponseCache:
+    """
+    A size-bounded LRU cache of JSON values in a SQLite file. Safe to use from several threads.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        # With WAL, commits don't wait for the disk; a crash can lose the last writes, which is fine for a cache
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._create_total()
+
+    def _create_total(self):
+        """
+        Creates the one-row table holding the total size of the entries, kept up to date by
+        triggers in the same statements that change the entries, so checking the size of the cache
+        doesn't sum every entry on each write.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 1), size INTEGER NOT NULL)"
+                )
+                # Counted once, for a cache created before the total was kept
+                self._db.execute(
+                    "INSERT OR IGNORE INTO total (id, size) SELECT 1, COALESCE(SUM(size), 0) FROM entries"
+                )
+                self._db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                    "BEGIN UPDATE total SET size = size + NEW.size; END"
+                )
+                self._db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries "
+                    "BEGIN UPDATE total SET size = size + NEW.size - OLD.size; END"
+                )
+                self._db.execute(
+                    "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                    "BEGIN UPDATE total SET size = size - OLD.size; END"
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get(self, key):
+        """
+        Returns (value, state) for the entry at `key`, where state is FRESH, STALE or EXPIRED, or
+        None if there is no such entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            if now - accessed_at > ACCESS_RESOLUTION:
+                self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+
+        if now < expires_at:
+            state = FRESH
+        elif now < expires_at + STALE_WINDOW:
+            state = STALE
+        else:
+            state = EXPIRED
+        return json.loads(value), state
+
+    def set(self, key, value, ttl):
+        """
+        Stores `value` (anything JSON serializable) at `key` for `ttl` seconds, then evicts the
+        least recently used entries if the cache is over its maximum size.
+        """
+        now = time.time()
+        encoded = json.dumps(value)
+        with self._lock:
+            # An upsert rather than INSERT OR REPLACE, whose deletes wouldn't fire the delete trigger
+            self._db.execute(
+                "INSERT INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, encoded, len(encoded) + len(key), now + ttl, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._db.execute("SELECT size FROM total").fetchone()
+        while total > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at LIMIT ?", (EVICTION_BATCH_SIZE,)
+            ).fetchall()
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# Refreshes stale entries in the background, one at a time
+_refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bgg-cache-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the BGG response cache at settings.BGG_CACHE_PATH, or None if caching is disabled.
+    """
+    global _cache
+
+    path = settings.BGG_CACHE_PATH
+    with _cache_lock:
+        if _cache is not None and (path is None or _cache.path != Path(path)):
+            _cache.close()
+            _cache = None
+        if _cache is None and path is not None:
+            _cache = ResponseCache(path, settings.BGG_CACHE_MAX_BYTES)
+        return _cache
+
+
+def refresh_in_background(keys, fetch):
+    """
+    Calls `fetch(keys)` in a background thread to refresh stale entries, unless those keys are
+    already being refreshed. `fetch` is expected to store the new values in the cache.
+    """
+    with _refreshing_lock:
+        keys = [key for key in keys if key not in _refreshing]
+        _refreshing.update(keys)
+    if not keys:
+        return
+
+    def refresh():
+        try:
+            fetch(keys)
+        except Exception as error:
+            # The stale entries keep being served
+            logger.warning("Refreshing %d cached BGG responses failed: %s", len(keys), error)
+        finally:
+            with _refreshing_lock:
+                _refreshing.difference_update(keys)
+
+    _refresher.submit(refresh)
@@ -0,0 +1,148 @@
+"""
+Links games to the categories and mechanics BGG lists for them, which BGG gives by name (the
+<link type="boardgamecategory"> and <link type="boardgamemechanic"> elements of a `thing`).
+
+Names are resolved with an in-memory map from (case-insensitive) name to primary key for each
+model, loaded with one query and then kept, so resolving the names of a batch of games takes no
+queries. Names that aren't in the map are created with one bulk_create per batch, using the
+descriptions and images of mechanics_categories_fixtures.json where it has them. Links are then
+added with one bulk insert per through table.
+"""
+
+import functools
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.db import transaction
+
+from .models import Category, Game, Mechanic
+
+FIXTURE = Path(__file__).resolve().parent / "fixtures" / "mechanics_categories_fixtures.json"
+
+# Other processes may rename or delete categories and mechanics, so maps are reloaded this often
+MAP_MAX_AGE = 10 * 60  # seconds
+
+# The many-to-many field of Game for each model
+LINK_FIELDS = {Category: "categories", Mechanic: "mechanics"}
+
+
+def _key(name):
+    return " ".join(name.split()).casefold()
+
+
+@functools.lru_cache
+def _fixture_defaults(label):
+    """
+    Returns the description and image of each category or mechanic in the fixture, by name.
+    """
+    return {
+        _key(entry["fields"]["name"]): {field: entry["fields"][field] for field in ("description", "image")}
+        for entry in json.loads(FIXTURE.read_text())
+        if entry["model"] == label
+    }
+
+
+class NameMap:
+    """
+    The primary keys of the rows of `model` (Category or Mechanic), by name.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.pks = {_key(name): pk for pk, name in model.objects.values_list("pk", "name").iterator()}
+        self.loaded_at = time.monotonic()
+
+    def get(self, name):
+        """
+        Returns the primary key of the row named `name`, or None if there is none.
+        """
+        return self.pks.get(_key(name))
+
+    def resolve(self, names):
+        """
+        Returns the primary keys of the rows named `names`, by name, first creating the missing
+        rows with one bulk_create.
+        """
+        pks = {name: self.pks.get(_key(name)) for name in names if name.strip()}
+        missing = {_key(name): name.strip() for name, pk in pks.items() if pk is None}
+        if not missing:
+            return pks
+
+        defaults = _fixture_defaults(self.model._meta.label_lower)
+        self.model.objects.bulk_create(
+            [self.model(name=name, **defaults.get(key, {})) for key, name in missing.items()], ignore_conflicts=True
+        )
+        # bulk_create doesn't return the keys of rows it skipped as duplicates, so they are read back
+        rows = self.model.objects.filter(name__in=missing.values()).values_list("pk", "name")
+        created = {_key(name): pk for pk, name in rows}
+        # The new rows only exist once the transaction they were created in commits
+        transaction.on_commit(lambda: self.pks.update(created))
+        return {name: pk if pk is not None else created.get(_key(name)) for name, pk in pks.items()}
+
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def get_name_map(model):
+    """
+    Returns the name map of `model` (Category or Mechanic), loading it if necessary.
+    """
+    with _maps_lock:
+        name_map = _maps.get(model)
+        if name_map is None or time.monotonic() - name_map.loaded_at > MAP_MAX_AGE:
+            name_map = _maps[model] = NameMap(model)
+        return name_map
+
+
+def invalidate_name_maps():
+    """
+    Discards the name maps so they are reloaded (lazily) on their next use.
+    """
+    with _maps_lock:
+        _maps.clear()
+
+
+def lookup_links(details):
+    """
+    Returns the primary keys of the existing categories and mechanics named in the details of a
+    game (from bgg.parse_game), as {"categories": [...], "mechanics": [...]}. Nothing is created.
+    """
+    return {
+        field: [pk for pk in map(get_name_map(model).get, details.get(field) or []) if pk is not None]
+        for model, field in LINK_FIELDS.items()
+    }
+
+
+def link_games(games):
+    """
+    Links games to the categories and mechanics named in their details, creating the missing
+    ones. Existing links are kept.
+
+    Args:
+        games (list of (Game, dict)): the games, with their details from bgg.parse_game
+
+    Returns:
+        set of int: the primary keys of the games that got new links
+    """
+    linked = set()
+    for model, field in LINK_FIELDS.items():
+        pks = get_name_map(model).resolve({name for _, details in games for name in details.get(field) or []})
+        through = getattr(Game, field).through
+        target_column = getattr(Game, field).field.m2m_reverse_field_name() + "_id"
+        existing = set(
+            through.objects.filter(game_id__in=[game.pk for game, _ in games]).values_list("game_id", target_column)
+        )
+        links = {
+            (game.pk, pks[name])
+            for game, details in games
+            for name in details.get(field) or []
+            if pks.get(name) is not None and (game.pk, pks[name]) not in existing
+        }
+        through.objects.bulk_create(
+            [through(game_id=game_id, **{target_column: pk}) for game_id, pk in links], ignore_conflicts=True
+        )
+        linked.update(game_id for game_id, _ in links)
+    return linked
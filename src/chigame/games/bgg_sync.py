@@ -0,0 +1,244 @@
+"""
+Keeps the games imported from BoardGameGeek (those with a BGG_id) in sync with BGG, in bulk.
+
+Meant to be run from the sync_bgg_games management command (e.g. nightly), never from a web
+request: a full sync of a large catalog takes hours at a rate BGG tolerates. It:
+
+1. walks the games in primary key order, in batches of ids fetched with one `thing` request;
+2. sends requests no faster than a token bucket allows (BGG_SYNC_RATE requests per second);
+3. retries requests BGG answers with "202 Accepted" (the request is queued, ask again later),
+   429 or 503 after an exponentially growing wait;
+4. writes the fields that changed with one bulk_update per batch, and adds the categories and
+   mechanics BGG lists for the games (see bgg_links);
+5. records the last game synced in a checkpoint file after every batch, so an interrupted sync
+   resumes where it stopped instead of starting over.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import bgg
+from .autocomplete import invalidate_autocomplete_index
+from .bgg_links import link_games
+from .facets import invalidate_facet_index
+from .fuzzy import invalidate_game_name_index
+from .models import Game, make_sort_name, player_count_mask
+from .search import index_games, search_index_enabled
+
+logger = logging.getLogger(__name__)
+
+# The fields of Game kept in sync with BGG
+SYNC_FIELDS = [
+    "name",
+    "description",
+    "image",
+    "year_published",
+    "min_players",
+    "max_players",
+    "expected_playtime",
+    "min_playtime",
+    "max_playtime",
+    "suggested_age",
+    "complexity",
+]
+
+# Statuses BGG answers with when a request should be sent again later
+RETRY_STATUSES = {202, 429, 503}
+MAX_RETRIES = 6
+# The wait before the first retry, in seconds; it doubles with every retry
+INITIAL_BACKOFF = 2.0
+
+# How long to wait for a single response, in seconds
+REQUEST_TIMEOUT = 30
+
+
+class TokenBucket:
+    """
+    Allows `rate` operations per second on average, and bursts of up to `capacity` operations.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+
+    def take(self):
+        """
+        Takes a token, first waiting until one is available.
+        """
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            self.tokens, self.updated = 1, now + wait
+        self.tokens -= 1
+
+
+def fetch_things(bgg_ids, bucket, retries=MAX_RETRIES, backoff=INITIAL_BACKOFF, sleep=time.sleep):
+    """
+    Fetches the details of games from BGG's `thing` endpoint, within the rate of `bucket`,
+    retrying while BGG asks to come back later.
+
+    Returns:
+        list of dict: the details of the games BGG knows about (see bgg.parse_game)
+
+    Raises:
+        requests.RequestException: if BGG fails, or still asks to come back later after `retries`
+            retries
+    """
+    params = {"id": ",".join(str(bgg_id) for bgg_id in bgg_ids), "stats": 1}
+    for attempt in range(retries + 1):
+        bucket.take()
+        try:
+            response = bgg.bgg_get("thing", params, REQUEST_TIMEOUT)
+        except requests.HTTPError as error:
+            status = error.response.status_code if error.response is not None else None
+            if status not in RETRY_STATUSES:
+                raise
+        else:
+            with response:
+                if response.status_code not in RETRY_STATUSES:
+                    return [bgg.parse_game(item) for item in bgg.iter_items(response.raw)]
+                status = response.status_code
+        if attempt < retries:
+            logger.info("BGG answered %s, retrying in %.1fs", status, backoff * 2**attempt)
+            sleep(backoff * 2**attempt)
+    raise requests.exceptions.RetryError(f"BGG still answers {status} after {retries} retries")
+
+
+def apply_details(game, details):
+    """
+    Sets the fields of `game` to the values in `details` (from bgg.parse_game), leaving alone
+    the fields BGG has no value for.
+
+    Returns:
+        list of str: the fields that changed
+    """
+    changed = []
+    for field in SYNC_FIELDS:
+        value = details.get(field)
+        # BGG reports a complexity of 0 for games nobody has rated yet
+        if value is None or (field == "image" and value == bgg.DEFAULT_IMAGE) or (field == "complexity" and not value):
+            continue
+        value = Game._meta.get_field(field).to_python(value)
+        if getattr(game, field) != value:
+            setattr(game, field, value)
+            changed.append(field)
+    return changed
+
+
+class CatalogSync:
+    """
+    Syncs the games with a BGG_id with BGG (see the module docstring). Call run(), then finish()
+    once it returns or fails.
+    """
+
+    def __init__(self, checkpoint_path, batch_size=bgg.THING_BATCH_SIZE, rate=None, backoff=None):
+        self.checkpoint_path = Path(checkpoint_path)
+        self.batch_size = batch_size
+        self.bucket = TokenBucket(settings.BGG_SYNC_RATE if rate is None else rate)
+        self.backoff = INITIAL_BACKOFF if backoff is None else backoff
+        self.synced = 0
+        self.updated = 0
+        # Games that got new categories or mechanics
+        self.linked = 0
+        # BGG ids of games BGG doesn't know about
+        self.missing = []
+        # The games whose new values are invalid, as (primary key, reason)
+        self.invalid = []
+
+    def read_checkpoint(self):
+        """
+        Returns the primary key of the last game synced by an interrupted sync, or 0.
+        """
+        try:
+            return json.loads(self.checkpoint_path.read_text())["last_pk"]
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, last_pk):
+        # Written to a temporary file first, so a crash never leaves a half-written checkpoint
+        temporary = self.checkpoint_path.with_suffix(".tmp")
+        temporary.write_text(json.dumps({"last_pk": last_pk}))
+        os.replace(temporary, self.checkpoint_path)
+
+    def run(self, restart=False, progress=None):
+        """
+        Syncs every game after the checkpoint (or every game if `restart`), calling
+        `progress(sync)` after every batch. The checkpoint is removed once all games are synced.
+        """
+        last_pk = 0 if restart else self.read_checkpoint()
+        games = Game.objects.filter(BGG_id__isnull=False).order_by("pk")
+        while batch := list(games.filter(pk__gt=last_pk)[: self.batch_size]):
+            self._sync_batch(batch)
+            last_pk = batch[-1].pk
+            self._write_checkpoint(last_pk)
+            if progress is not None:
+                progress(self)
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def _sync_batch(self, games):
+        by_bgg_id = defaultdict(list)
+        for game in games:
+            by_bgg_id[str(game.BGG_id)].append(game)
+        found = {
+            details["BGG_id"]: details for details in fetch_things(list(by_bgg_id), self.bucket, backoff=self.backoff)
+        }
+
+        found_games, changed_games, changed_fields = [], [], set()
+        for bgg_id, same_id_games in by_bgg_id.items():
+            if bgg_id not in found:
+                self.missing.append(bgg_id)
+                continue
+            for game in same_id_games:
+                found_games.append((game, found[bgg_id]))
+                changed = apply_details(game, found[bgg_id])
+                if not changed:
+                    continue
+                try:
+                    # Only BGG_id is unique, and the sync never changes it
+                    game.full_clean(validate_unique=False)
+                except ValidationError as error:
+                    self.invalid.append((game.pk, "; ".join(error.messages)))
+                    continue
+                # What Game.save would have set
+                game.sort_name = make_sort_name(game.name)
+                game.player_counts = player_count_mask(game.min_players, game.max_players)
+                changed_games.append(game)
+                changed_fields.update(changed)
+
+        with transaction.atomic():
+            if changed_games:
+                Game.objects.bulk_update(changed_games, [*changed_fields, "sort_name", "player_counts"])
+            linked = link_games(found_games)
+            reindexed = set(linked)
+            if changed_fields & {"name", "description"}:
+                reindexed.update(game.pk for game in changed_games)
+            if search_index_enabled() and reindexed:
+                index_games(reindexed)
+        self.synced += len(games)
+        self.updated += len(changed_games)
+        self.linked += len(linked)
+
+    def finish(self):
+        """
+        Refreshes the in-memory indexes over the catalog, which bulk updates don't notify.
+        """
+        if self.updated or self.linked:
+            invalidate_game_name_index()
+            invalidate_autocomplete_index()
+            invalidate_facet_index()
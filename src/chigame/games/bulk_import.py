@@ -0,0 +1,281 @@
+"""
+Bulk import of games from JSON or CSV files, e.g. the fixtures in chigame/games/fixtures or a
+BoardGameGeek dump.
+
+Saving games one by one runs full_clean() and an INSERT per game, then an INSERT per category
+and mechanic. Here the file is read incrementally, and every batch of rows is:
+
+1. validated at once, with the rules of Game.clean (and the field validators) written as
+   vectorized NumPy comparisons over the batch;
+2. written with one bulk_create, plus one bulk_create per many-to-many through table. Games with
+   a BGG_id are upserted instead (see Game.upsert), so importing a game that is already in the
+   catalog updates it rather than duplicating it;
+3. added to the full-text search index.
+
+Rows that fail validation are skipped and reported, and the rest of the file is imported.
+
+Accepted formats:
+- JSON: a list of Django fixture entries ({"model": "games.game", "pk": 1, "fields": {...}}),
+  or of plain objects with the fields of Game. Entries of other models are skipped.
+- JSON Lines (.jsonl): one such object per line.
+- CSV: one column per field of Game, with categories and mechanics as ";"-separated ids.
+"""
+
+import csv
+import itertools
+import json
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+
+from .autocomplete import invalidate_autocomplete_index
+from .facets import invalidate_facet_index
+from .fuzzy import invalidate_game_name_index
+from .models import Category, Game, Mechanic, make_sort_name, player_count_mask
+from .search import index_games, search_index_enabled
+
+DEFAULT_BATCH_SIZE = 1000
+
+# How much of a JSON file is read at a time
+READ_CHUNK_SIZE = 1 << 16
+
+TEXT_FIELDS = ["name", "description", "image", "rules"]
+INTEGER_FIELDS = [
+    "year_published",
+    "min_players",
+    "max_players",
+    "suggested_age",
+    "expected_playtime",
+    "min_playtime",
+    "max_playtime",
+    "BGG_id",
+]
+REQUIRED_FIELDS = ["name", "description", "min_players", "max_players"]
+RELATED_FIELDS = {"categories": Category, "mechanics": Mechanic}
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields the elements of the JSON array in `file` one at a time, without reading the whole
+    file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    opened = False
+
+    while True:
+        # Skip the opening bracket, and the whitespace and commas between elements
+        while position < len(buffer) and (buffer[position] in " \t\r\n," or (buffer[position] == "[" and not opened)):
+            opened = opened or buffer[position] == "["
+            position += 1
+        if position == len(buffer):
+            buffer, position = file.read(chunk_size), 0
+            if not buffer:
+                return
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The element continues in the next chunk
+            more = file.read(chunk_size)
+            if not more:
+                raise
+            buffer, position = buffer[position:] + more, 0
+            continue
+        yield element
+        position = end
+
+
+def read_rows(file, file_format):
+    """
+    Yields the games in an open file as dicts of field values (see the module docstring for the
+    formats). The id of a fixture entry is kept as "id".
+
+    Args:
+        file: a text file object
+        file_format (str): "json", "jsonl" or "csv"
+    """
+    if file_format == "csv":
+        for row in csv.DictReader(file):
+            for field in RELATED_FIELDS:
+                row[field] = [value for value in (row.get(field) or "").split(";") if value.strip()]
+            yield row
+        return
+
+    entries = (json.loads(line) for line in file if line.strip()) if file_format == "jsonl" else iter_json_array(file)
+    for entry in entries:
+        if "fields" in entry:
+            if entry.get("model") != "games.game":
+                continue
+            yield {**entry["fields"], "id": entry.get("pk")}
+        else:
+            yield entry
+
+
+def _to_integer(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(Decimal(str(value)))
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a number")
+
+
+def _to_complexity(value):
+    if value is None or value == "":
+        return None
+    try:
+        complexity = Decimal(str(value)).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a number")
+    # BoardGameGeek reports a complexity of 0 for games nobody has rated yet
+    return complexity or None
+
+
+def _coerce(row):
+    """
+    Returns the field values of a row converted to the types of the Game fields.
+    """
+    values = {field: str(row.get(field) or "") for field in TEXT_FIELDS}
+    if not values["image"]:
+        del values["image"]  # use the model's default
+    for field in INTEGER_FIELDS:
+        values[field] = _to_integer(row.get(field))
+    values["complexity"] = _to_complexity(row.get("complexity"))
+    values["id"] = _to_integer(row.get("id"))
+    for field in RELATED_FIELDS:
+        values[field] = [_to_integer(pk) for pk in row.get(field) or []]
+    return values
+
+
+def _column(rows, field):
+    # Missing values are NaN, so every comparison involving them is False
+    return np.array([np.nan if row[field] is None else float(row[field]) for row in rows], dtype=float)
+
+
+def validate_rows(rows):
+    """
+    Checks a batch of coerced rows against the rules of Game.clean and the field validators of
+    Game, all rows at once.
+
+    Returns:
+        list of str or None: for each row, the reason it is invalid, or None if it is valid
+    """
+    columns = {field: _column(rows, field) for field in INTEGER_FIELDS + ["complexity"]}
+    min_players, max_players = columns["min_players"], columns["max_players"]
+    min_playtime, max_playtime = columns["min_playtime"], columns["max_playtime"]
+    expected_playtime, complexity = columns["expected_playtime"], columns["complexity"]
+
+    checks = [
+        (
+            np.array([not row[field] for row in rows]) if field in TEXT_FIELDS else np.isnan(columns[field]),
+            f"{field} is required",
+        )
+        for field in REQUIRED_FIELDS
+    ]
+    checks += [
+        (columns[field] < 0, f"{field} cannot be negative") for field in INTEGER_FIELDS if field != "year_published"
+    ]
+    checks += [
+        (min_players > max_players, "min_players cannot be greater than max_players"),
+        (min_playtime > max_playtime, "min_playtime cannot be greater than max_playtime"),
+        (expected_playtime < min_playtime, "expected_playtime cannot be less than min_playtime"),
+        (expected_playtime > max_playtime, "expected_playtime cannot be greater than max_playtime"),
+        ((complexity < 1) | (complexity > 5), "complexity must be between 1 and 5"),
+    ]
+
+    reasons = [None] * len(rows)
+    invalid = np.zeros(len(rows), dtype=bool)
+    for failed, message in checks:
+        # Report the first failed check of each row
+        for index in np.flatnonzero(failed & ~invalid):
+            reasons[index] = message
+        invalid |= failed
+    return reasons
+
+
+class GameImporter:
+    """
+    Imports games in batches (see the module docstring). Call import_rows() with the rows read
+    by read_rows(), then finish() once everything is imported.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.imported = 0
+        # The rows skipped, as (row number, reason); row numbers start at 1
+        self.errors = []
+        self.unknown_links = 0
+        self._row_number = 0
+        self._known_pks = {
+            field: set(model.objects.values_list("pk", flat=True)) for field, model in RELATED_FIELDS.items()
+        }
+
+    def import_rows(self, rows):
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            self._import_batch(batch)
+
+    def _import_batch(self, batch):
+        coerced = []
+        for row in batch:
+            self._row_number += 1
+            try:
+                coerced.append((self._row_number, _coerce(row)))
+            except ValueError as error:
+                self.errors.append((self._row_number, str(error)))
+
+        reasons = validate_rows([values for _, values in coerced])
+        valid = []
+        for (row_number, values), reason in zip(coerced, reasons):
+            if reason is None:
+                valid.append(values)
+            else:
+                self.errors.append((row_number, reason))
+        if not valid:
+            return
+
+        games = []
+        for values in valid:
+            fields = {key: value for key, value in values.items() if key not in RELATED_FIELDS and value is not None}
+            game = Game(**fields)
+            # What Game.save would have set
+            game.sort_name = make_sort_name(game.name)
+            game.player_counts = player_count_mask(game.min_players, game.max_players)
+            games.append(game)
+        Game.objects.bulk_create([game for game in games if game.BGG_id is None], batch_size=self.batch_size)
+        Game.upsert([game for game in games if game.BGG_id is not None], batch_size=self.batch_size)
+
+        for field in RELATED_FIELDS:
+            self._link(games, valid, field)
+        if search_index_enabled():
+            index_games([game.pk for game in games])
+        self.imported += len(games)
+
+    def _link(self, games, rows, field):
+        """
+        Inserts the through-table rows linking the games to their categories or mechanics.
+        """
+        through = getattr(Game, field).through
+        target_column = getattr(Game, field).field.m2m_reverse_field_name() + "_id"
+        known = self._known_pks[field]
+        links = []
+        for game, values in zip(games, rows):
+            for pk in dict.fromkeys(values[field]):
+                if pk in known:
+                    links.append(through(game_id=game.pk, **{target_column: pk}))
+                else:
+                    self.unknown_links += 1
+        through.objects.bulk_create(links, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def finish(self):
+        """
+        Refreshes the in-memory indexes over the catalog, which bulk inserts don't notify.
+        """
+        invalidate_game_name_index()
+        invalidate_autocomplete_index()
+        invalidate_facet_index()
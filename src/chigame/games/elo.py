@@ -0,0 +1,206 @@
+"""
+Elo ratings of players at each game, from the outcomes of their matches.
+
+After a match, each player's rating moves towards their result against every other player of
+the match (pairwise Elo, which for two players is plain Elo):
+
+    expected = 1 / (1 + 10 ** ((opponent's rating - rating) / 400))
+    rating += K_FACTOR / (number of opponents) * sum of (score - expected) over the opponents
+
+where the score against an opponent is 1 for a better outcome, 0.5 for the same outcome and 0
+for a worse one (a withdrawal counts as a loss). Ratings are kept per (user, game) in
+PlayerRating.
+
+Ratings are updated by rate_matches() as matches finish (see results.py), replayed for a whole
+game by rerate_games() when a result of a finished match is corrected, and can be recomputed
+from the whole match history with recompute_player_ratings() (the recompute_player_ratings
+command), e.g. after changing K_FACTOR. Both replay matches with replay_elo(), which updates
+the ratings with NumPy a "wave" of matches at a time: matches that share no player don't depend
+on each other, so a wave of them is a single set of array operations. A history takes about as
+many waves as the most matches any one player played, however many matches it holds.
+"""
+
+import numpy as np
+from django.db import transaction
+
+from .models import Lobby, Player, PlayerRating
+
+# The largest change of a rating in a single match
+K_FACTOR = 32.0
+
+# Rows per bulk query
+BATCH_SIZE = 1000
+
+# The rank of each outcome; a lower rank beats a higher one
+OUTCOME_RANKS = {Player.WIN: 0, Player.DRAW: 1, Player.LOSE: 2, Player.WITHDRAWAL: 2}
+
+
+def match_waves(match_index, key_index):
+    """
+    Returns the wave of each match: one more than the last wave of any of its players, so the
+    matches of a wave share no player and come after every earlier match of their players.
+
+    Args:
+        match_index, key_index (ndarray): the match and the player of each result, grouped by
+            match in the order the matches were played (matches numbered from 0)
+    """
+    waves = np.zeros(match_index[-1] + 1 if len(match_index) else 0, dtype=np.int64)
+    last_wave = {}
+    start = 0
+    matches, keys = match_index.tolist(), key_index.tolist()
+    for end in range(1, len(matches) + 1):
+        if end < len(matches) and matches[end] == matches[start]:
+            continue
+        players = keys[start:end]
+        wave = max(last_wave.get(key, -1) for key in players) + 1
+        waves[matches[start]] = wave
+        for key in players:
+            last_wave[key] = wave
+        start = end
+    return waves
+
+
+def replay_elo(match_index, key_index, ranks, ratings, k_factor=K_FACTOR):
+    """
+    Updates `ratings` with the results of matches, in the order they were played.
+
+    Args:
+        match_index (ndarray): the match of each result, grouped and numbered from 0 in the
+            order the matches were played
+        key_index (ndarray): the index in `ratings` of the player of each result
+        ranks (ndarray): the rank of each result's outcome (see OUTCOME_RANKS)
+        ratings (ndarray): the ratings before these matches, updated in place
+        k_factor (float): the largest change of a rating in a single match
+
+    Returns:
+        ndarray: `ratings`
+    """
+    if not len(match_index):
+        return ratings
+    sizes = np.bincount(match_index)
+    starts = np.cumsum(sizes) - sizes
+
+    # Every ordered pair of different players of a match
+    rows = np.arange(len(match_index))
+    row_sizes = sizes[match_index]
+    first = np.repeat(rows, row_sizes)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes)
+    second = starts[match_index[first]] + offsets
+    distinct = first != second
+    first, second = first[distinct], second[distinct]
+
+    # Grouped by wave, so each wave's pairs are a slice
+    pair_waves = match_waves(match_index, key_index)[match_index[first]]
+    order = np.argsort(pair_waves, kind="stable")
+    first, second, pair_waves = first[order], second[order], pair_waves[order]
+    bounds = np.flatnonzero(np.diff(pair_waves)) + 1
+
+    players, opponents = key_index[first], key_index[second]
+    scores = (np.sign(ranks[second] - ranks[first]) + 1) / 2
+    weights = k_factor / (row_sizes[first] - 1)
+    for wave in np.split(np.arange(len(first)), bounds):
+        wave_players = players[wave]
+        expected = 1 / (1 + 10 ** ((ratings[opponents[wave]] - ratings[wave_players]) / 400))
+        # Every player of a wave plays a single match in it, so the ratings read above are
+        # those from before the wave
+        np.add.at(ratings, wave_players, weights[wave] * (scores[wave] - expected))
+    return ratings
+
+
+def _replay(rows, ratings_by_key, k_factor):
+    """
+    Replays `rows` of (match id, user id, game id, outcome), ordered by match, starting from the
+    ratings in `ratings_by_key` (by (user id, game id); missing players start at
+    PlayerRating.INITIAL_RATING).
+
+    Returns:
+        dict: the rating and number of rated matches of each player, by (user id, game id)
+    """
+    keys = {}
+    match_index, key_index, ranks = [], [], []
+    previous_match, match_number = None, -1
+    for match_id, user_id, game_id, outcome in rows:
+        if match_id != previous_match:
+            previous_match, match_number = match_id, match_number + 1
+        match_index.append(match_number)
+        key_index.append(keys.setdefault((user_id, game_id), len(keys)))
+        ranks.append(OUTCOME_RANKS[outcome])
+
+    initial = [ratings_by_key.get(key, (PlayerRating.INITIAL_RATING, 0)) for key in keys]
+    ratings = np.array([rating for rating, _ in initial], dtype=float)
+    played = np.array([count for _, count in initial], dtype=np.int64)
+    key_index = np.array(key_index, dtype=np.int64)
+    replay_elo(np.array(match_index, dtype=np.int64), key_index, np.array(ranks, dtype=np.int64), ratings, k_factor)
+    played += np.bincount(key_index, minlength=len(keys))
+    return {key: (rating, count) for key, rating, count in zip(keys, ratings.tolist(), played.tolist())}
+
+
+def _rated_results(players):
+    # The results that count: those with an outcome, of matches whose lobby is finished
+    return (
+        players.filter(outcome__isnull=False, match__lobby__match_status=Lobby.Finished)
+        .order_by("date_played", "match_id")
+        .values_list("match_id", "user_id", "match__game_id", "outcome")
+    )
+
+
+def _save_ratings(ratings):
+    PlayerRating.objects.bulk_create(
+        [
+            PlayerRating(user_id=user_id, game_id=game_id, rating=rating, matches_rated=count)
+            for (user_id, game_id), (rating, count) in ratings.items()
+        ],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["user", "game"],
+        update_fields=["rating", "matches_rated"],
+    )
+
+
+def rate_matches(match_ids, k_factor=K_FACTOR):
+    """
+    Updates the ratings of the players of the given matches, which just finished, in the
+    current transaction.
+    """
+    with transaction.atomic():
+        rows = list(_rated_results(Player.objects.filter(match_id__in=match_ids)))
+        if not rows:
+            return
+        keys = {(user_id, game_id) for _, user_id, game_id, _ in rows}
+        current = PlayerRating.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in keys}, game_id__in={game_id for _, game_id in keys}
+        )
+        ratings_by_key = {
+            (user_id, game_id): (rating, count)
+            for user_id, game_id, rating, count in current.values_list("user_id", "game_id", "rating", "matches_rated")
+        }
+        _save_ratings(_replay(rows, ratings_by_key, k_factor))
+
+
+def rerate_games(game_ids, k_factor=K_FACTOR):
+    """
+    Recomputes the ratings at the given games from their whole match history, in the current
+    transaction. Used when a result of a finished match changes: as each rating depends on the
+    ratings before it, every later rating at the game may change.
+    """
+    with transaction.atomic():
+        # Locked first, so concurrent updates of these ratings wait for the replay
+        list(PlayerRating.objects.select_for_update().filter(game_id__in=game_ids).values_list("pk", flat=True))
+        rows = list(_rated_results(Player.objects.filter(match__game_id__in=game_ids)).iterator(chunk_size=10000))
+        PlayerRating.objects.filter(game_id__in=game_ids).delete()
+        _save_ratings(_replay(rows, {}, k_factor))
+
+
+def recompute_player_ratings(k_factor=K_FACTOR):
+    """
+    Recomputes every rating by replaying the whole match history.
+
+    Returns:
+        int: the number of ratings
+    """
+    rows = list(_rated_results(Player.objects.all()).iterator(chunk_size=10000))
+    ratings = _replay(rows, {}, k_factor)
+    with transaction.atomic():
+        PlayerRating.objects.all().delete()
+        _save_ratings(ratings)
+    return len(ratings)
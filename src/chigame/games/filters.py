@@ -1,11 +1,12 @@
 import django_filters
 
-from .models import Lobby
+from .models import Lobby, name_starts_with
 
 
 class LobbyFilter(django_filters.FilterSet):
-    lobby_name = django_filters.CharFilter(field_name="name", lookup_expr="contains", label="Lobby Name")
-    game_name = django_filters.CharFilter(field_name="game_id__name", lookup_expr="contains", label="Game Name")
+    # Prefix filters on the indexed sort names of lobbies and games (see name_starts_with)
+    lobby_name = django_filters.CharFilter(method="filter_name_prefix", label="Lobby Name starts with")
+    game_name = django_filters.CharFilter(method="filter_name_prefix", label="Game Name starts with")
     max_players = django_filters.NumberFilter(
         field_name="max_players", lookup_expr="lt", label="Maximum Number of Players less than or equal to"
     )
@@ -13,3 +14,7 @@ class LobbyFilter(django_filters.FilterSet):
     class Meta:
         model = Lobby
         fields = ["lobby_name", "game_name", "max_players"]
+
+    def filter_name_prefix(self, queryset, name, value):
+        field = "sort_name" if name == "lobby_name" else "game__sort_name"
+        return queryset.filter(name_starts_with(field, value))
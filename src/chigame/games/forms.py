@@ -21,6 +21,17 @@ class GameForm(forms.ModelForm):
         }
 
 
+class GameCreateForm(GameForm):
+    """
+    The game form for creating games, where a game with the BGG_id of an existing game updates
+    that game (see GameCreateView).
+    """
+
+    def validate_unique(self):
+        # BGG_id is the only unique field of a game, and its conflicts are upserts
+        pass
+
+
 class LobbyForm(forms.ModelForm):
     class Meta:
         model = Lobby
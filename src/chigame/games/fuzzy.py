@@ -0,0 +1,167 @@
+"""
+Typo-tolerant ("fuzzy") search over game names using an in-process trigram index.
+
+Every name is broken into trigrams (sequences of three characters) the same way PostgreSQL's
+pg_trgm does it: each word is lowercased and padded with two spaces in front and one behind,
+so "Catan" becomes {"  c", " ca", "cat", "ata", "tan", "an "}. Two names are similar when they
+share many trigrams, which still holds when a few letters are missing or swapped: "Catn" shares
+half of its trigrams with "Catan".
+https://www.postgresql.org/docs/current/pgtrgm.html
+
+The index maps each trigram to a NumPy array with the positions of the names containing it.
+Scoring a query is a single bincount over the posting lists of its trigrams, so it takes a few
+milliseconds even for a 50k-game catalog (see `python manage.py benchmark_fuzzy_search`).
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Game
+
+# Minimum similarity (shared trigrams / all distinct trigrams of both names) for a name to match.
+# 0.3 is also pg_trgm's default threshold.
+SIMILARITY_THRESHOLD = 0.3
+
+# Maximum number of games returned by a fuzzy search
+DEFAULT_LIMIT = 50
+
+# The index is rebuilt after a game is saved or deleted in this process (see signals.py). Other
+# processes cannot notify us, so the index is also rebuilt once it is older than this (in seconds).
+INDEX_MAX_AGE = 300
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams of `text`, using the same normalization as pg_trgm.
+
+    Args:
+        text (str): the text to split
+
+    Returns:
+        set of str: the trigrams
+    """
+    result = set()
+    for word in re.findall(r"[^\W_]+", text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """
+    An immutable trigram index over a list of (key, text) pairs.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries (iterable of (key, str)): the keys (e.g. game ids) and the texts to index
+        """
+        self.keys = []
+        sizes = []
+        postings = defaultdict(list)
+
+        for position, (key, text) in enumerate(entries):
+            grams = trigrams(text)
+            self.keys.append(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+
+        self.sizes = np.array(sizes, dtype=np.int32)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query, limit=DEFAULT_LIMIT, threshold=SIMILARITY_THRESHOLD):
+        """
+        Returns the entries most similar to `query`.
+
+        Args:
+            query (str): the (possibly misspelled) text to look for
+            limit (int): the maximum number of results
+            threshold (float): the minimum similarity, between 0 and 1
+
+        Returns:
+            list of (key, float): the matching keys with their similarity, most similar first
+        """
+        grams = trigrams(query)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists or not self.keys:
+            return []
+
+        # shared[i] is the number of trigrams the query has in common with entry i
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.keys))
+        similarity = shared / (len(grams) + self.sizes - shared)
+
+        candidates = np.flatnonzero(similarity >= threshold)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-similarity[candidates], limit - 1)[:limit]]
+        # Ties are broken by position so results are stable between calls
+        candidates = candidates[np.lexsort((candidates, -similarity[candidates]))]
+
+        return [(self.keys[i], float(similarity[i])) for i in candidates]
+
+
+_index = None
+_index_built_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_game_name_index():
+    """
+    Returns the trigram index over the names of all games, building it if necessary.
+    """
+    global _index, _index_built_at
+
+    with _index_lock:
+        if _index is None or time.monotonic() - _index_built_at > INDEX_MAX_AGE:
+            _index = TrigramIndex(Game.objects.values_list("pk", "name").iterator())
+            _index_built_at = time.monotonic()
+        return _index
+
+
+def invalidate_game_name_index():
+    """
+    Discards the trigram index so it is rebuilt (lazily) on the next fuzzy search.
+    """
+    global _index
+
+    with _index_lock:
+        _index = None
+
+
+def fuzzy_search_games(query, queryset=None, limit=DEFAULT_LIMIT):
+    """
+    Returns the games whose names are closest to `query`, tolerating typos.
+
+    The queryset is annotated with `search_rank` (lower is more similar) and ordered by it, like
+    the results of chigame.games.search.search_games.
+
+    Args:
+        query (str): the (possibly misspelled) name to look for
+        queryset (QuerySet): the games to search in; defaults to every game
+        limit (int): the maximum number of games returned
+
+    Returns:
+        QuerySet: the matching games
+    """
+    if queryset is None:
+        queryset = Game.objects.all()
+
+    matches = get_game_name_index().search(query or "", limit=limit)
+    if not matches:
+        return queryset.none()
+
+    ranks = [When(pk=game_id, then=Value(rank)) for rank, (game_id, _) in enumerate(matches)]
+    return (
+        queryset.filter(pk__in=[game_id for game_id, _ in matches])
+        .annotate(search_rank=Case(*ranks, output_field=IntegerField()))
+        .order_by("search_rank")
+    )
@@ -0,0 +1,136 @@
+"""
+Publishes lobby events (members joining and leaving, the match starting or being cancelled) to
+the pages showing the lobby, which receive them as Server-Sent Events (see asgi.py).
+
+Events go through a publish/subscribe backend, chosen with the LOBBY_EVENTS_BACKEND setting. A
+backend has three methods:
+
+    publish(channel, event)   delivers `event` (a dict) to every subscriber of `channel`, from
+                              any thread
+    subscribe(channel)        a context manager giving a subscription, whose `await get()`
+                              returns the next event (or RESET if the subscriber fell behind)
+    has_subscribers(channel)  whether an event published on `channel` would reach anyone
+
+The default InProcessBroker delivers events to the streams of the same process, so a single
+worker holds the connections of every viewer, each waiting on its own queue without touching
+the database. Running several workers needs a backend that carries events between processes.
+
+Events are published once the transaction that made the change commits, and only for lobbies
+that someone is watching, so changing an unwatched lobby costs nothing.
+"""
+
+import asyncio
+import contextlib
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Lobby
+
+# How many undelivered events a subscriber may have before it is reset
+MAX_PENDING_EVENTS = 100
+
+# Given to a subscriber instead of the events it missed; the page reloads to catch up
+RESET = {"type": "reset"}
+
+
+def lobby_channel(lobby_id):
+    return f"lobby.{lobby_id}"
+
+
+class Subscription:
+    """
+    The events published on a channel since subscribing, for one subscriber.
+    """
+
+    def __init__(self, loop, max_pending=MAX_PENDING_EVENTS):
+        self.loop = loop
+        self.queue = asyncio.Queue(max_pending)
+
+    def deliver(self, event):
+        # Called in the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """
+    Delivers events to the subscribers in this process.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def has_subscribers(self, channel):
+        return bool(self._subscriptions.get(channel))
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                pass  # The subscriber's event loop is closed; its subscription is being removed
+
+    @contextlib.contextmanager
+    def subscribe(self, channel):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the backend of the LOBBY_EVENTS_BACKEND setting, creating it on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.LOBBY_EVENTS_BACKEND)()
+        return _backend
+
+
+def publish_lobby_events(event_type, lobby_ids, user=None):
+    """
+    Publishes an event of `event_type` ("join", "leave" or "status") for each of the given
+    lobbies once the current transaction commits. Events carry the lobby's member count and
+    match status as committed, and the member who joined or left, if any.
+    """
+
+    def publish():
+        backend = get_backend()
+        watched = [pk for pk in lobby_ids if backend.has_subscribers(lobby_channel(pk))]
+        if not watched:
+            return
+        for pk, member_count, match_status in Lobby.objects.filter(pk__in=watched).values_list(
+            "pk", "member_count", "match_status"
+        ):
+            event = {"type": event_type, "lobby": pk, "member_count": member_count, "match_status": match_status}
+            if user is not None:
+                event["user"] = {"id": user.pk, "email": user.email}
+            backend.publish(lobby_channel(pk), event)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,58 @@
+"""
+Closes lobbies when their time is up, on the server.
+
+Every open lobby has an expires_at time (lobby_created plus time_constraint seconds), indexed for
+the open lobbies only. expire_lobbies() closes the expired ones a batch at a time: each batch is
+one indexed SELECT of primary keys and one UPDATE that applies the closing rules (the match
+starts if enough players joined, and is cancelled otherwise, see Lobby.expire). The
+run_lobby_timers management command calls it in a loop, sleeping until the next lobby expires
+(but at most POLL_INTERVAL seconds, so lobbies created meanwhile are noticed). The pages showing
+the closed lobbies are told through lobby events.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lobby_events import publish_lobby_events
+from .models import Lobby
+
+# Lobbies closed per UPDATE
+EXPIRY_BATCH_SIZE = 500
+
+# The longest the timer loop sleeps between two passes
+POLL_INTERVAL = 5  # seconds
+
+
+def expire_lobbies(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Closes every open lobby that expired by `now` (the current time by default).
+
+    Returns:
+        int: the number of lobbies closed
+    """
+    now = now or timezone.now()
+    expired = Lobby.objects.filter(match_status=Lobby.Lobbied, expires_at__lte=now).order_by("expires_at")
+    closed = 0
+    while True:
+        with transaction.atomic():
+            pks = list(expired.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                return closed
+            closed += Lobby.expire(Lobby.objects.filter(pk__in=pks), now)
+            publish_lobby_events("status", pks)
+
+
+def seconds_until_next_expiry(now=None, limit=POLL_INTERVAL):
+    """
+    Returns how long until the next open lobby expires, in seconds, between 0 and `limit`.
+    """
+    now = now or timezone.now()
+    next_expiry = (
+        Lobby.objects.filter(match_status=Lobby.Lobbied)
+        .order_by("expires_at")
+        .values_list("expires_at", flat=True)
+        .first()
+    )
+    if next_expiry is None:
+        return limit
+    return min(limit, max(0, (next_expiry - now).total_seconds()))
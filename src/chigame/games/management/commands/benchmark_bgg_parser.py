@@ -0,0 +1,100 @@
+import io
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from collections import deque
+from xml.sax.saxutils import quoteattr
+
+from django.core.management.base import BaseCommand
+
+from chigame.games.bgg import iter_items, parse_game
+
+DESCRIPTION = "A game of trading, building and settling. " * 40
+
+
+def thing_response(items, comments):
+    """
+    Returns a BGG `thing` response (as bytes) for `items` games, each with statistics and
+    `comments` rating comments, like those of `thing?stats=1&comments=1`.
+    """
+    parts = ["<?xml version='1.0' encoding='utf-8'?><items termsofuse='https://boardgamegeek.com/xmlapi/termsofuse'>"]
+    for i in range(1, items + 1):
+        parts.append(
+            f'<item type="boardgame" id="{i}"><thumbnail>https://example.com/{i}_t.jpg</thumbnail>'
+            f"<image>https://example.com/{i}.jpg</image>"
+            f'<name type="primary" sortindex="1" value="Game {i}"/>'
+            f'<name type="alternate" sortindex="1" value="Spiel {i}"/>'
+            f"<description>{DESCRIPTION}</description>"
+            '<yearpublished value="1995"/><minplayers value="3"/><maxplayers value="4"/>'
+            '<playingtime value="120"/><minplaytime value="60"/><maxplaytime value="120"/><minage value="10"/>'
+            '<poll name="suggested_numplayers" title="User Suggested Number of Players" totalvotes="100">'
+            + "".join(
+                f'<results numplayers="{n}"><result value="Best" numvotes="{n * 7}"/>'
+                f'<result value="Recommended" numvotes="{n * 11}"/></results>'
+                for n in range(1, 6)
+            )
+            + "</poll>"
+            f'<comments page="1" totalitems="{comments}">'
+            + "".join(
+                f"<comment username={quoteattr(f'player{c}')} rating=\"{c % 10 + 1}\" "
+                f'value={quoteattr(f"Played it {c} times, still great & worth it.")}/>'
+                for c in range(comments)
+            )
+            + "</comments>"
+            '<statistics page="1"><ratings><usersrated value="100000"/><average value="7.1"/>'
+            '<bayesaverage value="6.9"/><ranks><rank type="subtype" id="1" name="boardgame" value="500"/></ranks>'
+            '<averageweight value="2.3"/></ratings></statistics></item>'
+        )
+    parts.append("</items>")
+    return "".join(parts).encode()
+
+
+def parse_tree(body):
+    # The previous approach: decode the whole body, build the whole tree, then walk it
+    return (parse_game(item) for item in ET.fromstring(body.decode("utf-8")).iter("item"))
+
+
+def parse_stream(body):
+    return (parse_game(item) for item in iter_items(io.BytesIO(body)))
+
+
+def measure(parse, body, repeat):
+    """
+    Returns the best time of `repeat` runs of `parse(body)` in seconds, and the peak memory it
+    allocated in bytes (not counting `body` itself, nor the parsed games, which are dropped as
+    they come).
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        deque(parse(body), maxlen=0)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    deque(parse(body), maxlen=0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(seconds), peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks parsing BGG `thing` responses by building the whole tree versus streaming them "
+        "with iter_items, for several batch sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-sizes", default="20,100,500", help="Comma-separated numbers of games per response"
+        )
+        parser.add_argument("--comments", type=int, default=100, help="Rating comments per game")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (the best is kept)")
+
+    def handle(self, *args, **options):
+        for items in [int(size) for size in options["batch_sizes"].split(",")]:
+            body = thing_response(items, options["comments"])
+            assert list(parse_tree(body)) == list(parse_stream(body))
+            self.stdout.write(f"{items} games, {len(body) / 1e6:.1f}MB response:")
+            for label, parse in [("tree", parse_tree), ("stream", parse_stream)]:
+                seconds, peak = measure(parse, body, options["repeat"])
+                self.stdout.write(f"  {label:>6}: {seconds * 1000:8.1f}ms, peak {peak / 1e6:6.1f}MB")
@@ -0,0 +1,80 @@
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from chigame.games.fuzzy import TrigramIndex
+
+FIXTURE = Path(__file__).resolve().parents[2] / "fixtures" / "games-fixture-500.json"
+SUFFIXES = ["Deluxe", "Junior", "Legacy", "Duel", "Express", "Big Box", "Second Edition", "Dice Game", "Card Game"]
+
+
+def scaled_catalog(names, size, rng):
+    """
+    Returns `size` game names built from the fixture names: the originals first, then variants
+    that combine an original name with words from other names and common edition suffixes.
+    """
+    catalog = list(names)
+    words = [word for name in names for word in name.split()]
+    while len(catalog) < size:
+        base = rng.choice(names)
+        extra = rng.choice(SUFFIXES) if rng.random() < 0.5 else rng.choice(words)
+        catalog.append(f"{base} {extra} {len(catalog)}")
+    return catalog[:size]
+
+
+def misspell(name, rng):
+    """
+    Returns `name` with one typo: a dropped, doubled or swapped letter.
+    """
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    typo = rng.choice(["drop", "double", "swap"])
+    if typo == "drop":
+        return name[:i] + name[i + 1 :]
+    if typo == "double":
+        return name[:i] + name[i] + name[i:]
+    return name[: i - 1] + name[i] + name[i - 1] + name[i + 1 :]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the fuzzy game name index on the 500-game fixture scaled up to a larger catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=50000, help="Number of game names to index")
+        parser.add_argument("--queries", type=int, default=1000, help="Number of misspelled queries to run")
+        parser.add_argument("--limit", type=int, default=10, help="Top-K results per query")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        fixture = json.loads(FIXTURE.read_text())
+        names = [entry["fields"]["name"] for entry in fixture if entry["model"] == "games.game"]
+        catalog = scaled_catalog(names, options["size"], rng)
+
+        start = time.perf_counter()
+        index = TrigramIndex(enumerate(catalog))
+        build_seconds = time.perf_counter() - start
+
+        timings = []
+        found = 0
+        for _ in range(options["queries"]):
+            target = rng.randrange(len(names))
+            query = misspell(names[target], rng)
+            start = time.perf_counter()
+            results = index.search(query, limit=options["limit"])
+            timings.append((time.perf_counter() - start) * 1000)
+            found += any(key == target for key, _ in results)
+
+        timings.sort()
+        self.stdout.write(f"indexed {len(index)} names in {build_seconds:.2f}s")
+        self.stdout.write(
+            f"{len(timings)} queries: mean {statistics.mean(timings):.2f}ms, "
+            f"p50 {timings[len(timings) // 2]:.2f}ms, p95 {timings[int(len(timings) * 0.95)]:.2f}ms, "
+            f"max {timings[-1]:.2f}ms"
+        )
+        self.stdout.write(f"misspelled name found in top {options['limit']}: {found / len(timings):.1%}")
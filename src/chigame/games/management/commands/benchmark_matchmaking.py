@@ -0,0 +1,105 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from chigame.games.matchmaking import Matchmaker
+from chigame.games.models import Game, Lobby, make_sort_name, player_count_mask
+from chigame.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulates a matchmaking queue of many players spread over several games and sizes, some joinable lobbies "
+        "already open, and times the passes that place them. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--players", type=int, default=10000, help="Number of queued players")
+        parser.add_argument("--games", type=int, default=50, help="Number of games they queue for")
+        parser.add_argument("--open-lobbies", type=int, default=500, help="Number of open lobbies with free seats")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            self.simulate(rng, options)
+            transaction.set_rollback(True)
+
+    def simulate(self, rng, options):
+        now = timezone.now()
+        games = []
+        for i in range(options["games"]):
+            min_players = rng.randint(2, 3)
+            max_players = rng.randint(min_players, 6)
+            games.append(
+                Game(
+                    name=f"Matchmaking benchmark {i}",
+                    sort_name=make_sort_name(f"Matchmaking benchmark {i}"),
+                    description="",
+                    min_players=min_players,
+                    max_players=max_players,
+                    player_counts=player_count_mask(min_players, max_players),
+                )
+            )
+        Game.objects.bulk_create(games)
+        users = User.objects.bulk_create(
+            [
+                User(username=f"matchmaking-{i}", email=f"matchmaking-{i}@example.com", password="!")
+                for i in range(options["players"] + options["open_lobbies"])
+            ],
+            batch_size=1000,
+        )
+        hosts, players = users[: options["open_lobbies"]], users[options["open_lobbies"] :]
+
+        lobbies = []
+        for host in hosts:
+            game = rng.choice(games)
+            lobby = Lobby(
+                name=f"Open lobby {host.pk}",
+                game=game,
+                created_by=host,
+                min_players=game.min_players,
+                max_players=rng.randint(game.min_players, game.max_players),
+                member_count=1,
+                lobby_created=now,
+            )
+            lobby.sort_name = make_sort_name(lobby.name)
+            lobby.expires_at = now + timedelta(seconds=lobby.time_constraint)
+            lobbies.append(lobby)
+        Lobby.objects.bulk_create(lobbies)
+        Lobby.members.through.objects.bulk_create(
+            [Lobby.members.through(lobby_id=lobby.pk, user_id=lobby.created_by_id) for lobby in lobbies],
+            batch_size=1000,
+        )
+
+        matchmaker = Matchmaker()
+        start = time.perf_counter()
+        for user in players:
+            game = rng.choice(games)
+            matchmaker.enqueue(user.pk, game.pk, rng.randint(game.min_players, game.max_players))
+        enqueue_seconds = time.perf_counter() - start
+        self.stdout.write(
+            f"queued {len(players)} players in {enqueue_seconds * 1000:.1f}ms "
+            f"({enqueue_seconds / len(players) * 1e6:.1f}us each)"
+        )
+
+        # Later passes only place players whose lobby's seats were taken meanwhile, so the first
+        # pass places everyone who can be placed
+        # Counted without CaptureQueriesContext, which formats every query (costly for bulk inserts)
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            start = time.perf_counter()
+            placements = matchmaker.match()
+            seconds = time.perf_counter() - start
+        placed = sum(len(user_ids) for user_ids in placements.values())
+        filled = sum(1 for lobby in lobbies if lobby.pk in placements)
+        self.stdout.write(
+            f"placed {placed} players in {len(placements) - filled} new and {filled} open lobbies "
+            f"in {seconds * 1000:.1f}ms ({len(queries)} queries)"
+        )
+        self.stdout.write(f"{len(matchmaker)} players left waiting for more players")
+        self.stdout.write(self.style.SUCCESS(f"Matched {placed} of {len(players)} queued players in {seconds:.3f}s."))
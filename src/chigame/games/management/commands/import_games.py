@@ -0,0 +1,55 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from chigame.games.bulk_import import DEFAULT_BATCH_SIZE, GameImporter, read_rows
+
+# How many skipped rows are listed individually
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports games from a JSON fixture, JSON Lines or CSV file in bulk, skipping invalid rows. "
+        "See chigame/games/bulk_import.py for the accepted formats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to import")
+        parser.add_argument(
+            "--format", choices=["json", "jsonl", "csv"], help="The file format (by default, from the file extension)"
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Games written per batch")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("json", "jsonl", "csv"):
+            raise CommandError(f"Cannot tell the format of {path}, use --format")
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist")
+
+        start = time.perf_counter()
+        importer = GameImporter(batch_size=options["batch_size"])
+        try:
+            # All or nothing: a failure part way through leaves the catalog as it was
+            with transaction.atomic(), path.open(newline="" if file_format == "csv" else None) as file:
+                importer.import_rows(read_rows(file, file_format))
+        except IntegrityError as error:
+            raise CommandError(f"Import aborted, nothing was imported: {error}")
+        importer.finish()
+        seconds = time.perf_counter() - start
+
+        for row_number, reason in importer.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f"Row {row_number} skipped: {reason}")
+        if len(importer.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"... and {len(importer.errors) - MAX_REPORTED_ERRORS} more rows skipped")
+        if importer.unknown_links:
+            self.stderr.write(f"{importer.unknown_links} unknown category or mechanic ids were ignored")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {importer.imported} games in {seconds:.2f}s ({len(importer.errors)} rows skipped)."
+            )
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chigame.games.models import Game
+from chigame.games.search import rebuild_search_index, search_index_enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over every game in the catalog."
+
+    def handle(self, *args, **options):
+        if not search_index_enabled():
+            self.stdout.write(self.style.WARNING("The search index is only available on SQLite; nothing to do."))
+            return
+
+        rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Game.objects.count()} games."))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chigame.games.models import UserStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every user's match and tournament statistics from the matches and tournaments. "
+        "Statistics are otherwise updated as matches finish and tournaments end; run it if they drift."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        users = UserStats.rebuild()
+        seconds = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the statistics of {users} users in {seconds:.2f}s."))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chigame.games.elo import K_FACTOR, recompute_player_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the Elo rating of every player at every game by replaying the whole match history. "
+        "Ratings are otherwise updated as matches finish; run it after changing the rating parameters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--k-factor", type=float, default=K_FACTOR, help="Largest change of a rating in a single match"
+        )
+
+    def handle(self, *args, **options):
+        if options["k_factor"] <= 0:
+            raise CommandError("--k-factor must be positive.")
+        start = time.perf_counter()
+        rated = recompute_player_ratings(k_factor=options["k_factor"])
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f"Rated {rated} players in {seconds:.2f}s (K factor {options['k_factor']:g}).")
+        )
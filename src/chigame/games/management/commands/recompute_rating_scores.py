@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chigame.games.ratings import PRIOR_WEIGHT, recompute_rating_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the Bayesian rating score of every game, used by the "top rated" sort. '
+        "Run it periodically: new reviews only change the scores after it runs."
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        scored = recompute_rating_scores()
+        seconds = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f"Scored {scored} rated games in {seconds:.2f}s (prior weight {PRIOR_WEIGHT}).")
+        )
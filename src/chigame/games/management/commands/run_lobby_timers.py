@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chigame.games.lobby_timers import POLL_INTERVAL, expire_lobbies, seconds_until_next_expiry
+
+
+class Command(BaseCommand):
+    help = (
+        "Closes lobbies when their time is up: starts their match if enough players joined and cancels it "
+        "otherwise. Runs until interrupted, or a single pass with --once (e.g. from cron). "
+        "See chigame/games/lobby_timers.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=POLL_INTERVAL,
+            help="The longest to wait between two passes, in seconds",
+        )
+        parser.add_argument("--once", action="store_true", help="Close the expired lobbies once and exit")
+
+    def handle(self, *args, **options):
+        closed = 0
+        try:
+            while True:
+                expired = expire_lobbies()
+                closed += expired
+                if expired and options["verbosity"] > 1:
+                    self.stdout.write(f"Closed {expired} lobbies")
+                if options["once"]:
+                    break
+                time.sleep(seconds_until_next_expiry(limit=options["interval"]))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Closed {closed} expired lobbies."))
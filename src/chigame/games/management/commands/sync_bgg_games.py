@@ -0,0 +1,69 @@
+import time
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chigame.games.bgg import THING_BATCH_SIZE
+from chigame.games.bgg_sync import CatalogSync
+
+# How many invalid games are listed individually
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the games imported from BoardGameGeek with their current details on BGG, in batches and "
+        "within a rate limit. An interrupted sync resumes from its checkpoint when run again. "
+        "See chigame/games/bgg_sync.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=THING_BATCH_SIZE, help="BGG ids fetched per request (at most 20)"
+        )
+        parser.add_argument("--rate", type=float, help="Requests per second (BGG_SYNC_RATE by default)")
+        parser.add_argument("--checkpoint", help="The checkpoint file (BGG_SYNC_CHECKPOINT_PATH by default)")
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and sync every game")
+
+    def handle(self, *args, **options):
+        if not 1 <= options["batch_size"] <= THING_BATCH_SIZE:
+            raise CommandError(f"--batch-size must be between 1 and {THING_BATCH_SIZE}")
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise CommandError("--rate must be positive.")
+        sync = CatalogSync(
+            options["checkpoint"] or settings.BGG_SYNC_CHECKPOINT_PATH,
+            batch_size=options["batch_size"],
+            rate=options["rate"],
+        )
+        resume_after = 0 if options["restart"] else sync.read_checkpoint()
+        if resume_after:
+            self.stdout.write(f"Resuming after game {resume_after}.")
+
+        def progress(sync):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Synced {sync.synced} games ({sync.updated} updated)")
+
+        start = time.perf_counter()
+        try:
+            sync.run(restart=options["restart"], progress=progress)
+        except requests.RequestException as error:
+            raise CommandError(
+                f"Sync stopped after {sync.synced} games ({sync.updated} updated), run again to resume: {error}"
+            )
+        finally:
+            sync.finish()
+        seconds = time.perf_counter() - start
+
+        for pk, reason in sync.invalid[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f"Game {pk} not updated: {reason}")
+        if len(sync.invalid) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"... and {len(sync.invalid) - MAX_REPORTED_ERRORS} more games not updated")
+        if sync.missing:
+            self.stderr.write(f"{len(sync.missing)} BGG ids are unknown to BGG")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synced {sync.synced} games in {seconds:.2f}s "
+                f"({sync.updated} updated, {sync.linked} given new categories or mechanics)."
+            )
+        )
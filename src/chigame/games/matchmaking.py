@@ -0,0 +1,347 @@
+"""
+Matchmaking: players queue for a game and a number of players, and are put in lobbies
+automatically instead of picking one from the lobby list.
+
+Each (game, number of players) pair has its own queue, in the order players joined it, so the
+players who waited longest are placed first. A matching pass takes every waiting player out of
+the queues at once and places them, in order:
+
+1. in the open lobbies of that game and size that have free seats, fullest first, so they reach
+   their players and start;
+2. in new lobbies, one per full group of waiting players (these start right away).
+
+Players who can't be placed yet go back to the front of their queue. A pass makes a fixed
+number of queries however many players are waiting: one read of the open lobbies and one of
+their members, a conditional UPDATE (so concurrent joins can't overfill them, see Lobby.join)
+per number of seats taken in existing lobbies, and bulk inserts of the new lobbies and of the
+memberships.
+
+The queues live in the memory of the process that serves the requests, which runs the passes
+in a background thread every MATCH_INTERVAL seconds while players are waiting, so matchmaking
+needs a single web process (like the in-process lobby events, see lobby_events.py). The
+benchmark_matchmaking command measures a pass over a large simulated queue.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .lobby_events import publish_lobby_events
+from .models import Game, Lobby, make_sort_name
+
+logger = logging.getLogger(__name__)
+
+# How often (in seconds) waiting players are matched
+MATCH_INTERVAL = 0.2
+
+# Placements nobody asked about (see Matchmaker.status) are forgotten after this many newer ones
+MAX_PLACEMENTS_KEPT = 10000
+
+QUEUED, MATCHED = "queued", "matched"
+
+
+class Ticket:
+    """
+    A player waiting for a lobby of `players` players for a game.
+    """
+
+    __slots__ = ("user_id", "game_id", "players", "enqueued_at")
+
+    def __init__(self, user_id, game_id, players, enqueued_at):
+        self.user_id = user_id
+        self.game_id = game_id
+        self.players = players
+        self.enqueued_at = enqueued_at
+
+    @property
+    def key(self):
+        return self.game_id, self.players
+
+
+class Matchmaker:
+    """
+    The matchmaking queues, and the lobbies players were placed in (until they ask, see status).
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # The tickets of each (game id, players) queue, by user id, longest waiting first
+        self._queues = defaultdict(OrderedDict)
+        # Every ticket, by user id, including those taken out of their queue by a running pass
+        self._tickets = {}
+        # The lobby each placed player was put in, by user id
+        self._placed = {}
+        self._lock = threading.Lock()
+        self._waiting = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def enqueue(self, user_id, game_id, players):
+        """
+        Queues a player for a lobby of `players` players for a game, in place of any queue they
+        were in.
+
+        Returns:
+            Ticket: the player's place in the queue
+        """
+        with self._lock:
+            self._remove(user_id)
+            self._placed.pop(user_id, None)
+            ticket = self._tickets[user_id] = Ticket(user_id, game_id, players, self.clock())
+            self._queues[ticket.key][user_id] = ticket
+        self._waiting.set()
+        return ticket
+
+    def dequeue(self, user_id):
+        """
+        Takes a player out of their queue. A player already being placed by a running pass may
+        still end up in a lobby.
+
+        Returns:
+            bool: whether the player was queued
+        """
+        with self._lock:
+            return self._remove(user_id) is not None
+
+    def _remove(self, user_id):
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is not None:
+            queue = self._queues.get(ticket.key)
+            if queue is not None:
+                queue.pop(user_id, None)
+                if not queue:
+                    del self._queues[ticket.key]
+        return ticket
+
+    def status(self, user_id):
+        """
+        Returns (QUEUED, the player's ticket), (MATCHED, the id of the lobby they were placed
+        in) or None if the player isn't queued. A placement is only reported once.
+        """
+        with self._lock:
+            if user_id in self._placed:
+                return MATCHED, self._placed.pop(user_id)
+            ticket = self._tickets.get(user_id)
+        return (QUEUED, ticket) if ticket is not None else None
+
+    def match(self):
+        """
+        Places the waiting players in lobbies (see the module docstring).
+
+        Returns:
+            dict: the user ids placed in each lobby, by lobby id
+        """
+        with self._lock:
+            queues, self._queues = self._queues, defaultdict(OrderedDict)
+        if not queues:
+            return {}
+
+        placements, unplaced = {}, {}
+        try:
+            with transaction.atomic():
+                placements, unplaced = place_tickets({key: list(queue.values()) for key, queue in queues.items()})
+        except Exception:
+            unplaced = {key: list(queue.values()) for key, queue in queues.items()}
+            raise
+        finally:
+            self._requeue(unplaced, placements)
+        return {lobby_id: [ticket.user_id for ticket in tickets] for lobby_id, tickets in placements.items()}
+
+    def _requeue(self, unplaced, placements):
+        with self._lock:
+            for lobby_id, tickets in placements.items():
+                for ticket in tickets:
+                    # Unless the player queued again during the pass
+                    if self._tickets.get(ticket.user_id) is ticket:
+                        del self._tickets[ticket.user_id]
+                    self._placed[ticket.user_id] = lobby_id
+            while len(self._placed) > MAX_PLACEMENTS_KEPT:
+                del self._placed[next(iter(self._placed))]
+            for key, tickets in unplaced.items():
+                # Ahead of the players who joined the queue during the pass
+                queue = OrderedDict(
+                    (ticket.user_id, ticket) for ticket in tickets if self._tickets.get(ticket.user_id) is ticket
+                )
+                queue.update(self._queues.pop(key, {}))
+                if queue:
+                    self._queues[key] = queue
+
+    def start(self):
+        """
+        Starts matching the waiting players in a background thread, if it isn't running yet.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="matchmaking", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._waiting.wait()
+            close_old_connections()
+            try:
+                self.match()
+            except Exception:
+                logger.exception("Matchmaking pass failed")
+            finally:
+                close_old_connections()
+            with self._lock:
+                if not self._tickets:
+                    self._waiting.clear()
+            time.sleep(MATCH_INTERVAL)
+
+
+def add_members(memberships):
+    """
+    Adds the given (lobby id, user id) memberships, with a single executemany: for thousands of
+    rows, building a model instance per row would take most of a pass.
+    """
+    through = Lobby.members.through
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(through._meta.get_field(name).column) for name in ("lobby", "user"))
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {quote(through._meta.db_table)} ({columns}) VALUES (%s, %s)", memberships)
+
+
+class _SeatsTaken(Exception):
+    pass
+
+
+def take_seats(lobby_ids, seats):
+    """
+    Takes `seats` seats in each of the given open lobbies that has that many free, starting the
+    match of those it fills, with a single conditional UPDATE (like Lobby.join).
+
+    Returns:
+        int: the number of lobbies whose seats were taken
+    """
+    return Lobby.objects.filter(
+        pk__in=lobby_ids, match_status=Lobby.Lobbied, member_count__lte=F("max_players") - seats
+    ).update(
+        member_count=F("member_count") + seats,
+        # The condition sees the count from before the update
+        match_status=Case(
+            When(member_count=F("max_players") - seats, then=Value(Lobby.Viewable)),
+            default=F("match_status"),
+            output_field=models.PositiveSmallIntegerField(),
+        ),
+    )
+
+
+def place_tickets(queues):
+    """
+    Places players in lobbies, in the current transaction.
+
+    Args:
+        queues (dict): the tickets of each (game id, players) queue, longest waiting first
+
+    Returns:
+        (dict, dict): the tickets placed in each lobby, by lobby id, and the tickets that
+        couldn't be placed, by queue
+    """
+    now = timezone.now()
+    game_ids = {game_id for game_id, _ in queues}
+    open_lobbies = Lobby.objects.filter(
+        game_id__in=game_ids, match_status=Lobby.Lobbied, member_count__lt=F("max_players"), expires_at__gt=now
+    )
+    candidates = defaultdict(list)
+    for pk, game_id, max_players, member_count in open_lobbies.order_by("-member_count", "expires_at").values_list(
+        "pk", "game_id", "max_players", "member_count"
+    ):
+        if (game_id, max_players) in queues:
+            candidates[game_id, max_players].append((pk, max_players - member_count))
+    members = defaultdict(set)
+    for lobby_id, user_id in Lobby.members.through.objects.filter(lobby__in=open_lobbies).values_list(
+        "lobby_id", "user_id"
+    ):
+        members[lobby_id].add(user_id)
+
+    joining = {}  # The tickets placed in each existing lobby, by lobby id
+    groups = []  # The tickets of each new lobby
+    unplaced = {}
+    for key, tickets in queues.items():
+        waiting = deque(tickets)
+        for lobby_id, free in candidates.get(key, []):
+            taken, skipped = [], []
+            while waiting and len(taken) < free:
+                ticket = waiting.popleft()
+                (skipped if ticket.user_id in members[lobby_id] else taken).append(ticket)
+            waiting.extendleft(reversed(skipped))
+            if taken:
+                joining[lobby_id] = taken
+        players = key[1]
+        while len(waiting) >= players:
+            groups.append([waiting.popleft() for _ in range(players)])
+        unplaced[key] = list(waiting)
+
+    # The lobbies given the same number of players are filled with one UPDATE
+    by_seats = defaultdict(list)
+    for lobby_id, tickets in joining.items():
+        by_seats[len(tickets)].append(lobby_id)
+    placements = {}
+    for seats, lobby_ids in by_seats.items():
+        try:
+            with transaction.atomic():
+                if take_seats(lobby_ids, seats) != len(lobby_ids):
+                    raise _SeatsTaken
+            seated = lobby_ids
+        except _SeatsTaken:
+            # Some of the seats were taken since they were read; the lobbies are filled one by one
+            # and those that are now too full are left alone
+            seated = [lobby_id for lobby_id in lobby_ids if take_seats([lobby_id], seats)]
+        for lobby_id in seated:
+            placements[lobby_id] = joining[lobby_id]
+        for lobby_id in set(lobby_ids).difference(seated):
+            tickets = joining[lobby_id]
+            unplaced[tickets[0].key] = tickets + unplaced[tickets[0].key]
+
+    if groups:
+        names = dict(Game.objects.filter(pk__in={group[0].game_id for group in groups}).values_list("pk", "name"))
+        lobbies = []
+        for group in groups:
+            game_id, players = group[0].key
+            lobby = Lobby(
+                name=f"{names[game_id]} ({players} players)",
+                game_id=game_id,
+                created_by_id=group[0].user_id,
+                match_status=Lobby.Viewable,
+                min_players=players,
+                max_players=players,
+                member_count=players,
+                lobby_created=now,
+            )
+            # Set by save(), which bulk_create doesn't call
+            lobby.sort_name = make_sort_name(lobby.name)
+            lobby.expires_at = lobby.lobby_created + timedelta(seconds=lobby.time_constraint)
+            lobbies.append(lobby)
+        Lobby.objects.bulk_create(lobbies)
+        for lobby, group in zip(lobbies, groups):
+            placements[lobby.pk] = group
+
+    add_members([(lobby_id, ticket.user_id) for lobby_id, tickets in placements.items() for ticket in tickets])
+    publish_lobby_events("join", [lobby_id for lobby_id in joining if lobby_id in placements])
+    return placements, {key: tickets for key, tickets in unplaced.items() if tickets}
+
+
+_matchmaker = None
+_matchmaker_lock = threading.Lock()
+
+
+def get_matchmaker():
+    """
+    Returns the matchmaker of this process, starting it on first use.
+    """
+    global _matchmaker
+    with _matchmaker_lock:
+        if _matchmaker is None:
+            _matchmaker = Matchmaker()
+            _matchmaker.start()
+        return _matchmaker
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.4 on 2026-10-18 07:05
+
+import chigame.games.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def related_names(through_table, target_table, target_column):
+    return (
+        f"(SELECT group_concat(t.name, ' ') FROM {through_table} m "
+        f"INNER JOIN {target_table} t ON t.id = m.{target_column} WHERE m.game_id = g.id)"
+    )
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-specific; on other databases chigame.games.search falls back to plain lookups
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE games_game_fts USING fts5("
+        "name, description, categories, mechanics, people, publishers, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    # Rank matches in the name far above matches in the (long) description
+    schema_editor.execute(
+        "INSERT INTO games_game_fts(games_game_fts, rank) VALUES ('rank', 'bm25(10, 1, 2, 2, 3, 3)')"
+    )
+    schema_editor.execute(
+        "INSERT INTO games_game_fts (rowid, name, description, categories, mechanics, people, publishers) "
+        "SELECT g.id, g.name, g.description, "
+        + related_names("games_game_categories", "games_category", "category_id")
+        + ", "
+        + related_names("games_game_mechanics", "games_mechanic", "mechanic_id")
+        + ", "
+        + related_names("games_person_games", "games_person", "person_id")
+        + ", "
+        + related_names("games_publisher_games", "games_publisher", "publisher_id")
+        + " FROM games_game g"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS games_game_fts")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0022_tournament_created_by"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameSearchDocument",
+            fields=[
+                (
+                    "game",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="games.game",
+                    ),
+                ),
+                ("name", models.TextField()),
+                ("description", models.TextField()),
+                ("categories", models.TextField()),
+                ("mechanics", models.TextField()),
+                ("people", models.TextField()),
+                ("publishers", models.TextField()),
+                ("document", chigame.games.models.SearchDocumentField(db_column="games_game_fts")),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "games_game_fts",
+                "managed": False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
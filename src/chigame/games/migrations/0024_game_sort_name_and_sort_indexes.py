@@ -0,0 +1,52 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:12
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def make_sort_name(name):
+    # As chigame.games.models.make_sort_name does
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(without_accents.casefold().split())
+
+
+def fill_sort_names(apps, schema_editor):
+    Game = apps.get_model("games", "Game")
+    games = list(Game.objects.only("pk", "name"))
+    for game in games:
+        game.sort_name = make_sort_name(game.name)
+    Game.objects.bulk_update(games, ["sort_name"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0023_game_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="sort_name",
+            field=models.TextField(blank=True, default="", editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_sort_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["sort_name", "id"], name="game_sort_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["year_published", "id"], name="game_year_published_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["max_playtime", "id"], name="game_max_playtime_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["complexity", "id"], name="game_complexity_idx"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+# As in chigame.games.models: bit N-1 is set for N players, the last bit for more than 10
+PLAYER_COUNT_BITS = 11
+
+
+def player_count_mask(min_players, max_players):
+    if not max_players or (min_players or 0) > max_players:
+        return 0
+    low = min(max(min_players or 1, 1), PLAYER_COUNT_BITS) - 1
+    high = min(max_players, PLAYER_COUNT_BITS) - 1
+    return (1 << (high + 1)) - (1 << low)
+
+
+def fill_player_counts(apps, schema_editor):
+    Game = apps.get_model("games", "Game")
+    games = list(Game.objects.only("pk", "min_players", "max_players"))
+    for game in games:
+        game.player_counts = player_count_mask(game.min_players, game.max_players)
+    Game.objects.bulk_update(games, ["player_counts"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0024_game_sort_name_and_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="player_counts",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(fill_player_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.4 on 2026-10-18 07:22
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+STAR_FIELDS = ["one_star_count", "two_star_count", "three_star_count", "four_star_count", "five_star_count"]
+
+
+def fill_review_summaries(apps, schema_editor):
+    # As summarize_reviews does
+    Review = apps.get_model("games", "Review")
+    ReviewSummary = apps.get_model("games", "ReviewSummary")
+    star_counts = {
+        field: models.Count("pk", filter=Q(rating__gte=stars - Decimal("0.5"), rating__lt=stars + Decimal("0.5")))
+        for stars, field in enumerate(STAR_FIELDS, start=1)
+    }
+    rows = (
+        Review.objects.order_by()
+        .values("game_id")
+        .annotate(
+            review_count=models.Count("pk"),
+            rating_count=models.Count("rating"),
+            rating_sum=Coalesce(models.Sum("rating"), Decimal(0)),
+            **star_counts,
+        )
+    )
+    ReviewSummary.objects.bulk_create((ReviewSummary(**values) for values in rows), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0025_game_player_counts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewSummary",
+            fields=[
+                (
+                    "game",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="review_summary",
+                        serialize=False,
+                        to="games.game",
+                    ),
+                ),
+                ("review_count", models.PositiveIntegerField(default=0)),
+                ("rating_count", models.PositiveIntegerField(default=0)),
+                ("rating_sum", models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ("one_star_count", models.PositiveIntegerField(default=0)),
+                ("two_star_count", models.PositiveIntegerField(default=0)),
+                ("three_star_count", models.PositiveIntegerField(default=0)),
+                ("four_star_count", models.PositiveIntegerField(default=0)),
+                ("five_star_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.4 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+# The number of imaginary reviews at the global mean added to every game
+PRIOR_WEIGHT = 10
+
+
+def fill_rating_scores(apps, schema_editor):
+    # As recompute_rating_scores does: the Bayesian average of each game's ratings
+    Game = apps.get_model("games", "Game")
+    ReviewSummary = apps.get_model("games", "ReviewSummary")
+    rows = list(ReviewSummary.objects.filter(rating_count__gt=0).values_list("game_id", "rating_count", "rating_sum"))
+    if not rows:
+        return
+    global_mean = float(sum(rating_sum for _, _, rating_sum in rows)) / sum(count for _, count, _ in rows)
+    scored = [
+        Game(
+            pk=game_id,
+            rating_score=round((PRIOR_WEIGHT * global_mean + float(rating_sum)) / (PRIOR_WEIGHT + count), 6),
+        )
+        for game_id, count, rating_sum in rows
+    ]
+    Game.objects.bulk_update(scored, ["rating_score"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0026_review_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="rating_score",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["rating_score", "id"], name="game_rating_score_idx"),
+        ),
+        migrations.RunPython(fill_rating_scores, migrations.RunPython.noop),
+    ]
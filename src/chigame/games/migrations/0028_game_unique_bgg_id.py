@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-18 07:51
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def unlink_duplicate_bgg_ids(apps, schema_editor):
+    # Only the first game imported from each BGG game keeps its BGG_id
+    Game = apps.get_model("games", "Game")
+    duplicates = (
+        Game.objects.filter(BGG_id__isnull=False)
+        .values("BGG_id")
+        .annotate(count=Count("id"), first=Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Game.objects.filter(BGG_id=duplicate["BGG_id"]).exclude(pk=duplicate["first"]).update(BGG_id=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0027_game_rating_score"),
+    ]
+
+    operations = [
+        migrations.RunPython(unlink_duplicate_bgg_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="game",
+            name="BGG_id",
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.4 on 2026-10-18 07:54
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def make_sort_name(name):
+    # As chigame.games.models.make_sort_name does
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(without_accents.casefold().split())
+
+
+def fill_sort_names(apps, schema_editor):
+    Lobby = apps.get_model("games", "Lobby")
+    lobbies = list(Lobby.objects.only("pk", "name"))
+    for lobby in lobbies:
+        lobby.sort_name = make_sort_name(lobby.name)
+    Lobby.objects.bulk_update(lobbies, ["sort_name"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0028_game_unique_bgg_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lobby",
+            name="sort_name",
+            field=models.TextField(blank=True, default="", editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_sort_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="lobby",
+            index=models.Index(fields=["lobby_created", "id"], name="lobby_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="lobby",
+            index=models.Index(fields=["sort_name", "id"], name="lobby_sort_name_idx"),
+        ),
+    ]
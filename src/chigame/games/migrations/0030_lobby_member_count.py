@@ -0,0 +1,27 @@
+# Generated by Django 4.2.4 on 2026-10-18 08:31
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_members(apps, schema_editor):
+    Lobby = apps.get_model("games", "Lobby")
+    members = Lobby.members.through.objects.filter(lobby_id=models.OuterRef("pk")).order_by().values("lobby_id")
+    Lobby.objects.update(
+        member_count=Coalesce(models.Subquery(members.annotate(count=models.Count("*")).values("count")), 0)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0029_lobby_sort_name_and_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lobby",
+            name="member_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_members, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.4 on 2026-10-18 09:12
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_expiry_times(apps, schema_editor):
+    Lobby = apps.get_model("games", "Lobby")
+    lobbies = list(Lobby.objects.only("pk", "lobby_created", "time_constraint"))
+    for lobby in lobbies:
+        lobby.expires_at = lobby.lobby_created + timedelta(seconds=lobby.time_constraint)
+    Lobby.objects.bulk_update(lobbies, ["expires_at"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0030_lobby_member_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lobby",
+            name="expires_at",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_expiry_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="lobby",
+            index=models.Index(
+                condition=models.Q(("match_status", 1)), fields=["expires_at"], name="lobby_open_expires_idx"
+            ),
+        ),
+    ]
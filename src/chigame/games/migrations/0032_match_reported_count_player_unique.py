@@ -0,0 +1,46 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_players(apps, schema_editor):
+    # Only the first row of each player in a match is kept
+    Player = apps.get_model("games", "Player")
+    duplicates = Player.objects.values("match_id", "user_id").annotate(count=Count("id"), first=Min("id"))
+    for duplicate in duplicates.filter(count__gt=1):
+        Player.objects.filter(match_id=duplicate["match_id"], user_id=duplicate["user_id"]).exclude(
+            pk=duplicate["first"]
+        ).delete()
+
+
+def count_reported_players(apps, schema_editor):
+    Match = apps.get_model("games", "Match")
+    Player = apps.get_model("games", "Player")
+    reported = Player.objects.filter(match_id=models.OuterRef("pk"), outcome__isnull=False).order_by()
+    Match.objects.update(
+        reported_count=Coalesce(
+            models.Subquery(reported.values("match_id").annotate(count=Count("*")).values("count")), 0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0031_lobby_expires_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_players, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="player",
+            constraint=models.UniqueConstraint(fields=("match", "user"), name="player_unique_match_user"),
+        ),
+        migrations.AddField(
+            model_name="match",
+            name="reported_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_reported_players, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.4 on 2026-10-18 11:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_match_dates(apps, schema_editor):
+    Match = apps.get_model("games", "Match")
+    Player = apps.get_model("games", "Player")
+    Player.objects.update(
+        date_played=models.Subquery(Match.objects.filter(pk=models.OuterRef("match_id")).values("date_played"))
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("games", "0032_match_reported_count_player_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="date_played",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_match_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="player",
+            index=models.Index(fields=["user", "-date_played", "-id"], name="player_user_date_idx"),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("games", "0033_player_date_played"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerRating",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("rating", models.FloatField(default=1500.0)),
+                ("matches_rated", models.PositiveIntegerField(default=0)),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="player_ratings", to="games.game"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="game_ratings",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["game", "-rating"], name="playerrating_game_rating_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="playerrating",
+            constraint=models.UniqueConstraint(fields=("user", "game"), name="playerrating_unique_user_game"),
+        ),
+    ]
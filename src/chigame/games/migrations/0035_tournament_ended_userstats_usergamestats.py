@@ -0,0 +1,118 @@
+# Generated by Django 4.2.4 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils import timezone
+
+
+def mark_ended_tournaments(apps, schema_editor):
+    # end_tournament clears the matches of the tournaments it ends
+    Tournament = apps.get_model("games", "Tournament")
+    Tournament.objects.filter(tournament_end_date__lt=timezone.now(), matches__isnull=True).update(ended=True)
+
+
+def count_stats(apps, schema_editor):
+    # As UserStats.rebuild does
+    Player = apps.get_model("games", "Player")
+    Tournament = apps.get_model("games", "Tournament")
+    UserStats = apps.get_model("games", "UserStats")
+    UserGameStats = apps.get_model("games", "UserGameStats")
+
+    results = (
+        Player.objects.filter(outcome__isnull=False, match__lobby__match_status=3)
+        .values("user_id", "match__game_id")
+        .order_by()
+        .annotate(played=Count("*"), won=Count("pk", filter=Q(outcome=0)), drawn=Count("pk", filter=Q(outcome=1)))
+    )
+    game_stats, stats = [], {}
+    for row in results.iterator():
+        user_id = row["user_id"]
+        game_stats.append(
+            UserGameStats(
+                user_id=user_id,
+                game_id=row["match__game_id"],
+                matches_played=row["played"],
+                wins=row["won"],
+                draws=row["drawn"],
+            )
+        )
+        user_stats = stats.setdefault(user_id, UserStats(user_id=user_id))
+        user_stats.matches_played += row["played"]
+        user_stats.wins += row["won"]
+        user_stats.draws += row["drawn"]
+    ended = Tournament.objects.filter(ended=True)
+    for through, field in (
+        (Tournament.players.through, "tournaments_played"),
+        (Tournament.winners.through, "tournaments_won"),
+    ):
+        counts = through.objects.filter(tournament__in=ended).values("user_id").order_by().annotate(count=Count("*"))
+        for user_id, count in counts.values_list("user_id", "count"):
+            setattr(stats.setdefault(user_id, UserStats(user_id=user_id)), field, count)
+    UserGameStats.objects.bulk_create(game_stats, batch_size=1000)
+    UserStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("games", "0034_playerrating"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tournament",
+            name="ended",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_ended_tournaments, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("matches_played", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                ("draws", models.PositiveIntegerField(default=0)),
+                ("tournaments_played", models.PositiveIntegerField(default=0)),
+                ("tournaments_won", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserGameStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("matches_played", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                ("draws", models.PositiveIntegerField(default=0)),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="user_stats", to="games.game"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="game_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="usergamestats",
+            constraint=models.UniqueConstraint(fields=("user", "game"), name="usergamestats_unique_user_game"),
+        ),
+        migrations.RunPython(count_stats, migrations.RunPython.noop),
+    ]
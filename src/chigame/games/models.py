@@ -1,14 +1,103 @@
+import functools
 import random
+import unicodedata
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
 
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
 from django.utils import timezone
 
 from chigame.users.models import Group, Notification, User
 
 
+def make_sort_name(name):
+    """
+    Returns the key games are sorted by name with: the name case-folded, without accents and with
+    whitespace collapsed, so that "Éclipse" sorts next to "eclipse" and before "Everdell".
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(without_accents.casefold().split())
+
+
+def name_starts_with(field, prefix):
+    """
+    Returns a Q matching the rows whose `field`, a name key made by make_sort_name, starts with
+    `prefix` (normalized the same way). It is written as a range rather than LIKE 'prefix%' so an
+    index on the field can answer it.
+    """
+    prefix = make_sort_name(prefix)
+    # Every string starting with the prefix sorts between it and the prefix plus the last code point
+    return Q(**{f"{field}__gte": prefix, f"{field}__lt": prefix + "\U0010ffff"})
+
+
+# Games store the player counts they support as a bitmask: bit N-1 is set if the game can be
+# played with N players, for N from 1 to 10, and the last bit if it can be played with more than 10.
+PLAYER_COUNT_BITS = 11
+
+
+def _player_count_bit(players):
+    return min(players, PLAYER_COUNT_BITS) - 1
+
+
+def player_count_mask(min_players, max_players):
+    """
+    Returns the bitmask of the player counts from `min_players` to `max_players`.
+    """
+    if not max_players or (min_players or 0) > max_players:
+        return 0
+    low = _player_count_bit(max(min_players or 1, 1))
+    high = _player_count_bit(max_players)
+    return (1 << (high + 1)) - (1 << low)
+
+
+def player_count_bits(players, or_more=False):
+    """
+    Returns the bits standing for `players` players (or, if `or_more`, for `players` or more).
+    """
+    bit = _player_count_bit(players)
+    if or_more:
+        return (1 << PLAYER_COUNT_BITS) - (1 << bit)
+    return 1 << bit
+
+
+@functools.lru_cache
+def _masks_including(bits):
+    # A game supports a contiguous range of player counts, so its mask is one of these
+    return [
+        (1 << (high + 1)) - (1 << low)
+        for low in range(PLAYER_COUNT_BITS)
+        for high in range(low, PLAYER_COUNT_BITS)
+        if ((1 << (high + 1)) - (1 << low)) & bits
+    ]
+
+
+def playable_with(players, or_more=False):
+    """
+    Returns the condition selecting the games playable with `players` players (or, if `or_more`,
+    with `players` or more).
+
+    The bitmask column can't be searched for a bit by an index, but since the player counts of a
+    game are a range, only a few dozen masks contain a given count. Looking them up with an IN on
+    the indexed column is a handful of index seeks, instead of the two-sided
+    min_players <= N <= max_players range that no single index serves well.
+    """
+    if players < 1:
+        return Q(pk__in=[])
+    condition = Q(player_counts__in=_masks_including(player_count_bits(players, or_more)))
+    if players >= PLAYER_COUNT_BITS and not or_more:
+        # The last bit covers every count above 10
+        condition &= Q(min_players__lte=players, max_players__gte=players)
+    return condition
+
+
 class Game(models.Model):
     """
     A game like Chess, Checkers, Go, etc.
@@ -16,6 +105,9 @@ class Game(models.Model):
 
     # ================ BASIC INFORMATION ================
     name = models.TextField()
+    # Set from the name on save (see make_sort_name). Sorting by this indexed column instead of
+    # Lower("name") lets the database read games in name order instead of sorting the whole table.
+    sort_name = models.TextField(blank=True, editable=False)
     description = models.TextField()
     year_published = models.IntegerField(null=True, blank=True)
 
@@ -30,6 +122,8 @@ class Game(models.Model):
 
     min_players = models.PositiveIntegerField()
     max_players = models.PositiveIntegerField()
+    # The supported player counts as a bitmask (see player_count_mask), set on save
+    player_counts = models.PositiveIntegerField(default=0, editable=False, db_index=True)
 
     suggested_age = models.PositiveSmallIntegerField(
         null=True, blank=True
@@ -46,8 +140,23 @@ class Game(models.Model):
     categories = models.ManyToManyField("Category", related_name="games", blank=True)
     mechanics = models.ManyToManyField("Mechanic", related_name="games", blank=True)
 
+    # Bayesian average of the ratings, recomputed in batch for the "top rated" sort (see ratings.py)
+    rating_score = models.FloatField(null=True, blank=True, editable=False)
+
     # ================ OTHER ================
-    BGG_id = models.PositiveIntegerField(null=True, blank=True)  # BoardGameGeek ID
+    # BoardGameGeek ID. Unique, so the same BGG game can't be imported twice (see Game.upsert)
+    BGG_id = models.PositiveIntegerField(null=True, blank=True, unique=True)
+
+    class Meta:
+        # One index per sort mode of the game grid. The id breaks ties (see games/pagination.py),
+        # so both directions of each sort are an index scan, and so is every later page.
+        indexes = [
+            models.Index(fields=["sort_name", "id"], name="game_sort_name_idx"),
+            models.Index(fields=["year_published", "id"], name="game_year_published_idx"),
+            models.Index(fields=["max_playtime", "id"], name="game_max_playtime_idx"),
+            models.Index(fields=["complexity", "id"], name="game_complexity_idx"),
+            models.Index(fields=["rating_score", "id"], name="game_rating_score_idx"),
+        ]
 
     # ================ VALIDATON ================
     def clean(self):
@@ -68,11 +177,91 @@ class Game(models.Model):
                 raise ValidationError({"expected_playtime": "expected_playtime cannot be greater than max_playtime"})
 
     def save(self, *args, **kwargs):
+        self.sort_name = make_sort_name(self.name)
+        self.player_counts = player_count_mask(self.min_players, self.max_players)
         # Calls full_clean to run all model validations, including the custom clean method and built-in field checks.
         # https://docs.djangoproject.com/en/stable/ref/models/instances/#django.db.models.Model.full_clean
         self.full_clean()
         super().save(*args, **kwargs)
 
+    # Fields an upsert leaves alone on existing games by default: the key, and computed scores
+    UPSERT_EXCLUDED_FIELDS = {"id", "BGG_id", "rating_score"}
+
+    @classmethod
+    def upsert(cls, games, update_fields=None, batch_size=None):
+        """
+        Inserts games, or updates the existing games with the same BGG_id, with one
+        INSERT ... ON CONFLICT (BGG_id) DO UPDATE statement per batch. Importing the same BGG game
+        twice therefore updates it rather than creating a duplicate. Every game must have a
+        BGG_id; if several have the same one, the last wins.
+
+        Like bulk_create, this doesn't call save(), so the games must already be valid, and
+        signals aren't sent. The fields save() computes are set here.
+
+        Args:
+            games (list of Game): the games to insert or update
+            update_fields (list of str): the fields to overwrite on existing games (by default,
+                all fields but UPSERT_EXCLUDED_FIELDS)
+            batch_size (int): the most games per statement (all at once by default)
+
+        Returns:
+            list of Game: the games, with the primary keys of the rows they were written to
+        """
+        if not games:
+            return games
+        for game in games:
+            game.sort_name = make_sort_name(game.name)
+            game.player_counts = player_count_mask(game.min_players, game.max_players)
+        if update_fields is None:
+            update_fields = [
+                field.name for field in cls._meta.concrete_fields if field.name not in cls.UPSERT_EXCLUDED_FIELDS
+            ]
+        else:
+            update_fields = list(dict.fromkeys([*update_fields, "sort_name", "player_counts"]))
+
+        # A statement can't update the same row twice
+        unique_games = list({game.BGG_id: game for game in games}.values())
+        cls.objects.bulk_create(
+            unique_games,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["BGG_id"],
+            update_fields=update_fields,
+        )
+        # bulk_create can't return the primary keys of updated rows, so they are read back
+        pks = dict(cls.objects.filter(BGG_id__in=[game.BGG_id for game in unique_games]).values_list("BGG_id", "pk"))
+        for game in games:
+            game.pk = pks[game.BGG_id]
+            game._state.adding = False
+            game._state.db = cls.objects.db
+        return games
+
+    @classmethod
+    def upsert_one(cls, game, update_fields=None):
+        """
+        Validates a game like save() does, upserts it by its BGG_id (see upsert) and sends
+        post_save, so the search and name indexes pick it up like a saved game. The BGG_id is
+        not checked for uniqueness: a game with the BGG_id of an existing game updates it.
+
+        Returns:
+            bool: whether the game was created rather than updated
+        """
+        game.full_clean(validate_unique=False)
+        with transaction.atomic():
+            # Only reported; the write is the upsert, so a concurrent insert of the same game
+            # can't make it fail or create a duplicate
+            created = not cls.objects.filter(BGG_id=game.BGG_id).exists()
+            cls.upsert([game], update_fields)
+            post_save.send(
+                sender=cls,
+                instance=game,
+                created=created,
+                update_fields=None,
+                raw=False,
+                using=game._state.db,
+            )
+        return created
+
     def __str__(self):
         return self.name
 
@@ -141,6 +330,58 @@ class Mechanic(models.Model):
         return self.name
 
 
+class SearchDocumentField(models.TextField):
+    """
+    The hidden column of an SQLite FTS5 table that carries the table's own name.
+    Filtering on it with the `match` lookup searches every indexed column at once.
+    https://www.sqlite.org/fts5.html#full_text_query_syntax
+    """
+
+
+@SearchDocumentField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class GameSearchDocument(models.Model):
+    """
+    A row of the full-text search index over games (an SQLite FTS5 virtual table).
+
+    The table is created by a migration and kept up to date by the signal handlers in
+    chigame/games/signals.py, so Django never manages it. Use chigame.games.search.search_games
+    rather than querying this model directly.
+    """
+
+    game = models.OneToOneField(
+        Game,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name="search_document",
+    )
+    name = models.TextField()
+    description = models.TextField()
+    categories = models.TextField()
+    mechanics = models.TextField()
+    people = models.TextField()
+    publishers = models.TextField()
+
+    # FTS5 hidden columns: the table-named column used for MATCH and the bm25 relevance rank
+    # (lower is more relevant). Both are only meaningful when the query has a MATCH constraint.
+    document = SearchDocumentField(db_column="games_game_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "games_game_fts"
+
+
 class Lobby(models.Model):
     """
     A lobby that users can join before starting a match.
@@ -156,16 +397,36 @@ class Lobby(models.Model):
     Modified_game = 2
     MODS = ((Default_game, "Default Game"), (Modified_game, "Modified Game"))
 
+    # The outcomes of join()
+    JOINED = "joined"
+    ALREADY_JOINED = "already joined"
+    FULL = "full"
+
     match_status = models.PositiveSmallIntegerField(choices=STATUS, default=1)
     name = models.TextField()
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     game_mod_status = models.PositiveSmallIntegerField(choices=MODS, default=1)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     members = models.ManyToManyField(User, related_name="lobbies")
+    # The number of members, kept by join() and leave() (and the m2m_changed signal for other changes)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
     min_players = models.PositiveIntegerField()
     max_players = models.PositiveIntegerField()
     time_constraint = models.PositiveIntegerField(default=300)
     lobby_created = models.DateTimeField(default=timezone.now)
+    # When the lobby closes: lobby_created plus time_constraint seconds, see expire()
+    expires_at = models.DateTimeField(editable=False)
+    # The name as normalized by make_sort_name, indexed for prefix filtering and sorting
+    sort_name = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        # The lobby list is sorted by creation time or name; the id breaks ties
+        indexes = [
+            models.Index(fields=["lobby_created", "id"], name="lobby_created_idx"),
+            models.Index(fields=["sort_name", "id"], name="lobby_sort_name_idx"),
+            # Only open lobbies expire, so only they are indexed
+            models.Index(fields=["expires_at"], condition=Q(match_status=1), name="lobby_open_expires_idx"),
+        ]
 
     # ================ VALIDATON ================
     def clean(self):
@@ -174,10 +435,92 @@ class Lobby(models.Model):
             raise ValidationError({"min_players": "min_players cannot be greater than max_players"})
 
     def save(self, *args, **kwargs):
+        self.sort_name = make_sort_name(self.name)
+        self.expires_at = self.lobby_created + timedelta(seconds=self.time_constraint)
         # Calls full_clean to run all validations before saving
         self.full_clean()
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            # The member count only changes with join() and leave(); writing back the count this
+            # copy was loaded with would undo the joins since
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "member_count"
+            ]
         super().save(*args, **kwargs)
 
+    def join(self, user):
+        """
+        Adds `user` to the lobby if it has a free seat, and marks the match as in progress once the
+        last seat is taken. The seat is claimed with a single conditional UPDATE, so concurrent
+        joins can't overfill the lobby.
+
+        Returns:
+            str: JOINED, ALREADY_JOINED or FULL
+        """
+        if self.members.filter(pk=user.pk).exists():
+            return self.ALREADY_JOINED
+        try:
+            with transaction.atomic():
+                seated = Lobby.objects.filter(pk=self.pk, member_count__lt=F("max_players")).update(
+                    member_count=F("member_count") + 1,
+                    # The condition sees the count from before the update
+                    match_status=Case(
+                        When(member_count=F("max_players") - 1, match_status=self.Lobbied, then=Value(self.Viewable)),
+                        default=F("match_status"),
+                        output_field=models.PositiveSmallIntegerField(),
+                    ),
+                )
+                if not seated:
+                    return self.FULL
+                # The through table is unique on (lobby, user), so a concurrent join by the same
+                # user fails here and gives its seat back with the rollback
+                Lobby.members.through.objects.create(lobby_id=self.pk, user_id=user.pk)
+        except IntegrityError:
+            return self.ALREADY_JOINED
+        return self.JOINED
+
+    def leave(self, user):
+        """
+        Removes `user` from the lobby, freeing their seat.
+
+        Returns:
+            bool: whether `user` was a member
+        """
+        with transaction.atomic():
+            removed, _ = Lobby.members.through.objects.filter(lobby_id=self.pk, user_id=user.pk).delete()
+            if removed:
+                Lobby.objects.filter(pk=self.pk).update(member_count=F("member_count") - removed)
+        return bool(removed)
+
+    @classmethod
+    def expire(cls, lobbies, now=None):
+        """
+        Closes the open lobbies among `lobbies` (a queryset) whose time is up, with a single
+        UPDATE: the match starts if enough players joined, and is cancelled otherwise.
+
+        Returns:
+            int: the number of lobbies closed
+        """
+        return lobbies.filter(match_status=cls.Lobbied, expires_at__lte=now or timezone.now()).update(
+            match_status=Case(
+                When(member_count__gte=F("min_players"), then=Value(cls.Viewable)),
+                default=Value(cls.Finished),
+                output_field=models.PositiveSmallIntegerField(),
+            )
+        )
+
+    @classmethod
+    def count_members(cls, lobby_ids=None):
+        """
+        Recomputes the member counts of the given lobbies (all lobbies if None) from their members.
+        """
+        lobbies = cls.objects.all() if lobby_ids is None else cls.objects.filter(pk__in=lobby_ids)
+        members = cls.members.through.objects.filter(lobby_id=models.OuterRef("pk")).order_by().values("lobby_id")
+        lobbies.update(
+            member_count=Coalesce(models.Subquery(members.annotate(count=models.Count("*")).values("count")), 0)
+        )
+
 
 class Match(models.Model):
     """
@@ -188,6 +531,16 @@ class Match(models.Model):
     lobby = models.OneToOneField(Lobby, on_delete=models.CASCADE)
     date_played = models.DateTimeField()
     players = models.ManyToManyField(User, through="Player")
+    # The number of players whose outcome is in, kept by results.record_match_results; the match
+    # is over once it reaches the lobby's member count
+    reported_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # The players keep a copy of the date for their match history, see Player.date_played
+            self.player_set.exclude(date_played=self.date_played).update(date_played=self.date_played)
 
 
 class Player(models.Model):
@@ -213,6 +566,212 @@ class Player(models.Model):
     role = models.TextField(blank=True, null=True)
     outcome = models.PositiveSmallIntegerField(choices=OUTCOMES, blank=True, null=True)
     victory_type = models.TextField(blank=True, null=True)
+    # The match's date_played, copied so a user's match history is read newest first from the
+    # (user, date_played) index alone. Set by save(); code creating players in bulk sets it itself
+    date_played = models.DateTimeField(editable=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["match", "user"], name="player_unique_match_user")]
+        indexes = [models.Index(fields=["user", "-date_played", "-id"], name="player_user_date_idx")]
+
+    def save(self, *args, **kwargs):
+        if self.date_played is None:
+            self.date_played = self.match.date_played
+        super().save(*args, **kwargs)
+
+    @property
+    def opponents(self):
+        """
+        The other players of the match (read with the match when match__player_set is prefetched,
+        see match_history).
+        """
+        return [player for player in self.match.player_set.all() if player.pk != self.pk]
+
+    @classmethod
+    def match_history(cls, user):
+        """
+        Returns the matches `user` played, as their Player rows, with each match's game and
+        players (with their users) read along, for a page of the history to take two queries.
+        Paginate it with MatchHistoryPaginator, which orders it newest first.
+        """
+        return (
+            cls.objects.filter(user=user)
+            .select_related("match__game")
+            .prefetch_related(
+                models.Prefetch("match__player_set", queryset=cls.objects.select_related("user").order_by("pk"))
+            )
+        )
+
+
+class PlayerRating(models.Model):
+    """
+    The Elo rating of a user at a game, updated as their matches of the game finish (see elo.py).
+    """
+
+    # The rating of a user before their first match of a game
+    INITIAL_RATING = 1500.0
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="game_ratings")
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="player_ratings")
+    rating = models.FloatField(default=INITIAL_RATING)
+    matches_rated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "game"], name="playerrating_unique_user_game")]
+        # The leaderboard of a game
+        indexes = [models.Index(fields=["game", "-rating"], name="playerrating_game_rating_idx")]
+
+    def __str__(self):
+        return f"{self.user} at {self.game}: {self.rating:.0f}"
+
+
+class UserGameStats(models.Model):
+    """
+    How many matches of a game a user played, won and drew (see UserStats).
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="game_stats")
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="user_stats")
+    matches_played = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    draws = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "game"], name="usergamestats_unique_user_game")]
+
+
+class UserStats(models.Model):
+    """
+    The match and tournament totals of a user, kept up to date as matches finish (see
+    results.py) and tournaments end, so showing them is a primary key lookup rather than counts
+    over the matches and tournaments. A match counts once its lobby is finished, for the
+    players with an outcome; a tournament once it has ended. The rebuild_user_stats command
+    recomputes the statistics from scratch.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    matches_played = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    draws = models.PositiveIntegerField(default=0)
+    tournaments_played = models.PositiveIntegerField(default=0)
+    tournaments_won = models.PositiveIntegerField(default=0)
+
+    MATCH_FIELDS = ["matches_played", "wins", "draws"]
+
+    @classmethod
+    def outcome_counts(cls, outcome):
+        """
+        Returns what a result with `outcome` adds to the MATCH_FIELDS.
+        """
+        if outcome is None:
+            return (0, 0, 0)
+        return (1, int(outcome == Player.WIN), int(outcome == Player.DRAW))
+
+    @classmethod
+    def count_results(cls, changes):
+        """
+        Updates the match statistics with changed results, given as (user id, game id, outcome
+        before, outcome after) for each player of a finished match (an outcome before of None
+        adds a result). Users with the same change are updated with a single UPDATE, so
+        concurrent changes don't overwrite each other.
+        """
+        totals = defaultdict(lambda: [0, 0, 0])
+        per_game = defaultdict(lambda: [0, 0, 0])
+        for user_id, game_id, before, after in changes:
+            for counts, key in ((totals, user_id), (per_game, (user_id, game_id))):
+                for i, (old, new) in enumerate(zip(cls.outcome_counts(before), cls.outcome_counts(after))):
+                    counts[key][i] += new - old
+
+        by_change = defaultdict(list)
+        for user_id, change in totals.items():
+            if any(change):
+                by_change[tuple(change)].append(user_id)
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in totals], ignore_conflicts=True)
+        for change, user_ids in by_change.items():
+            cls.objects.filter(user_id__in=user_ids).update(**cls._increments(change))
+
+        by_change = defaultdict(list)
+        for (user_id, game_id), change in per_game.items():
+            if any(change):
+                by_change[game_id, tuple(change)].append(user_id)
+        UserGameStats.objects.bulk_create(
+            [UserGameStats(user_id=user_id, game_id=game_id) for user_id, game_id in per_game], ignore_conflicts=True
+        )
+        for (game_id, change), user_ids in by_change.items():
+            UserGameStats.objects.filter(game_id=game_id, user_id__in=user_ids).update(**cls._increments(change))
+
+    @classmethod
+    def _increments(cls, change):
+        return {field: F(field) + count for field, count in zip(cls.MATCH_FIELDS, change) if count}
+
+    @classmethod
+    def count_tournament(cls, player_ids, winner_ids):
+        """
+        Counts an ended tournament for its players and winners.
+        """
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in player_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=player_ids).update(tournaments_played=F("tournaments_played") + 1)
+        if winner_ids:
+            cls.objects.filter(user_id__in=winner_ids).update(tournaments_won=F("tournaments_won") + 1)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recomputes every user's statistics from the matches and tournaments, with a few
+        aggregate queries.
+
+        Returns:
+            int: the number of users with statistics
+        """
+        results = (
+            Player.objects.filter(outcome__isnull=False, match__lobby__match_status=Lobby.Finished)
+            .values("user_id", "match__game_id")
+            .order_by()
+            .annotate(
+                played=models.Count("*"),
+                won=models.Count("pk", filter=Q(outcome=Player.WIN)),
+                drawn=models.Count("pk", filter=Q(outcome=Player.DRAW)),
+            )
+        )
+        ended = Tournament.objects.filter(ended=True)
+        played = Tournament.players.through.objects.filter(tournament__in=ended)
+        won = Tournament.winners.through.objects.filter(tournament__in=ended)
+
+        game_stats = []
+        stats = {}
+        for row in results.iterator():
+            user_id = row["user_id"]
+            game_stats.append(
+                UserGameStats(
+                    user_id=user_id,
+                    game_id=row["match__game_id"],
+                    matches_played=row["played"],
+                    wins=row["won"],
+                    draws=row["drawn"],
+                )
+            )
+            user_stats = stats.setdefault(user_id, cls(user_id=user_id))
+            user_stats.matches_played += row["played"]
+            user_stats.wins += row["won"]
+            user_stats.draws += row["drawn"]
+        for memberships, field in ((played, "tournaments_played"), (won, "tournaments_won")):
+            for user_id, count in (
+                memberships.values("user_id")
+                .order_by()
+                .annotate(count=models.Count("*"))
+                .values_list("user_id", "count")
+            ):
+                setattr(stats.setdefault(user_id, cls(user_id=user_id)), field, count)
+
+        with transaction.atomic():
+            UserGameStats.objects.all().delete()
+            cls.objects.all().delete()
+            UserGameStats.objects.bulk_create(game_stats, batch_size=1000)
+            cls.objects.bulk_create(stats.values(), batch_size=1000)
+        return len(stats)
+
+    def __str__(self):
+        return f"Stats of {self.user}: {self.wins} wins in {self.matches_played} matches"
 
 
 class MatchProposal(models.Model):
@@ -253,6 +812,7 @@ class Tournament(models.Model):
     draw_rules = models.TextField()  # not limited to 255 characters
     num_winner = models.PositiveIntegerField(default=1)  # number of possible winners for the tournament
     archived = models.BooleanField(default=False)  # whether the tournament is archived by the admin
+    ended = models.BooleanField(default=False, editable=False)  # whether end_tournament has run
 
     matches = models.ManyToManyField(Match, related_name="tournament", blank=True)
     winners = models.ManyToManyField(User, related_name="won_tournaments", blank=True)  # allow multiple winners
@@ -399,6 +959,37 @@ class Tournament(models.Model):
             + self.tournament_end_date.strftime("%m/%d/%Y")
         )
 
+    def seed_players(self, players: list[User]) -> list[User]:
+        """
+        Orders the players for the brackets (consecutive groups of game.max_players players) so
+        the strongest players, by their Elo rating at the game, meet as late as possible: the
+        players are dealt to the brackets from the highest rated down, in a snake order (1st,
+        2nd, ..., last bracket, then back from the last). Players with the same rating, such as
+        unrated ones, are shuffled.
+
+        Args:
+            players: the players to seed
+
+        Returns:
+            the players, in bracket order
+        """
+        ratings = dict(PlayerRating.objects.filter(game=self.game, user__in=players).values_list("user_id", "rating"))
+        players = list(players)
+        random.shuffle(players)
+        players.sort(key=lambda user: ratings.get(user.pk, PlayerRating.INITIAL_RATING), reverse=True)
+
+        size = self.game.max_players
+        brackets = [[] for _ in range(0, len(players), size)]
+        capacities = [min(size, len(players) - i) for i in range(0, len(players), size)]
+        order = list(range(len(brackets)))
+        seeds = iter(players)
+        while sum(map(len, brackets)) < len(players):
+            for index in order:
+                if len(brackets[index]) < capacities[index]:
+                    brackets[index].append(next(seeds))
+            order.reverse()
+        return [player for bracket in brackets for player in bracket]
+
     def create_tournaments_brackets(self) -> list[Match]:
         """
         Creates a list of brackets for the tournaments.
@@ -408,7 +999,7 @@ class Tournament(models.Model):
         """
         players = [player for player in self.players.all()]  # the players in the tournament
         brackets = []
-        random.shuffle(players)  # shuffle the players
+        players = self.seed_players(players)  # spread the strongest players over the brackets
         # Create a list of brackets (match assignment) for the tournament
         for i in range(0, len(players), self.game.max_players):
             game = self.game
@@ -426,7 +1017,7 @@ class Tournament(models.Model):
             players_in_match = players[i : i + self.game.max_players]
             match = Match.objects.create(game=game, lobby=lobby, date_played=self.tournament_start_date)
             # date_played is set to the start date of the tournament for now
-            match.players.set(players_in_match)
+            match.players.set(players_in_match, through_defaults={"date_played": match.date_played})
             match.save()
             brackets.append(match)
 
@@ -465,7 +1056,7 @@ class Tournament(models.Model):
         self.matches.clear()
 
         # create the matches of the next round
-        random.shuffle(players)
+        players = self.seed_players(players)
         next_round_brackets = []
         # Create a list of brackets (match assignment) for the tournament
         for i in range(0, len(brackets), self.game.max_players):
@@ -483,7 +1074,7 @@ class Tournament(models.Model):
             lobby.save()
             players_in_match = players[i : i + self.game.max_players]
             match = Match.objects.create(game=game, lobby=lobby, date_played=self.tournament_start_date)
-            match.players.set(players_in_match)
+            match.players.set(players_in_match, through_defaults={"date_played": match.date_played})
             match.save()
             next_round_brackets.append(match)
 
@@ -493,12 +1084,20 @@ class Tournament(models.Model):
 
     def end_tournament(self) -> None:
         """
-        Ends the tournament.
+        Ends the tournament, counting it in its players' statistics (see UserStats). Ending an
+        ended tournament does nothing.
 
         Returns:
             None
         """
-
+        with transaction.atomic():
+            # Claimed with a conditional UPDATE, so concurrent requests end the tournament once
+            if not Tournament.objects.filter(pk=self.pk, ended=False).update(ended=True):
+                return
+            self.ended = True
+            self._end_tournament()
+
+    def _end_tournament(self) -> None:
         winners = []
         brackets = self.matches.all()
         for bracket in brackets:  # the matches of the previous round
@@ -516,6 +1115,9 @@ class Tournament(models.Model):
         self.winners.set(winners)
         self.matches.clear()
         self.save()
+        UserStats.count_tournament(
+            list(self.players.values_list("pk", flat=True)), list({winner.pk for winner in winners})
+        )
 
         # Note: we don't delete the tournament because we want to keep it in the database
 
@@ -686,3 +1288,98 @@ class Review(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+def summarize_reviews(reviews):
+    """
+    Returns the fields of the ReviewSummary of each game in `reviews`, computed with a single
+    GROUP BY query.
+    """
+    star_counts = {
+        field: models.Count("pk", filter=Q(rating__gte=stars - Decimal("0.5"), rating__lt=stars + Decimal("0.5")))
+        for stars, field in enumerate(ReviewSummary.STAR_FIELDS, start=1)
+    }
+    return (
+        reviews.order_by()
+        .values("game_id")
+        .annotate(
+            review_count=models.Count("pk"),
+            rating_count=models.Count("rating"),
+            rating_sum=Coalesce(models.Sum("rating"), Decimal(0)),
+            **star_counts,
+        )
+    )
+
+
+class ReviewSummary(models.Model):
+    """
+    The review count and rating statistics of a game, kept up to date as reviews are saved and
+    deleted (see signals.py) so showing a game's rating never needs a scan over its reviews.
+    Reviews without a rating only count towards review_count.
+    """
+
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name="review_summary")
+    review_count = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Histogram of the ratings, rounded to the nearest star
+    one_star_count = models.PositiveIntegerField(default=0)
+    two_star_count = models.PositiveIntegerField(default=0)
+    three_star_count = models.PositiveIntegerField(default=0)
+    four_star_count = models.PositiveIntegerField(default=0)
+    five_star_count = models.PositiveIntegerField(default=0)
+
+    STAR_FIELDS = ["one_star_count", "two_star_count", "three_star_count", "four_star_count", "five_star_count"]
+
+    @property
+    def rating_mean(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @property
+    def histogram(self):
+        """
+        The number of ratings with 1 to 5 stars, as a list of 5 counts.
+        """
+        return [getattr(self, field) for field in self.STAR_FIELDS]
+
+    @classmethod
+    def star_field(cls, rating):
+        """
+        Returns the histogram field counting `rating` (a rating from 1 to 5, rounded half up).
+        """
+        stars = min(max(int(rating + Decimal("0.5")), 1), 5)
+        return cls.STAR_FIELDS[stars - 1]
+
+    @classmethod
+    def add_review(cls, game_id, rating, count=1):
+        """
+        Adds a review with `rating` (which may be None) to the summary of a game, or removes one
+        if `count` is -1. The counters are updated in the database with a single UPDATE, so
+        concurrent reviews don't overwrite each other.
+        """
+        changes = {"review_count": F("review_count") + count}
+        if rating is not None:
+            star_field = cls.star_field(rating)
+            changes["rating_count"] = F("rating_count") + count
+            changes["rating_sum"] = F("rating_sum") + count * rating
+            changes[star_field] = F(star_field) + count
+
+        # A game gets its summary with its first review; without one there is nothing to remove
+        if not cls.objects.filter(game_id=game_id).update(**changes) and count > 0:
+            cls.objects.get_or_create(game_id=game_id)
+            cls.objects.filter(game_id=game_id).update(**changes)
+
+    @classmethod
+    def rebuild(cls, game_ids=None):
+        """
+        Recomputes the summaries of the given games (all games if None) from their reviews.
+        """
+        summaries = cls.objects.all() if game_ids is None else cls.objects.filter(game_id__in=game_ids)
+        reviews = Review.objects.all() if game_ids is None else Review.objects.filter(game_id__in=game_ids)
+        summaries.delete()
+        cls.objects.bulk_create((cls(**values) for values in summarize_reviews(reviews)), batch_size=500)
+
+    def __str__(self):
+        return f"Review summary for game {self.game_id}: {self.rating_mean} ({self.rating_count} ratings)"
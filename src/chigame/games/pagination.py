@@ -0,0 +1,246 @@
+"""
+Keyset (cursor) pagination for game listings and match histories.
+
+Page-number pagination runs a COUNT(*) and an OFFSET that makes the database walk past every
+earlier row, so deep pages get slower and slower. Keyset pagination instead remembers the sort
+value and id of the last row shown, and asks for the rows that come after it:
+
+    WHERE year_published >= 1995 AND (year_published > 1995 OR id > 42)
+    ORDER BY year_published, id LIMIT 21
+
+which, with an index on (year_published, id), is an index seek that costs the same on every
+page (the redundant ">=" is what lets the database seek instead of scanning the index from the
+start). The position is handed to the client as an opaque cursor
+token, used by both the game grid and the REST API.
+https://use-the-index-luke.com/no-offset
+
+A user's match history is paginated the same way, newest first, from the (user, date_played, id)
+index on Player (see MatchHistoryPaginator).
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import F, Q
+
+from .models import Game
+
+# Name of the annotation holding the value each game is sorted by
+SORT_VALUE = "sort_value"
+
+# Fields of Game that "<field>-asc" / "<field>-desc" sort parameters may refer to
+SORTABLE_FIELDS = {
+    field.name for field in Game._meta.concrete_fields if not field.is_relation and not field.primary_key
+}
+
+
+def get_sort_key(sort_param):
+    """
+    Returns what a sort parameter of the game grid sorts by.
+
+    Args:
+        sort_param (str): e.g. "name-asc", "year_published-desc" or "relevance" (search results);
+            None or an unknown field sorts by id
+
+    Returns:
+        (Expression, bool): the expression to sort by, and whether the order is descending
+    """
+    if sort_param == "relevance":
+        # search_rank is annotated by search_games / fuzzy_search_games; lower is more relevant
+        return F("search_rank"), False
+
+    if sort_param and "-" in sort_param:
+        sort_field, sort_direction = sort_param.rsplit("-", 1)
+        descending = sort_direction == "desc"
+        if sort_field == "name":
+            return F("sort_name"), descending
+        if sort_field in SORTABLE_FIELDS:
+            return F(sort_field), descending
+
+    return F("pk"), False
+
+
+def resolve_sort(queryset, sort_param, default="name-asc"):
+    """
+    Returns the sort parameter to use for `queryset`: "relevance" only applies to search results
+    (querysets annotated with search_rank), and sorts anything else by `default`.
+    """
+    if sort_param == "relevance" and "search_rank" not in queryset.query.annotations:
+        return default
+    return sort_param
+
+
+def sort_queryset(queryset, sort_param):
+    """
+    Orders `queryset` by a sort parameter of the game grid, breaking ties by id so the order is
+    total (which keyset pagination requires). Games without a value (e.g. an unknown year of
+    publication) sort as the smallest value: first in ascending order, last in descending order.
+    That is where an index keeps them, so both directions can be read straight from the
+    (field, id) indexes on Game.
+
+    The queryset is annotated with the sort value (see SORT_VALUE).
+    """
+    sort_param = resolve_sort(queryset, sort_param)
+    expression, descending = get_sort_key(sort_param)
+    queryset = queryset.annotate(**{SORT_VALUE: expression})
+    if descending:
+        return queryset.order_by(F(SORT_VALUE).desc(nulls_last=True), "-pk")
+    return queryset.order_by(F(SORT_VALUE).asc(nulls_first=True), "pk")
+
+
+def encode_cursor(sort_param, value, pk, backwards=False):
+    """
+    Returns an opaque token for the position just after (or, if `backwards`, just before)
+    the game with id `pk` and sort value `value`.
+    """
+    if isinstance(value, Decimal):
+        value = str(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    position = {"s": sort_param, "v": value, "pk": pk, "b": backwards}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, sort_param):
+    """
+    Returns the position encoded by `encode_cursor` as (value, pk, backwards), or None if the
+    token is missing, malformed, or was made for a different sort order.
+    """
+    if not token:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if position["s"] != sort_param:
+            return None
+        return position["v"], int(position["pk"]), bool(position["b"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+
+
+def _position_filters(value, pk, descending, backwards, nullable=True):
+    """
+    Returns the conditions selecting the rows after (or, if `backwards`, before) the row with
+    sort value `value` and id `pk`, in the order built by sort_queryset.
+
+    NULL sort values are a separate segment at the small end of the order, which a single
+    range condition cannot cover. Each condition returned is a range of the sort index, and
+    together they list the rows in order: the rows matching the first come before those
+    matching the second. If the sort value can't be NULL (not `nullable`), there is only one.
+    """
+    # Whether the rows wanted are towards larger sort values
+    towards_larger = descending == backwards
+    beyond, or_equal = ("gt", "gte") if towards_larger else ("lt", "lte")
+    is_null = Q(**{f"{SORT_VALUE}__isnull": True})
+    if value is None:
+        same_value = is_null & Q(**{f"pk__{beyond}": pk})
+        return [same_value, Q(**{f"{SORT_VALUE}__isnull": False})] if towards_larger else [same_value]
+    after = Q(**{f"{SORT_VALUE}__{or_equal}": value}) & (
+        Q(**{f"{SORT_VALUE}__{beyond}": value}) | Q(**{f"pk__{beyond}": pk})
+    )
+    return [after] if towards_larger or not nullable else [after, is_null]
+
+
+class KeysetPage:
+    """
+    A page of results from KeysetPaginator. Iterating over it yields the rows on the page.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginates games in the order given by a sort parameter of the game grid (see get_sort_key),
+    using opaque cursor tokens instead of page numbers.
+    """
+
+    # Whether rows may have no sort value
+    nullable = True
+
+    def __init__(self, queryset, sort_param, per_page):
+        self.queryset = queryset
+        self.sort_param = resolve_sort(queryset, sort_param)
+        self.per_page = per_page
+
+    def page(self, cursor):
+        """
+        Returns the page at `cursor`, a token from a previous page's next_cursor or
+        previous_cursor. A missing or invalid cursor returns the first page.
+        """
+        position = decode_cursor(cursor, self.sort_param)
+        queryset, descending = self.order(self.queryset)
+
+        # One extra row tells us whether there is anything beyond this page
+        wanted = self.per_page + 1
+        backwards = False
+        if position is None:
+            rows = list(queryset[:wanted])
+        else:
+            value, pk, backwards = position
+            if backwards:
+                queryset = queryset.reverse()
+            rows = []
+            for condition in _position_filters(value, pk, descending, backwards, self.nullable):
+                rows.extend(queryset.filter(condition)[: wanted - len(rows)])
+                if len(rows) == wanted:
+                    break
+
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+
+        has_next = True if backwards else has_more
+        has_previous = has_more if backwards else position is not None
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self._cursor(rows[-1], backwards=False) if has_next and rows else None,
+            previous_cursor=self._cursor(rows[0], backwards=True) if has_previous and rows else None,
+        )
+
+    def order(self, queryset):
+        """
+        Returns `queryset` in the order of the pages, annotated with the sort value (see
+        sort_queryset), and whether that order is descending.
+        """
+        _, descending = get_sort_key(self.sort_param)
+        return sort_queryset(queryset, self.sort_param), descending
+
+    def _cursor(self, game, backwards):
+        return encode_cursor(self.sort_param, getattr(game, SORT_VALUE), game.pk, backwards)
+
+
+class MatchHistoryPaginator(KeysetPaginator):
+    """
+    Paginates a user's match history (see Player.match_history), newest match first, using
+    cursor tokens like KeysetPaginator.
+    """
+
+    sort = "date_played-desc"
+    nullable = False
+
+    def __init__(self, queryset, per_page):
+        super().__init__(queryset, self.sort, per_page)
+
+    def order(self, queryset):
+        queryset = queryset.annotate(**{SORT_VALUE: F("date_played")})
+        return queryset.order_by(F(SORT_VALUE).desc(), "-pk"), True
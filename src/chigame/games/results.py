@@ -0,0 +1,158 @@
+"""
+Records the outcomes of matches, many at a time.
+
+A batch of results (each one a lobby and the outcomes of some of its members) is recorded in a
+single transaction with a fixed number of queries, however many matches and players it holds:
+
+1. the matches of the lobbies are read, locked so concurrent reports for the same match wait for
+   each other, and those missing are created with one bulk insert;
+2. the players already in those matches are read, and the results update them with one bulk
+   UPDATE or add them with one bulk insert;
+3. each match's reported_count (how many of its players have an outcome) is brought up to date,
+   with one UPDATE per size of change, and the lobbies whose every member has reported are
+   finished, updating their players' ratings (see elo.py) and statistics (see UserStats).
+   Changing a result of a match that had already finished corrects the statistics, and
+   replays the ratings at its game.
+
+Counting the reports as they come in means telling whether a match is over doesn't count its
+players and members again after every report.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .elo import rate_matches, rerate_games
+from .lobby_events import publish_lobby_events
+from .models import Lobby, Match, Player, UserStats
+
+# The fields of a player that a result can set
+RESULT_FIELDS = ("outcome", "team", "role", "victory_type")
+
+# Rows per bulk query
+BATCH_SIZE = 500
+
+
+def record_match_results(results, now=None):
+    """
+    Records the outcomes of matches, finishing the lobbies whose every member has reported.
+
+    Args:
+        results (list): one dict per match, with the "lobby" (a Lobby) it was played in, the
+            date it was played on ("date_played", `now` or the current time by default, only used
+            for new matches), and its "players": dicts giving the "user_id" and the RESULT_FIELDS
+            to set. A player reported again has their result replaced. Results of cancelled
+            lobbies are ignored.
+
+    Returns:
+        dict: the numbers of players "created" and "updated", and the ids of the lobbies
+        "finished" by these results
+    """
+    now = now or timezone.now()
+    lobbies = {result["lobby"].pk: result for result in results}
+    summary = {"created": 0, "updated": 0, "finished": []}
+    if not lobbies:
+        return summary
+
+    with transaction.atomic():
+        matches = lock_matches(list(lobbies))
+        # A finished lobby without a match was cancelled (see Lobby.expire): it wasn't played
+        for lobby_id in lobbies.keys() - matches.keys():
+            if lobbies[lobby_id]["lobby"].match_status == Lobby.Finished:
+                del lobbies[lobby_id]
+        missing = lobbies.keys() - matches.keys()
+        if missing:
+            Match.objects.bulk_create(
+                [
+                    Match(
+                        game_id=lobbies[lobby_id]["lobby"].game_id,
+                        lobby_id=lobby_id,
+                        date_played=lobbies[lobby_id].get("date_played") or now,
+                    )
+                    for lobby_id in missing
+                ],
+                batch_size=BATCH_SIZE,
+                # Created by a concurrent report meanwhile; read back below either way
+                ignore_conflicts=True,
+            )
+            matches.update(lock_matches(missing))
+
+        existing = {
+            (player.match_id, player.user_id): player
+            for player in Player.objects.filter(match_id__in=[match[0] for match in matches.values()]).only(
+                "match_id", "user_id", *RESULT_FIELDS
+            )
+        }
+        created, updated = [], []
+        reported = defaultdict(int)  # The change in the number of players with an outcome, by match id
+        corrections = []  # The changed results of finished matches, for the players' statistics
+        corrected_games = set()  # The games whose ratings these changes invalidate
+        for lobby_id, result in lobbies.items():
+            match_id, date_played, game_id, lobby_status = matches[lobby_id]
+            for player_result in result["players"]:
+                player = existing.get((match_id, player_result["user_id"]))
+                if player is None:
+                    player = Player(match_id=match_id, user_id=player_result["user_id"], date_played=date_played)
+                    created.append(player)
+                else:
+                    updated.append(player)
+                outcome_before = player.outcome
+                for field in RESULT_FIELDS:
+                    if field in player_result:
+                        setattr(player, field, player_result[field])
+                reported[match_id] += (player.outcome is not None) - (outcome_before is not None)
+                if lobby_status == Lobby.Finished:
+                    corrections.append((player.user_id, game_id, outcome_before, player.outcome))
+                    if player.outcome != outcome_before:
+                        corrected_games.add(game_id)
+
+        Player.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        if updated:
+            Player.objects.bulk_update(updated, RESULT_FIELDS, batch_size=BATCH_SIZE)
+
+        # The matches whose count changes by the same amount are updated with one UPDATE
+        by_count = defaultdict(list)
+        for match_id, count in reported.items():
+            if count:
+                by_count[count].append(match_id)
+        for count, match_ids in by_count.items():
+            Match.objects.filter(pk__in=match_ids).update(reported_count=F("reported_count") + count)
+
+        finished = list(
+            Lobby.objects.filter(pk__in=list(lobbies), match__reported_count__gte=F("member_count"))
+            .exclude(match_status=Lobby.Finished)
+            .values_list("pk", flat=True)
+        )
+        if finished:
+            Lobby.objects.filter(pk__in=finished).update(match_status=Lobby.Finished)
+            finished_matches = [matches[lobby_id][0] for lobby_id in finished]
+            rate_matches(finished_matches)
+            corrections.extend(
+                (user_id, game_id, None, outcome)
+                for user_id, game_id, outcome in Player.objects.filter(
+                    match_id__in=finished_matches, outcome__isnull=False
+                ).values_list("user_id", "match__game_id", "outcome")
+            )
+            publish_lobby_events("status", finished)
+        if corrected_games:
+            rerate_games(corrected_games)
+        if corrections:
+            UserStats.count_results(corrections)
+
+    summary.update(created=len(created), updated=len(updated), finished=finished)
+    return summary
+
+
+def lock_matches(lobby_ids):
+    """
+    Returns the id, date and game of the matches of the given lobbies, and the match status of
+    their lobby, by lobby id, locking them until the end of the transaction (in a fixed order, so
+    concurrent reports can't deadlock).
+    """
+    matches = Match.objects.select_for_update().filter(lobby_id__in=lobby_ids).order_by("pk")
+    return {
+        lobby_id: match
+        for lobby_id, *match in matches.values_list("lobby_id", "pk", "date_played", "game_id", "lobby__match_status")
+    }
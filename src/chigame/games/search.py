@@ -0,0 +1,165 @@
+"""
+Full-text search over the game catalog.
+
+On SQLite the catalog is indexed in an FTS5 virtual table (see GameSearchDocument) holding one
+document per game with its name, description, categories, mechanics, people and publishers.
+Searching it is a single indexed MATCH instead of a four-way join with leading-wildcard LIKEs,
+and the results come back ranked by relevance (bm25).
+https://www.sqlite.org/fts5.html
+
+The index is kept current by the signal handlers in chigame/games/signals.py. After loading data
+with signals disabled (e.g. bulk imports), run `python manage.py rebuild_search_index`.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import Game, GameSearchDocument, Person, Publisher
+
+# SQLite limits the number of variables in a single statement, so ids are processed in chunks
+INDEX_BATCH_SIZE = 500
+
+
+def search_index_enabled():
+    """
+    Returns True if the database supports the FTS5 search index (i.e. we are running on SQLite).
+    """
+    return connection.vendor == "sqlite"
+
+
+def build_match_expression(query):
+    """
+    Turns free text typed by a user into an FTS5 query string.
+
+    Every word becomes a quoted prefix query ("cat"* matches "Catan"), and words are implicitly
+    ANDed together. Quoting each word means FTS5 operators typed by the user (AND, NEAR, *, ...)
+    are treated as plain text instead of raising a syntax error.
+
+    Args:
+        query (str): the text entered in the search bar
+
+    Returns:
+        str: the FTS5 query, or an empty string if the query has no searchable words
+    """
+    words = re.findall(r"\w+", query or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_games(query, queryset=None):
+    """
+    Returns the games matching `query`, most relevant first.
+
+    The queryset is annotated with `search_rank` (lower is more relevant), so callers can still
+    apply their own sorting and filtering on top of it.
+
+    Args:
+        query (str): the text entered in the search bar
+        queryset (QuerySet): the games to search in; defaults to every game
+
+    Returns:
+        QuerySet: the matching games
+    """
+    if queryset is None:
+        queryset = Game.objects.all()
+
+    match_expression = build_match_expression(query)
+    if not match_expression:
+        return queryset.none()
+
+    if not search_index_enabled():
+        # Without FTS5 we fall back to the (slow, unranked) join over the related names
+        return queryset.filter(
+            Q(name__icontains=query)
+            | Q(categories__name__icontains=query)
+            | Q(people__name__icontains=query)
+            | Q(publishers__name__icontains=query)
+        ).distinct()
+
+    return (
+        queryset.filter(search_document__document__match=match_expression)
+        .annotate(search_rank=F("search_document__rank"))
+        .order_by("search_rank")
+    )
+
+
+def _related_names_sql(through_model, target_field):
+    """
+    Returns a correlated subquery that concatenates the names of every object linked to
+    the game being indexed through `through_model` (e.g. the names of all its categories).
+    """
+    through_table = through_model._meta.db_table
+    target = through_model._meta.get_field(target_field)
+    target_table = target.related_model._meta.db_table
+    return (
+        f"(SELECT group_concat(t.name, ' ') FROM {through_table} m "
+        f"INNER JOIN {target_table} t ON t.id = m.{target.column} "
+        f"WHERE m.game_id = g.id)"
+    )
+
+
+def _index_insert_sql(where_clause):
+    return (
+        f"INSERT INTO {GameSearchDocument._meta.db_table} "
+        "(rowid, name, description, categories, mechanics, people, publishers) "
+        "SELECT g.id, g.name, g.description, "
+        f"{_related_names_sql(Game.categories.through, 'category')}, "
+        f"{_related_names_sql(Game.mechanics.through, 'mechanic')}, "
+        f"{_related_names_sql(Person.games.through, 'person')}, "
+        f"{_related_names_sql(Publisher.games.through, 'publisher')} "
+        f"FROM {Game._meta.db_table} g {where_clause}"
+    )
+
+
+def index_games(game_ids):
+    """
+    (Re)builds the search documents of the given games. Ids of games that no longer exist
+    are simply removed from the index.
+
+    Args:
+        game_ids (iterable of int): the ids of the games to index
+    """
+    if not search_index_enabled():
+        return
+
+    game_ids = list(set(game_ids))
+    table = GameSearchDocument._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(game_ids), INDEX_BATCH_SIZE):
+            batch = game_ids[start : start + INDEX_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders})", batch)
+            cursor.execute(_index_insert_sql(f"WHERE g.id IN ({placeholders})"), batch)
+
+
+def remove_games(game_ids):
+    """
+    Removes the given games from the search index.
+
+    Args:
+        game_ids (iterable of int): the ids of the games to remove
+    """
+    if not search_index_enabled():
+        return
+
+    game_ids = list(set(game_ids))
+    table = GameSearchDocument._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(game_ids), INDEX_BATCH_SIZE):
+            batch = game_ids[start : start + INDEX_BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(f"DELETE FROM {table} WHERE rowid IN ({placeholders})", batch)
+
+
+def rebuild_search_index():
+    """
+    Drops every search document and re-indexes the whole catalog in one statement.
+    """
+    if not search_index_enabled():
+        return
+
+    table = GameSearchDocument._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(_index_insert_sql(""))
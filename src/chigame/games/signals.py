@@ -0,0 +1,141 @@
+"""
+Signal handlers that keep denormalized game data (such as the full-text search index)
+in sync with the models. They are connected in GamesConfig.ready().
+https://docs.djangoproject.com/en/4.2/topics/signals/
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocomplete import invalidate_autocomplete_index
+from .bgg_links import invalidate_name_maps
+from .facets import invalidate_facet_index
+from .fuzzy import invalidate_game_name_index
+from .models import Category, Game, Lobby, Mechanic, Person, Publisher, Review, ReviewSummary
+from .search import index_games, remove_games
+
+
+# =============== Full-text search index ===============
+@receiver(post_save, sender=Game)
+def index_saved_game(sender, instance, **kwargs):
+    index_games([instance.pk])
+
+
+@receiver(post_delete, sender=Game)
+def unindex_deleted_game(sender, instance, **kwargs):
+    remove_games([instance.pk])
+
+
+@receiver(m2m_changed, sender=Game.categories.through)
+@receiver(m2m_changed, sender=Game.mechanics.through)
+@receiver(m2m_changed, sender=Person.games.through)
+@receiver(m2m_changed, sender=Publisher.games.through)
+def index_relinked_games(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Re-indexes the affected games when categories, mechanics, people or publishers are
+    linked to or unlinked from them, from either side of the relation.
+    """
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+
+    if isinstance(instance, Game):
+        if action != "pre_clear":
+            index_games([instance.pk])
+    elif action == "pre_clear":
+        # After a clear from the other side we can no longer tell which games were linked,
+        # so they are collected beforehand and re-indexed once the clear has happened
+        instance._search_cleared_game_ids = list(instance.games.values_list("pk", flat=True))
+    elif action == "post_clear":
+        index_games(getattr(instance, "_search_cleared_game_ids", []))
+    else:
+        index_games(pk_set)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Mechanic)
+@receiver(post_save, sender=Person)
+@receiver(post_save, sender=Publisher)
+def index_renamed_games(sender, instance, created, raw, **kwargs):
+    """
+    Re-indexes the games linked to a category, mechanic, person or publisher, since its name
+    is part of their search documents. Fixture loading (raw saves) is skipped: the fixtures are
+    loaded on every startup and never change which games match a search.
+    """
+    if created or raw:
+        return
+    index_games(instance.games.values_list("pk", flat=True))
+
+
+# =============== In-memory name indexes ===============
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def invalidate_game_name_indexes(sender, instance, **kwargs):
+    invalidate_game_name_index()
+    invalidate_autocomplete_index()
+    invalidate_facet_index()
+
+
+@receiver(m2m_changed, sender=Game.categories.through)
+@receiver(m2m_changed, sender=Game.mechanics.through)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Mechanic)
+def invalidate_game_facets(sender, **kwargs):
+    if kwargs.get("raw") or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    invalidate_facet_index()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Mechanic)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Mechanic)
+def invalidate_category_and_mechanic_names(sender, **kwargs):
+    invalidate_name_maps()
+
+
+# =============== Review summaries ===============
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw, **kwargs):
+    # The game and rating before an edit, so the edit can be applied to the summary as a change
+    instance._previous_rating = None
+    if not raw and instance.pk is not None:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list("game_id", "rating").first()
+
+
+@receiver(post_save, sender=Review)
+def summarize_saved_review(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_rating", None)
+    if previous == (instance.game_id, instance.rating):
+        return
+    if previous is not None:
+        ReviewSummary.add_review(*previous, count=-1)
+    ReviewSummary.add_review(instance.game_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def summarize_deleted_review(sender, instance, **kwargs):
+    ReviewSummary.add_review(instance.game_id, instance.rating, count=-1)
+
+
+# =============== Lobby member counts ===============
+@receiver(m2m_changed, sender=Lobby.members.through)
+def count_lobby_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Recounts the members of the affected lobbies when members are added or removed other than
+    through Lobby.join() and Lobby.leave() (which keep the count themselves), e.g. by the admin,
+    the API or from the user's side of the relation.
+    """
+    if action not in ("post_add", "post_remove", "post_clear", "pre_clear"):
+        return
+
+    if isinstance(instance, Lobby):
+        if action != "pre_clear":
+            Lobby.count_members([instance.pk])
+    elif action == "pre_clear":
+        instance._cleared_lobby_ids = list(instance.lobbies.values_list("pk", flat=True))
+    elif action == "post_clear":
+        Lobby.count_members(getattr(instance, "_cleared_lobby_ids", []))
+    else:
+        Lobby.count_members(pk_set)
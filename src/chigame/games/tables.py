@@ -6,8 +6,13 @@ from .models import Lobby
 
 
 class LobbyTable(tables.Table):
+    # Sorting by name uses the indexed sort name
+    name = tables.Column(order_by=("sort_name", "id"))
     match_status = tables.Column(verbose_name="Match Status")
     game_mod_status = tables.Column(verbose_name="Game Modifications")
+    # Annotated by lobby_list
+    member_count = tables.Column(verbose_name="Players", orderable=False)
+    open_seats = tables.Column(verbose_name="Open Seats", orderable=False)
     created_by = tables.Column(verbose_name="Created By")
     lobby_created = tables.Column(verbose_name="Creation Time")
 
@@ -15,7 +20,10 @@ class LobbyTable(tables.Table):
         url = reverse("lobby-details", args=[record.pk])
         return format_html('<a href="{}">{}</a>', url, value)
 
+    def render_member_count(self, value, record):
+        return f"{value} / {record.max_players}"
+
     class Meta:
         model = Lobby
         template_name = "django_tables2/bootstrap.html"
-        fields = ("name", "game", "match_status", "game_mod_status", "created_by")
+        fields = ("name", "game", "match_status", "game_mod_status", "member_count", "open_seats", "created_by")
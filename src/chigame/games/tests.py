@@ -0,0 +1,1433 @@
+import asyncio
+import io
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+from asgiref.sync import sync_to_async
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from chigame.api.tests.factories import (
+    CategoryFactory,
+    GameFactory,
+    LobbyFactory,
+    MechanicFactory,
+    TournamentFactory,
+    UserFactory,
+)
+from chigame.games import bgg, bgg_cache, matchmaking
+from chigame.games.asgi import LobbyEventsRouter
+from chigame.games.bgg_links import link_games
+from chigame.games.bgg_sync import TokenBucket
+from chigame.games.bulk_import import iter_json_array
+from chigame.games.elo import K_FACTOR, match_waves, replay_elo
+from chigame.games.facets import FacetIndex, filter_by_facets, get_facets
+from chigame.games.fuzzy import fuzzy_search_games
+from chigame.games.lobby_events import get_backend, lobby_channel, publish_lobby_events
+from chigame.games.lobby_timers import expire_lobbies, seconds_until_next_expiry
+from chigame.games.matchmaking import MATCHED, QUEUED, Matchmaker
+from chigame.games.models import (
+    Category,
+    Game,
+    Lobby,
+    Match,
+    Mechanic,
+    Person,
+    Player,
+    PlayerRating,
+    Review,
+    ReviewSummary,
+    UserGameStats,
+    UserStats,
+    make_sort_name,
+    name_starts_with,
+    playable_with,
+)
+from chigame.games.pagination import (
+    KeysetPaginator,
+    MatchHistoryPaginator,
+    _position_filters,
+    get_sort_key,
+    sort_queryset,
+)
+from chigame.games.ratings import PRIOR_WEIGHT, recompute_rating_scores
+from chigame.games.results import record_match_results
+from chigame.games.search import search_games
+from chigame.users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+# =============== Full-text search ===============
+def test_search_matches_name_prefix_and_related_names():
+    catan = GameFactory(name="Catan", description="Trade and build.")
+    ticket = GameFactory(name="Ticket to Ride", description="Collect trains.")
+    ticket.categories.add(CategoryFactory(name="Trains"))
+    designer = Person.objects.create(name="Klaus Teuber", person_role=Person.DESIGNER)
+    designer.games.add(catan)
+
+    assert list(search_games("cata")) == [catan]
+    assert list(search_games("trains")) == [ticket]
+    assert list(search_games("teuber")) == [catan]
+    assert list(search_games("")) == []
+
+
+def test_search_ranks_name_matches_first():
+    in_description = GameFactory(name="Alpha", description="A game about dragons and treasure.")
+    in_name = GameFactory(name="Dragons", description="Roll dice.")
+
+    assert list(search_games("dragons")) == [in_name, in_description]
+
+
+def test_search_index_follows_updates_and_deletes():
+    game = GameFactory(name="Azul")
+    game.name = "Patchwork"
+    game.save()
+
+    assert list(search_games("azul")) == []
+    assert list(search_games("patchwork")) == [game]
+
+    game.delete()
+    assert list(search_games("patchwork")) == []
+
+
+def test_search_results_view(client):
+    game = GameFactory(name="Carcassonne")
+    GameFactory(name="Chess")
+
+    response = client.get(reverse("game-search-results"), {"q": "carcass"})
+
+    assert response.status_code == 200
+    assert list(response.context["page_obj"]) == [game]
+
+
+# =============== Fuzzy search ===============
+def test_fuzzy_search_tolerates_typos():
+    catan = GameFactory(name="Catan")
+    ticket = GameFactory(name="Ticket to Ride")
+    GameFactory(name="Chess")
+
+    assert list(fuzzy_search_games("Catn")) == [catan]
+    assert list(fuzzy_search_games("Ticket to Rid")) == [ticket]
+    assert list(fuzzy_search_games("xyz")) == []
+
+
+def test_fuzzy_search_api_filter(client):
+    catan = GameFactory(name="Catan")
+    GameFactory(name="Chess")
+
+    response = client.get(reverse("api-game-list"), {"name": "Catn", "fuzzy": "1"})
+    assert [game["id"] for game in response.data["results"]] == [catan.id]
+
+    response = client.get(reverse("api-game-list"), {"name": "Catn"})
+    assert response.data["results"] == []
+
+
+# =============== Keyset pagination ===============
+@pytest.mark.parametrize("sort", ["name-asc", "name-desc", "year_published-asc", "year_published-desc"])
+def test_keyset_pagination_walks_every_game_once(sort):
+    for year in [2001, 2001, None, 1999, None, 2010, 2001]:
+        GameFactory(year_published=year)
+    paginator = KeysetPaginator(Game.objects.all(), sort, 3)
+
+    seen = []
+    page = paginator.page(None)
+    pages = [page]
+    while page.has_next:
+        page = paginator.page(page.next_cursor)
+        pages.append(page)
+    for page in pages:
+        seen.extend(game.pk for game in page)
+    assert seen == [game.pk for game in sort_queryset(Game.objects.all(), sort)]
+    assert len(seen) == Game.objects.count()
+
+    # walking back from the last page gives the same pages in reverse
+    previous = pages[-1]
+    for expected in reversed(pages[:-1]):
+        previous = paginator.page(previous.previous_cursor)
+        assert [game.pk for game in previous] == [game.pk for game in expected]
+    assert not previous.has_previous
+
+
+GRID_SORTS = [
+    f"{field}-{direction}"
+    for field in ["name", "year_published", "max_playtime", "complexity", "rating_score"]
+    for direction in ["asc", "desc"]
+]
+
+
+def test_sort_name_is_normalized():
+    game = GameFactory(name="  Éclipse:   Second  DAWN ")
+    assert game.sort_name == make_sort_name(game.name) == "eclipse: second dawn"
+    assert [g.name for g in sort_queryset(Game.objects.all(), "name-asc")] == [game.name]
+
+
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="checks SQLite query plans")
+@pytest.mark.parametrize("sort", GRID_SORTS)
+def test_grid_sort_modes_use_an_index(sort):
+    for year in [2001, None, 1999]:
+        GameFactory(year_published=year)
+    queryset = sort_queryset(Game.objects.all(), sort)
+    _, descending = get_sort_key(sort)
+
+    # the first page, and every segment of later pages in both directions, from a NULL and a non-NULL position
+    queries = [queryset[:21]]
+    for value in [None, "1999" if sort.startswith("name") else 1999]:
+        for backwards in [False, True]:
+            ordered = queryset.reverse() if backwards else queryset
+            for condition in _position_filters(value, 1, descending, backwards):
+                queries.append(ordered.filter(condition)[:21])
+
+    for query in queries:
+        plan = query.explain()
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_game_api_cursor_pagination(client):
+    games = [GameFactory() for _ in range(12)]
+
+    response = client.get(reverse("api-game-list"))
+    assert [game["id"] for game in response.data["results"]] == [game.id for game in games[:10]]
+    assert response.data["previous"] is None
+
+    response = client.get(response.data["next"])
+    assert [game["id"] for game in response.data["results"]] == [game.id for game in games[10:]]
+    assert response.data["next"] is None
+
+
+def test_relevance_sort_outside_a_search_sorts_by_name(client):
+    games = [GameFactory(name=name) for name in ["Carcassonne", "Azul", "Brass"]]
+    response = client.get(reverse("game-list"), {"sort_by": "relevance"})
+    assert response.status_code == 200
+    assert list(response.context["page_obj"]) == [games[1], games[2], games[0]]
+
+
+def test_game_api_relevance_sort_outside_a_search_sorts_by_id(client):
+    games = GameFactory.create_batch(3)
+    response = client.get(reverse("api-game-list"), {"sort_by": "relevance"})
+    assert response.status_code == 200
+    assert [game["id"] for game in response.data["results"]] == [game.id for game in games]
+
+
+# =============== Player counts ===============
+def test_playable_with_matches_player_range():
+    for min_players, max_players in [(1, 1), (2, 4), (3, 10), (2, 12), (12, 20), (6, 8)]:
+        GameFactory(min_players=min_players, max_players=max_players)
+
+    for players in range(0, 22):
+        expected = Game.objects.filter(min_players__lte=players, max_players__gte=players)
+        assert set(Game.objects.filter(playable_with(players))) == set(expected), players
+    ten_or_more = Game.objects.filter(max_players__gte=10)
+    assert set(Game.objects.filter(playable_with(10, or_more=True))) == set(ten_or_more)
+
+
+def test_player_counts_follow_game_updates(client):
+    game = GameFactory(min_players=2, max_players=4)
+    assert list(Game.objects.filter(playable_with(5))) == []
+
+    game.max_players = 6
+    game.save()
+    assert list(Game.objects.filter(playable_with(5))) == [game]
+
+    response = client.get(reverse("api-game-list"), {"players": 5})
+    assert [result["id"] for result in response.data["results"]] == [game.id]
+    response = client.get(reverse("game-list"), {"players": "10+"})
+    assert list(response.context["page_obj"]) == []
+
+
+def test_lobby_create_offers_games_playable_with_players(client):
+    two_player = GameFactory(min_players=2, max_players=2)
+    GameFactory(min_players=3, max_players=6)
+    client.force_login(UserFactory())
+
+    response = client.get(reverse("lobby-create"), {"players": 2})
+    assert list(response.context["form"].fields["game"].queryset) == [two_player]
+
+
+def _lobby_list_queries(client, params=None):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("lobby-list"), params or {})
+    return response, len(queries)
+
+
+def test_lobby_list_pages_take_constant_queries(client):
+    lobby = LobbyFactory(max_players=6)
+    lobby.members.add(*UserFactory.create_batch(2))
+    _lobby_list_queries(client)  # the first request also sets up the session
+    _, few_lobbies_queries = _lobby_list_queries(client)
+
+    LobbyFactory.create_batch(40)
+    response, many_lobbies_queries = _lobby_list_queries(client)
+    assert many_lobbies_queries == few_lobbies_queries
+    assert len(response.context["table"].page.object_list) == 25
+
+    response, _ = _lobby_list_queries(client, {"lobby_name": lobby.name})
+    row = next(row for row in response.context["table"].page.object_list if row.record == lobby)
+    assert (row.record.member_count, row.record.open_seats) == (2, 4)
+
+
+def test_lobby_list_filters_names_by_indexed_prefix(client):
+    LobbyFactory(name="Friday Catan", game=GameFactory(name="Catan"))
+    LobbyFactory(name="Chess club", game=GameFactory(name="Chess"))
+
+    response, _ = _lobby_list_queries(client, {"lobby_name": "fri"})
+    assert [row.record.name for row in response.context["table"].page.object_list] == ["Friday Catan"]
+    response, _ = _lobby_list_queries(client, {"game_name": "CHE"})
+    assert [row.record.name for row in response.context["table"].page.object_list] == ["Chess club"]
+
+    plan = Lobby.objects.filter(name_starts_with("sort_name", "fri")).explain()
+    assert "lobby_sort_name_idx" in plan
+
+
+def test_lobby_join_and_leave_keep_the_member_count(client):
+    lobby = LobbyFactory(match_status=Lobby.Lobbied, min_players=2, max_players=2, lobby_created=timezone.now())
+    first, second, third = UserFactory.create_batch(3)
+
+    client.force_login(first)
+    client.get(reverse("lobby-join", kwargs={"pk": lobby.pk}))
+    response = client.get(reverse("lobby-join", kwargs={"pk": lobby.pk}), follow=True)
+    assert [str(message) for message in response.context["messages"]] == ["Already joined."]
+    lobby.refresh_from_db()
+    assert (lobby.member_count, lobby.match_status) == (1, Lobby.Lobbied)
+
+    assert lobby.join(second) == Lobby.JOINED
+    assert lobby.join(third) == Lobby.FULL
+    lobby.refresh_from_db()
+    assert (lobby.member_count, lobby.match_status) == (2, Lobby.Viewable)
+
+    client.get(reverse("lobby-leave", kwargs={"pk": lobby.pk}))
+    lobby.refresh_from_db()
+    assert lobby.member_count == 1
+    assert list(lobby.members.all()) == [second]
+
+
+def _open_lobby(created, members=0, **kwargs):
+    lobby = LobbyFactory(
+        match_status=Lobby.Lobbied, min_players=2, max_players=4, time_constraint=300, lobby_created=created, **kwargs
+    )
+    lobby.members.add(*UserFactory.create_batch(members))
+    return lobby
+
+
+def test_expire_lobbies_closes_expired_lobbies_in_batches():
+    now = timezone.now()
+    started = _open_lobby(now - timedelta(minutes=10), members=2)
+    cancelled = _open_lobby(now - timedelta(minutes=6), members=1)
+    still_open = _open_lobby(now - timedelta(minutes=4), members=1)
+    finished = _open_lobby(now - timedelta(minutes=10), members=1)
+    Lobby.objects.filter(pk=finished.pk).update(match_status=Lobby.Viewable)
+
+    assert expire_lobbies(now, batch_size=1) == 2
+    statuses = dict(Lobby.objects.values_list("pk", "match_status"))
+    assert statuses[started.pk] == Lobby.Viewable
+    assert statuses[cancelled.pk] == Lobby.Finished
+    assert statuses[still_open.pk] == Lobby.Lobbied
+    assert statuses[finished.pk] == Lobby.Viewable
+    assert seconds_until_next_expiry(now, limit=600) == pytest.approx(60)
+
+    plan = Lobby.objects.filter(match_status=Lobby.Lobbied, expires_at__lte=now).order_by("expires_at").explain()
+    assert "lobby_open_expires_idx" in plan
+
+
+def test_lobby_details_closes_its_expired_lobby(client):
+    lobby = _open_lobby(timezone.now() - timedelta(minutes=10), members=1)
+    response = client.get(reverse("lobby-details", kwargs={"pk": lobby.pk}))
+    assert response.context["lobby_detail"].match_status == Lobby.Finished
+    assert b"cancelled due to insufficient players" in response.content
+
+    lobby = _open_lobby(timezone.now())
+    response = client.get(reverse("lobby-details", kwargs={"pk": lobby.pk}))
+    assert response.context["lobby_detail"].match_status == Lobby.Lobbied
+    assert 299 <= response.context["seconds_left"] <= 300
+
+
+def test_run_lobby_timers_once():
+    lobby = _open_lobby(timezone.now() - timedelta(minutes=10), members=2)
+    out = io.StringIO()
+    call_command("run_lobby_timers", "--once", stdout=out)
+    assert "Closed 1 expired lobbies" in out.getvalue()
+    lobby.refresh_from_db()
+    assert lobby.match_status == Lobby.Viewable
+
+
+def test_saving_a_stale_lobby_keeps_its_member_count():
+    lobby = LobbyFactory(match_status=Lobby.Lobbied, min_players=2, max_players=4, lobby_created=timezone.now())
+    stale = Lobby.objects.get(pk=lobby.pk)
+    lobby.join(UserFactory())
+
+    stale.name = "Renamed"
+    stale.save()
+    lobby.refresh_from_db()
+    assert (lobby.name, lobby.member_count) == ("Renamed", 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_lobby_joins_never_overfill_it():
+    lobby = LobbyFactory(match_status=Lobby.Lobbied, min_players=2, max_players=10)
+    users = User.objects.bulk_create([User(username=f"player{i}", email=f"player{i}@example.com") for i in range(300)])
+
+    def join(user):
+        try:
+            while True:
+                try:
+                    return lobby.join(user)
+                except OperationalError:
+                    # The in-memory test database fails concurrent writes instead of waiting for them
+                    time.sleep(0.001)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        outcomes = Counter(pool.map(join, users))
+
+    assert outcomes == {Lobby.JOINED: 10, Lobby.FULL: 290}
+    lobby.refresh_from_db()
+    assert lobby.member_count == lobby.members.count() == 10
+    assert lobby.match_status == Lobby.Viewable
+
+
+def test_matchmaking_fills_open_lobbies_then_creates_new_ones():
+    game = GameFactory(name="Catan", min_players=2, max_players=4)
+    host, *players = UserFactory.create_batch(7)
+    lobby = LobbyFactory(
+        game=game,
+        created_by=host,
+        match_status=Lobby.Lobbied,
+        min_players=2,
+        max_players=3,
+        lobby_created=timezone.now(),
+    )
+    lobby.join(host)
+    matchmaker = Matchmaker()
+    for user in [host, *players]:
+        matchmaker.enqueue(user.pk, game.pk, 3)
+
+    placements = matchmaker.match()
+    # The host is already in the open lobby, so the next two players take its seats
+    assert placements.pop(lobby.pk) == [players[0].pk, players[1].pk]
+    [(new_lobby_id, user_ids)] = placements.items()
+    assert user_ids == [host.pk, players[2].pk, players[3].pk]
+
+    lobby.refresh_from_db()
+    assert (lobby.member_count, lobby.members.count(), lobby.match_status) == (3, 3, Lobby.Viewable)
+    new_lobby = Lobby.objects.get(pk=new_lobby_id)
+    assert (new_lobby.name, new_lobby.member_count, new_lobby.match_status) == ("Catan (3 players)", 3, Lobby.Viewable)
+    assert set(new_lobby.members.values_list("pk", flat=True)) == set(user_ids)
+
+    assert matchmaker.status(players[0].pk) == (MATCHED, lobby.pk)
+    assert matchmaker.status(players[0].pk) is None
+    assert [matchmaker.status(user.pk)[0] for user in players[4:]] == [QUEUED, QUEUED]
+    assert matchmaker.match() == {}
+
+
+def test_matchmaking_view(client, monkeypatch):
+    matchmaker = Matchmaker()
+    monkeypatch.setattr(matchmaking, "_matchmaker", matchmaker)
+    game = GameFactory(min_players=2, max_players=4)
+    user, other = UserFactory.create_batch(2)
+    client.force_login(user)
+
+    response = client.post(reverse("matchmaking"), {"game": game.pk, "players": 5})
+    assert response.status_code == 400
+    response = client.post(reverse("matchmaking"), {"game": game.pk, "players": 2})
+    assert response.json() == {"status": QUEUED, "game": game.pk, "players": 2, "waited": 0}
+    assert client.delete(reverse("matchmaking")).json() == {"status": None}
+
+    client.post(reverse("matchmaking"), {"game": game.pk, "players": 2})
+    matchmaker.enqueue(other.pk, game.pk, 2)
+    [lobby_id] = matchmaker.match()
+    response = client.get(reverse("matchmaking"))
+    assert response.json() == {
+        "status": MATCHED,
+        "lobby": lobby_id,
+        "url": reverse("lobby-details", kwargs={"pk": lobby_id}),
+    }
+
+
+def test_lobby_events_are_only_read_for_watched_lobbies(
+    client, django_capture_on_commit_callbacks, django_assert_num_queries
+):
+    lobby = LobbyFactory(match_status=Lobby.Lobbied, lobby_created=timezone.now())
+    with django_capture_on_commit_callbacks() as callbacks:
+        publish_lobby_events("status", [lobby.pk])
+    with django_assert_num_queries(0):
+        callbacks[0]()
+
+    # Served by Django rather than the ASGI application, the stream has no events
+    assert client.get(reverse("lobby-events", kwargs={"pk": lobby.pk})).status_code == 204
+
+
+def _watch_lobby(lobby, during):
+    """
+    Opens the event stream of `lobby`, runs `during` (a synchronous function) and disconnects
+    once the stream has sent something more. Returns the ASGI messages of the stream.
+    """
+
+    def run_during():
+        try:
+            during()
+        finally:
+            connection.close()
+
+    async def watch():
+        sent, received = asyncio.Queue(), asyncio.Queue()
+        scope = {"type": "http", "method": "GET", "path": reverse("lobby-events", kwargs={"pk": lobby.pk})}
+        # The application behind the router is never reached
+        stream = asyncio.ensure_future(LobbyEventsRouter(None)(scope, received.get, sent.put))
+        messages = [await sent.get(), await sent.get()]
+        await sync_to_async(run_during)()
+        messages.append(await asyncio.wait_for(sent.get(), 5))
+        await received.put({"type": "http.disconnect"})
+        await asyncio.wait_for(stream, 5)
+        return messages
+
+    return asyncio.run(watch())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lobby_event_stream_relays_joins():
+    lobby = LobbyFactory(match_status=Lobby.Lobbied, min_players=2, max_players=4, lobby_created=timezone.now())
+    user = UserFactory()
+
+    def join():
+        lobby.join(user)
+        publish_lobby_events("join", [lobby.pk], user)
+
+    start, initial, joined = _watch_lobby(lobby, join)
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream") in start["headers"]
+    assert b"event: lobby" in initial["body"]
+    assert b'"member_count": 0' in initial["body"]
+    assert b"event: join" in joined["body"]
+    assert b'"member_count": 1' in joined["body"]
+    assert f'"email": "{user.email}"'.encode() in joined["body"]
+    assert not get_backend().has_subscribers(lobby_channel(lobby.pk))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_lobby_event_stream_closes_its_lobby_when_time_is_up():
+    lobby = LobbyFactory(
+        match_status=Lobby.Lobbied,
+        min_players=2,
+        max_players=4,
+        time_constraint=300,
+        lobby_created=timezone.now() - timedelta(seconds=299.5),
+    )
+    lobby.members.add(*UserFactory.create_batch(2))
+
+    _, _, closed = _watch_lobby(lobby, lambda: None)
+    assert b"event: status" in closed["body"]
+    assert f'"match_status": {Lobby.Viewable}'.encode() in closed["body"]
+    lobby.refresh_from_db()
+    assert lobby.match_status == Lobby.Viewable
+
+
+# =============== Match results ===============
+def test_match_results_are_recorded_in_a_fixed_number_of_queries(
+    django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    game = GameFactory()
+    users = User.objects.bulk_create(
+        [User(username=f"player-{i}", email=f"player-{i}@example.com") for i in range(40)]
+    )
+    lobbies = []
+    for first, second in zip(users[::2], users[1::2]):
+        lobby = LobbyFactory(
+            game=game, match_status=Lobby.Viewable, min_players=2, max_players=2, lobby_created=timezone.now()
+        )
+        lobby.members.add(first, second)
+        lobbies.append(lobby)
+    results = [
+        {"lobby": lobby, "players": [{"user_id": user.pk, "outcome": Player.WIN}]}
+        for lobby, user in zip(lobbies, users[::2])
+    ]
+
+    # The savepoint, reading, creating and reading back the matches, reading and adding their
+    # players, counting them, finding the finished lobbies and the release
+    with django_assert_num_queries(9):
+        summary = record_match_results(results)
+    assert summary == {"created": 20, "updated": 0, "finished": []}
+    assert set(Match.objects.values_list("reported_count", flat=True)) == {1}
+
+    results = [
+        {"lobby": lobby, "players": [{"user_id": first.pk, "outcome": Player.LOSE}, {"user_id": second.pk}]}
+        for lobby, first, second in zip(lobbies[:10], users[::2], users[1::2])
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        summary = record_match_results(results)
+    assert summary == {"created": 10, "updated": 10, "finished": []}
+
+    results = [
+        {"lobby": lobby, "players": [{"user_id": second.pk, "outcome": Player.WIN}]}
+        for lobby, second in zip(lobbies[:10], users[1::2])
+    ]
+    summary = record_match_results(results)
+    assert sorted(summary["finished"]) == [lobby.pk for lobby in lobbies[:10]]
+    statuses = Counter(Lobby.objects.values_list("match_status", flat=True))
+    assert statuses == {Lobby.Finished: 10, Lobby.Viewable: 10}
+    assert Player.objects.filter(match__lobby=lobbies[0], outcome=Player.LOSE).count() == 1
+
+
+def test_check_guess_finishes_the_lobby_once_everyone_played(client):
+    lobby = LobbyFactory(match_status=Lobby.Viewable, min_players=2, max_players=2, lobby_created=timezone.now())
+    users = UserFactory.create_batch(2)
+    lobby.members.add(*users)
+    url = reverse("flip-result", kwargs={"pk": lobby.pk})
+    for user in users:
+        client.force_login(user)
+        client.post(url, {"user_guess": "heads"})
+
+    lobby.refresh_from_db()
+    assert lobby.match_status == Lobby.Finished
+    assert (lobby.match.reported_count, lobby.match.player_set.count()) == (2, 2)
+
+
+def test_check_guess_refuses_to_change_results(client):
+    lobby = LobbyFactory(match_status=Lobby.Viewable, min_players=3, max_players=3, lobby_created=timezone.now())
+    users = UserFactory.create_batch(3)
+    lobby.members.add(*users)
+    url = reverse("flip-result", kwargs={"pk": lobby.pk})
+
+    def outcomes():
+        return dict(Player.objects.filter(match__lobby=lobby).values_list("user_id", "outcome"))
+
+    # A player who already played can't play again
+    client.force_login(users[0])
+    client.post(url, {"user_guess": "heads"})
+    played = outcomes()
+    response = client.post(url, {"user_guess": "tails"})
+    assert response.templates[0].name == "games/game_already_played.html"
+    assert outcomes() == played
+
+    # Nor can anyone who isn't a member
+    client.force_login(UserFactory())
+    assert client.post(url, {"user_guess": "heads"}).status_code == 403
+
+    # Nor anyone once the lobby is over
+    Lobby.objects.filter(pk=lobby.pk).update(match_status=Lobby.Finished)
+    client.force_login(users[1])
+    assert client.post(url, {"user_guess": "heads"}).status_code == 403
+    assert outcomes() == played
+    assert not UserStats.objects.exists()
+
+
+def _play_matches(user, opponent, count, start):
+    """
+    Creates `count` matches of `user` against `opponent`, a day apart from `start` on, and
+    returns them oldest first.
+    """
+    game = GameFactory(name="Chess")
+    matches = []
+    for i in range(count):
+        lobby = LobbyFactory(game=game, match_status=Lobby.Finished, min_players=2, max_players=2, lobby_created=start)
+        matches.append(Match.objects.create(game=game, lobby=lobby, date_played=start + timedelta(days=i)))
+    Player.objects.bulk_create(
+        [
+            Player(match=match, user=player, outcome=outcome, date_played=match.date_played)
+            for match in matches
+            for player, outcome in ((user, Player.WIN), (opponent, Player.LOSE))
+        ]
+    )
+    return matches
+
+
+def test_match_history_pages_newest_first(django_assert_num_queries):
+    user, opponent = UserFactory.create_batch(2)
+    matches = _play_matches(user, opponent, 25, timezone.now() - timedelta(days=30))
+    paginator = MatchHistoryPaginator(Player.match_history(user), per_page=10)
+
+    seen, cursor = [], None
+    for _ in range(3):
+        # The players, then the players of their matches with their users
+        with django_assert_num_queries(2):
+            page = paginator.page(cursor)
+            rows = [
+                (player.match_id, player.match.game.name, [o.user.username for o in player.opponents])
+                for player in page
+            ]
+        seen.extend(rows)
+        cursor = page.next_cursor
+    assert [match_id for match_id, _, _ in seen] == [match.pk for match in reversed(matches)]
+    assert seen[0][1:] == ("Chess", [opponent.username])
+    assert not page.has_next and page.has_previous
+
+    previous = paginator.page(page.previous_cursor)
+    assert [player.match_id for player in previous] == [match.pk for match in reversed(matches[5:15])]
+
+    # Moving the match to another date moves it in the history
+    matches[0].date_played = timezone.now()
+    matches[0].save()
+    assert [player.match_id for player in paginator.page(None)][:2] == [matches[0].pk, matches[-1].pk]
+
+    plan = paginator.order(Player.objects.filter(user=user))[0].explain()
+    assert "player_user_date_idx" in plan
+
+
+def test_match_history_view(client):
+    user, opponent = UserFactory.create_batch(2)
+    _play_matches(user, opponent, 1, timezone.now())
+    response = client.get(reverse("users:user-match-history", kwargs={"pk": user.pk}))
+    assert response.status_code == 200
+    assert b"Chess" in response.content
+    assert opponent.username.encode() in response.content
+
+
+# =============== Player ratings ===============
+def test_replay_elo_updates_a_wave_of_matches_at_once():
+    # Matches 0 and 1 share no player; match 2 needs the ratings after both
+    match_index = np.array([0, 0, 1, 1, 2, 2, 2])
+    key_index = np.array([0, 1, 2, 3, 0, 2, 4])
+    ranks = np.array([0, 2, 1, 1, 2, 0, 1])
+    assert match_waves(match_index, key_index).tolist() == [0, 0, 1]
+
+    ratings = replay_elo(match_index, key_index, ranks, np.full(5, 1500.0))
+    # An even win gains half of K_FACTOR and a draw between equals changes nothing, then the
+    # three-player match compares every pair (with half of K_FACTOR per opponent)
+    after_first = 1500 + K_FACTOR / 2
+    expected_0 = 1 / (1 + 10 ** ((1500 - after_first) / 400))
+    assert ratings[0] == pytest.approx(after_first + K_FACTOR / 2 * ((0 - expected_0) + (0 - expected_0)))
+    assert ratings[1] == pytest.approx(1500 - K_FACTOR / 2)
+    assert ratings[3] == 1500
+    assert ratings.sum() == pytest.approx(5 * 1500)
+
+
+def test_finished_matches_update_the_ratings():
+    game = GameFactory()
+    strong, weak, other = UserFactory.create_batch(3)
+    for i in range(3):
+        lobby = LobbyFactory(
+            game=game, match_status=Lobby.Viewable, min_players=2, max_players=2, lobby_created=timezone.now()
+        )
+        lobby.members.add(strong, weak if i < 2 else other)
+        players = [
+            {"user_id": strong.pk, "outcome": Player.WIN},
+            {"user_id": (weak if i < 2 else other).pk, "outcome": Player.LOSE},
+        ]
+        record_match_results([{"lobby": lobby, "players": players}], now=timezone.now() + timedelta(minutes=i))
+
+    ratings = {rating.user_id: rating for rating in PlayerRating.objects.filter(game=game)}
+    assert ratings[strong.pk].matches_rated == 3
+    assert ratings[strong.pk].rating > PlayerRating.INITIAL_RATING > ratings[weak.pk].rating
+    # What the winner gains, the losers lose
+    assert sum(rating.rating for rating in ratings.values()) == pytest.approx(3 * PlayerRating.INITIAL_RATING)
+
+    incremental = dict(PlayerRating.objects.values_list("user_id", "rating"))
+    out = io.StringIO()
+    call_command("recompute_player_ratings", stdout=out)
+    assert "Rated 3 players" in out.getvalue()
+    assert dict(PlayerRating.objects.values_list("user_id", "rating")) == pytest.approx(incremental)
+
+
+def test_correcting_a_finished_match_replays_the_ratings():
+    game = GameFactory()
+    first, second = UserFactory.create_batch(2)
+    lobbies = []
+    for i in range(2):
+        lobby = LobbyFactory(
+            game=game, match_status=Lobby.Viewable, min_players=2, max_players=2, lobby_created=timezone.now()
+        )
+        lobby.members.add(first, second)
+        lobbies.append(lobby)
+        players = [{"user_id": first.pk, "outcome": Player.WIN}, {"user_id": second.pk, "outcome": Player.LOSE}]
+        record_match_results([{"lobby": lobby, "players": players}], now=timezone.now() + timedelta(minutes=i))
+
+    # The first match turns out to have been lost, which changes what the second one is worth
+    players = [{"user_id": first.pk, "outcome": Player.LOSE}, {"user_id": second.pk, "outcome": Player.WIN}]
+    record_match_results([{"lobby": lobbies[0], "players": players}])
+    corrected = dict(PlayerRating.objects.values_list("user_id", "rating"))
+    assert corrected[first.pk] == pytest.approx(PlayerRating.INITIAL_RATING, abs=2)
+
+    call_command("recompute_player_ratings", stdout=io.StringIO())
+    assert dict(PlayerRating.objects.values_list("user_id", "rating")) == pytest.approx(corrected)
+
+
+def test_tournament_seeding_spreads_the_strongest_players():
+    game = GameFactory(min_players=2, max_players=2)
+    tournament = TournamentFactory(game=game)
+    users = UserFactory.create_batch(7)
+    PlayerRating.objects.bulk_create(
+        [PlayerRating(user=user, game=game, rating=2000 - 90 * i) for i, user in enumerate(users[:6])]
+    )
+
+    seeded = tournament.seed_players(users)
+    brackets = [seeded[i : i + 2] for i in range(0, len(seeded), 2)]
+    # Dealt 1st to 4th bracket, then back: the 4th bracket only has room for one player, and
+    # the unrated player comes last
+    assert brackets == [[users[0], users[6]], [users[1], users[5]], [users[2], users[4]], [users[3]]]
+
+
+# =============== User statistics ===============
+def test_user_stats_follow_the_results_of_finished_matches():
+    game, other_game = GameFactory.create_batch(2)
+    winner, loser = UserFactory.create_batch(2)
+    lobbies = []
+    for lobby_game in (game, game, other_game):
+        lobby = LobbyFactory(
+            game=lobby_game, match_status=Lobby.Viewable, min_players=2, max_players=2, lobby_created=timezone.now()
+        )
+        lobby.members.add(winner, loser)
+        lobbies.append(lobby)
+
+    def report(lobby, winner_outcome, loser_outcome=Player.LOSE):
+        players = [{"user_id": winner.pk, "outcome": winner_outcome}, {"user_id": loser.pk, "outcome": loser_outcome}]
+        record_match_results([{"lobby": lobby, "players": players}])
+
+    # Cancelled lobbies were never played, so their results are ignored
+    cancelled = LobbyFactory(
+        game=game, match_status=Lobby.Finished, min_players=2, max_players=2, lobby_created=timezone.now()
+    )
+    cancelled.members.add(winner)
+    record_match_results([{"lobby": cancelled, "players": [{"user_id": winner.pk, "outcome": Player.WIN}]}])
+    assert not Match.objects.exists()
+    # Unfinished matches don't count
+    record_match_results([{"lobby": lobbies[0], "players": [{"user_id": winner.pk, "outcome": Player.WIN}]}])
+    assert not UserStats.objects.exists()
+    report(lobbies[0], Player.WIN)
+    report(lobbies[1], Player.WIN)
+    report(lobbies[2], Player.DRAW, Player.DRAW)
+    # A corrected result of a finished match replaces the old one
+    report(lobbies[1], Player.DRAW, Player.DRAW)
+
+    stats = UserStats.objects.get(user=winner)
+    assert (stats.matches_played, stats.wins, stats.draws) == (3, 1, 2)
+    assert UserStats.objects.get(user=loser).wins == 0
+    game_stats = UserGameStats.objects.get(user=winner, game=game)
+    assert (game_stats.matches_played, game_stats.wins, game_stats.draws) == (2, 1, 1)
+
+    def snapshot():
+        return {
+            "users": list(UserStats.objects.order_by("pk").values()),
+            "games": list(UserGameStats.objects.order_by("user_id", "game_id").values("user_id", "game_id", "wins")),
+        }
+
+    incremental = snapshot()
+    out = io.StringIO()
+    call_command("rebuild_user_stats", stdout=out)
+    assert "Rebuilt the statistics of 2 users" in out.getvalue()
+    assert snapshot() == incremental
+
+
+def test_ending_a_tournament_counts_it_once():
+    tournament = TournamentFactory(tournament_end_date=timezone.now() - timedelta(days=1))
+    winner, loser, bystander = UserFactory.create_batch(3)
+    tournament.players.add(winner, loser, bystander)
+    lobby = LobbyFactory(
+        game=tournament.game, match_status=Lobby.Finished, min_players=2, max_players=2, lobby_created=timezone.now()
+    )
+    match = Match.objects.create(game=tournament.game, lobby=lobby, date_played=timezone.now())
+    Player.objects.create(match=match, user=winner, outcome=Player.WIN)
+    Player.objects.create(match=match, user=loser, outcome=Player.LOSE)
+    tournament.matches.add(match)
+
+    tournament.end_tournament()
+    tournament.end_tournament()
+    stats = {stats.user_id: stats for stats in UserStats.objects.all()}
+    assert stats[winner.pk].tournaments_played == stats[bystander.pk].tournaments_played == 1
+    assert (stats[winner.pk].tournaments_won, stats[loser.pk].tournaments_won) == (1, 0)
+    assert list(tournament.winners.all()) == [winner]
+
+
+def test_user_history_reads_the_stats_in_one_query(client):
+    user = UserFactory()
+    UserStats.objects.create(user=user, matches_played=7, wins=4)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("users:user-history", kwargs={"pk": user.pk}))
+    assert response.status_code == 200
+    # Besides the session and the request's transaction
+    view_queries = [
+        query["sql"] for query in queries if "django_session" not in query["sql"] and "SAVEPOINT" not in query["sql"]
+    ]
+    assert len(view_queries) == 1 and "games_userstats" in view_queries[0]
+    assert response.context["stats"].wins == 4
+    # Users who haven't played yet have no statistics
+    response = client.get(reverse("users:user-history", kwargs={"pk": UserFactory().pk}))
+    assert response.context["stats"].matches_played == 0
+    assert client.get(reverse("users:user-history", kwargs={"pk": 0})).status_code == 404
+
+
+# =============== Facets ===============
+def _facet_counts(facets, name):
+    facet = next(facet for facet in facets if facet["name"] == name)
+    return {option["value"]: option["count"] for option in facet["options"]}
+
+
+def _facet_game(**kwargs):
+    return GameFactory(min_playtime=None, max_playtime=None, **kwargs)
+
+
+def test_facet_counts_for_catalog_and_filtered_results():
+    strategy = CategoryFactory(name="Strategy")
+    party = CategoryFactory(name="Party")
+    chess = _facet_game(min_players=2, max_players=2, expected_playtime=45, complexity=4, categories=[strategy])
+    _facet_game(min_players=4, max_players=12, expected_playtime=15, complexity=1, categories=[party])
+    _facet_game(min_players=1, max_players=4, expected_playtime=90, complexity=3, categories=[strategy, party])
+
+    facets = get_facets(Game.objects.all(), QueryDict(), filtered=False)
+    assert _facet_counts(facets, "players") == {
+        "1": 1,
+        "2": 2,
+        "3": 1,
+        "4": 2,
+        **{str(n): 1 for n in range(5, 10)},
+        "10+": 1,
+    }
+    assert _facet_counts(facets, "playtime") == {"0-30": 1, "30-60": 1, "60-120": 1}
+    assert _facet_counts(facets, "complexity") == {"1-2": 1, "3-4": 1, "4-5": 1}
+    assert _facet_counts(facets, "category") == {str(party.pk): 2, str(strategy.pk): 2}
+
+    params = QueryDict(f"category={strategy.pk}")
+    facets = get_facets(filter_by_facets(Game.objects.all(), params), params)
+    assert _facet_counts(facets, "category") == {str(party.pk): 1, str(strategy.pk): 2}
+    assert _facet_counts(facets, "players")["2"] == 2
+
+    params = QueryDict("complexity=4-5")
+    assert list(filter_by_facets(Game.objects.all(), params)) == [chess]
+
+
+# =============== Review summaries ===============
+def test_facet_index_ignores_games_linked_while_it_is_built(monkeypatch):
+    strategy = CategoryFactory(name="Strategy")
+    _facet_game(expected_playtime=30, categories=[strategy])
+    read_games = Game.objects.values_list
+
+    def read_games_then_add_one(*fields):
+        rows = list(read_games(*fields))
+        # Created and linked after the index read the games, before it reads the links
+        _facet_game(expected_playtime=30, categories=[strategy])
+        return rows
+
+    monkeypatch.setattr(Game.objects, "values_list", read_games_then_add_one)
+    index = FacetIndex()
+    assert index.counts()["category"] == [(str(strategy.pk), "Strategy", 1)]
+
+
+def test_review_summary_follows_review_changes():
+    game, other_game = GameFactory(), GameFactory()
+    user = UserFactory()
+    first = Review.objects.create(user=user, game=game, review="Great", rating=Decimal("4.50"))
+    Review.objects.create(user=user, game=game, review="Meh", rating=Decimal("2"))
+    Review.objects.create(user=user, game=game, review="No rating")
+
+    summary = ReviewSummary.objects.get(game=game)
+    assert (summary.review_count, summary.rating_count, summary.rating_mean) == (3, 2, Decimal("3.25"))
+    assert summary.histogram == [0, 1, 0, 0, 1]
+
+    first.rating = Decimal("1.2")
+    first.save()
+    summary.refresh_from_db()
+    assert summary.histogram == [1, 1, 0, 0, 0]
+    assert summary.rating_mean == Decimal("1.60")
+
+    first.game = other_game
+    first.save()
+    Review.objects.filter(review="Meh").delete()
+    summary.refresh_from_db()
+    assert (summary.review_count, summary.rating_count, summary.rating_mean) == (1, 0, None)
+    assert ReviewSummary.objects.get(game=other_game).histogram == [1, 0, 0, 0, 0]
+
+    # the incremental updates agree with a full recount
+    counts = list(ReviewSummary.objects.order_by("pk").values())
+    ReviewSummary.rebuild()
+    assert list(ReviewSummary.objects.order_by("pk").values()) == counts
+
+
+def test_review_summary_is_shown_and_serialized(client):
+    game = GameFactory()
+    Review.objects.create(user=UserFactory(), game=game, rating=Decimal("4"))
+
+    response = client.get(reverse("api-game-detail", args=[game.pk]))
+    assert response.data["review_summary"] == {
+        "review_count": 1,
+        "rating_count": 1,
+        "rating_mean": Decimal("4.00"),
+        "histogram": [0, 0, 0, 1, 0],
+    }
+    response = client.get(reverse("game-list"))
+    assert "★ 4.00 (1)" in response.content.decode()
+
+
+# =============== Rating scores ===============
+def test_top_rated_sort_uses_bayesian_scores(client):
+    one_perfect, many_good, many_bad, unrated = GameFactory(), GameFactory(), GameFactory(), GameFactory()
+    user = UserFactory()
+    Review.objects.create(user=user, game=one_perfect, rating=Decimal("5"))
+    for _ in range(20):
+        Review.objects.create(user=user, game=many_good, rating=Decimal("4.5"))
+        Review.objects.create(user=user, game=many_bad, rating=Decimal("2"))
+
+    assert recompute_rating_scores() == 3
+    one_perfect.refresh_from_db()
+    global_mean = (5 + 20 * 4.5 + 20 * 2) / 41
+    assert one_perfect.rating_score == pytest.approx((PRIOR_WEIGHT * global_mean + 5) / (PRIOR_WEIGHT + 1))
+
+    response = client.get(reverse("api-game-list"), {"sort_by": "rating_score-desc"})
+    assert [game["id"] for game in response.data["results"]] == [many_good.id, one_perfect.id, many_bad.id, unrated.id]
+
+    # a game whose reviews are all deleted loses its score
+    Review.objects.filter(game=one_perfect).delete()
+    recompute_rating_scores()
+    one_perfect.refresh_from_db()
+    assert one_perfect.rating_score is None
+
+
+# =============== Bulk import ===============
+def test_iter_json_array_reads_elements_across_chunks():
+    elements = [{"name": f'Game [{i}], with "brackets"', "tags": [i, {"x": None}]} for i in range(20)]
+    file = io.StringIO(json.dumps(elements, indent=2))
+    assert list(iter_json_array(file, chunk_size=7)) == elements
+    assert list(iter_json_array(io.StringIO("[]"))) == []
+
+
+def test_import_games_from_fixture():
+    fixture = Path(__file__).parent / "fixtures" / "games-fixture-50.json"
+    call_command("import_games", str(fixture), stdout=io.StringIO())
+
+    entries = json.loads(fixture.read_text())
+    assert Game.objects.count() == len(entries) == 50
+    first = Game.objects.get(pk=entries[0]["pk"])
+    assert first.name == entries[0]["fields"]["name"]
+    assert first.sort_name == make_sort_name(first.name)
+    assert list(search_games(first.name))[:1] == [first]
+    assert set(Game.objects.filter(playable_with(2))) == set(
+        Game.objects.filter(min_players__lte=2, max_players__gte=2)
+    )
+
+
+def test_import_games_twice_updates_the_games_with_a_bgg_id():
+    fixture = Path(__file__).parent / "fixtures" / "games-fixture-5.json"
+    call_command("import_games", str(fixture), stdout=io.StringIO())
+    game = Game.objects.exclude(BGG_id=None).first()
+    Game.objects.filter(pk=game.pk).update(name="Renamed")
+
+    call_command("import_games", str(fixture), stdout=io.StringIO())
+    assert Game.objects.count() == 5
+    assert Game.objects.get(pk=game.pk).name == game.name
+
+
+def test_game_upsert_inserts_or_updates_by_bgg_id(django_assert_num_queries):
+    existing = GameFactory(BGG_id=7, name="Old name")
+    games = [
+        Game(name="Catan", description="Trade", min_players=3, max_players=4, BGG_id=7),
+        Game(name="Azul", description="Tiles", min_players=2, max_players=4, BGG_id=8),
+    ]
+
+    # One statement for the batch, and one to read back the primary keys
+    with django_assert_num_queries(2):
+        Game.upsert(games)
+
+    assert games[0].pk == existing.pk
+    assert Game.objects.get(pk=existing.pk).sort_name == "catan"
+    assert Game.objects.get(BGG_id=8) == games[1]
+    assert Game.objects.count() == 2
+
+    # Only the given fields are overwritten
+    Game.upsert([Game(name="Catan 2", description="Changed", min_players=3, max_players=4, BGG_id=7)], ["name"])
+    game = Game.objects.get(pk=existing.pk)
+    assert (game.name, game.description) == ("Catan 2", "Trade")
+
+
+def test_create_game_with_existing_bgg_id_updates_it(client):
+    client.force_login(UserFactory(is_staff=True))
+    game = GameFactory(BGG_id=13)
+    data = {"name": "Catan", "description": "Trade and build.", "min_players": 3, "max_players": 4, "BGG_id": 13}
+    data.update(complexity="2.3", image="/static/images/no_picture_available.png")
+
+    response = client.post(reverse("game-create"), data, follow=True)
+    assert response.status_code == 200
+    assert Game.objects.count() == 1
+    assert Game.objects.get(pk=game.pk).name == "Catan"
+    assert "Catan was already in the catalog" in response.content.decode()
+    # Indexed like a saved game
+    assert list(search_games("catan")) == [game]
+
+    data.update(name="Azul", BGG_id=14, categories=[CategoryFactory().pk])
+    client.post(reverse("game-create"), data)
+    created = Game.objects.get(BGG_id=14)
+    assert created.name == "Azul" and created.categories.count() == 1
+
+
+def test_import_games_from_csv_skips_invalid_rows(tmp_path):
+    category, other_category = CategoryFactory(), CategoryFactory()
+    path = tmp_path / "games.csv"
+    path.write_text(
+        "name,description,min_players,max_players,min_playtime,max_playtime,complexity,categories\n"
+        f"Azul,Tiles,2,4,30,45,1.8,{category.pk};{other_category.pk};999999\n"
+        "Broken,Too many,5,3,,,2,\n"
+        "Slow,Playtime,2,4,90,60,,\n"
+        ",No name,2,4,,,,\n"
+        "Heavy,Too heavy,1,4,,,7,\n"
+    )
+    stderr = io.StringIO()
+    call_command("import_games", str(path), stdout=io.StringIO(), stderr=stderr)
+
+    azul = Game.objects.get()
+    assert (azul.name, azul.min_players, azul.max_players, azul.complexity) == ("Azul", 2, 4, Decimal("1.80"))
+    assert set(azul.categories.all()) == {category, other_category}
+    errors = stderr.getvalue()
+    assert "Row 2 skipped: min_players cannot be greater than max_players" in errors
+    assert "Row 3 skipped: min_playtime cannot be greater than max_playtime" in errors
+    assert "Row 4 skipped: name is required" in errors
+    assert "Row 5 skipped: complexity must be between 1 and 5" in errors
+    assert "1 unknown category or mechanic ids were ignored" in errors
+
+
+# =============== BoardGameGeek ===============
+class StubBGG:
+    """
+    A local HTTP server answering like the BGG XML API, after `latency` seconds. `thing`
+    requests are first answered with the statuses in `thing_statuses`, if any (None for a normal
+    answer).
+    """
+
+    def __init__(self, hits, latency):
+        self.hits = hits
+        self.latency = latency
+        self.fail = False
+        self.thing_statuses = []
+        self.thing_requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                time.sleep(stub.latency)
+                if stub.fail:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                if url.path.endswith("/search"):
+                    items = "".join(
+                        f'<item type="boardgame" id="{i}"><name type="primary" value="Game {i}"/></item>'
+                        for i in range(1, stub.hits + 1)
+                    )
+                else:
+                    ids = params["id"][0].split(",")
+                    stub.thing_requests.append(ids)
+                    status = stub.thing_statuses.pop(0) if stub.thing_statuses else None
+                    if status is not None:
+                        self.send_response(status)
+                        self.end_headers()
+                        return
+                    items = "".join(
+                        f'<item type="boardgame" id="{i}"><name type="primary" value="Game {i}"/>'
+                        f'<description>About game {i}</description><yearpublished value="2001"/>'
+                        '<minplayers value="2"/><maxplayers value="4"/><playingtime value="60"/>'
+                        '<link type="boardgamecategory" id="1002" value="Card Game"/>'
+                        f'<link type="boardgamemechanic" id="{i}" value="Mechanic {i}"/>'
+                        '<statistics><ratings><averageweight value="2.345"/></ratings></statistics></item>'
+                        for i in ids
+                    )
+                body = f"<items>{items}</items>".encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/xmlapi2/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def test_iter_items_parses_items_as_they_are_read():
+    body = (
+        b"<items>"
+        + b"".join(
+            b'<item id="%d"><name value="Game %d"/><comments><comment value="Fun"/></comments></item>' % (i, i)
+            for i in range(1, 1001)
+        )
+        + b"</items>"
+    )
+    stream = io.BytesIO(body)
+    items, positions = [], []
+    for item in bgg.iter_items(stream):
+        items.append(item)
+        positions.append(stream.tell())
+        assert bgg.parse_game(item)["name"] == f"Game {len(items)}"
+
+    assert len(items) == 1000
+    # The first items were parsed before the whole body was read, and each was freed afterwards
+    assert positions[0] < len(body)
+    assert all(len(item) == 0 for item in items)
+
+
+@pytest.fixture
+def stub_bgg(settings):
+    stub = StubBGG(hits=30, latency=0.2)
+    settings.BGG_BASE_URL = stub.url
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def test_bgg_search_fetches_details_in_concurrent_batches(client, stub_bgg):
+    start = time.monotonic()
+    response = client.get(reverse("bgg_search_by_name"), {"search_term": "Game"})
+    elapsed = time.monotonic() - start
+
+    games = response.json()["games_list"]
+    assert [game["name"] for game in games] == [f"Game {i}" for i in range(1, 31)]
+    assert games[0]["description"] == "About game 1"
+    assert games[0]["complexity"] == 2.35
+    # 30 ids in two batches, sent at the same time: about two round trips instead of 31 (with
+    # room for the overhead of the first request to the test client)
+    assert sorted(len(ids) for ids in stub_bgg.thing_requests) == [10, 20]
+    assert elapsed < 8 * stub_bgg.latency
+
+
+def test_bgg_search_returns_partial_results_within_budget(client, stub_bgg, settings):
+    settings.BGG_REQUEST_BUDGET = 1.0
+    stub_bgg.latency = 0.6  # the search fits in the budget, the details don't
+
+    start = time.monotonic()
+    response = client.get(reverse("bgg_search_by_name"), {"search_term": "Game"})
+    assert time.monotonic() - start < 1.5
+
+    games = response.json()["games_list"]
+    assert len(games) == 30
+    assert games[0] == {"BGG_id": "1", "name": "Game 1", "year_published": None, "image": bgg.DEFAULT_IMAGE}
+
+
+def test_bgg_search_reports_an_outage(client, stub_bgg):
+    stub_bgg.fail = True
+    response = client.get(reverse("bgg_search_by_name"), {"search_term": "Game"})
+    assert response.status_code == 502
+    assert response.json()["games_list"] == []
+
+
+@pytest.fixture
+def bgg_cache_file(settings, tmp_path):
+    settings.BGG_CACHE_PATH = str(tmp_path / "bgg-cache.sqlite3")
+    yield bgg_cache.get_cache()
+    # Let background refreshes finish before the stub server goes away
+    bgg_cache._refresher.submit(lambda: None).result()
+
+
+def test_bgg_cache_serves_repeated_lookups_from_disk(stub_bgg, bgg_cache_file):
+    assert set(bgg.get_game_details(["1", "2"])) == {"1", "2"}
+    assert len(bgg.search_games("Game")) == 30
+    assert len(stub_bgg.thing_requests) == 1
+
+    # BGG going down doesn't matter to cached lookups, which don't reach it at all
+    stub_bgg.fail = True
+    start = time.perf_counter()
+    for _ in range(100):
+        details = bgg.get_game_details(["1"])
+    assert (time.perf_counter() - start) / 100 < 0.001
+    assert details["1"]["description"] == "About game 1"
+    assert len(bgg.search_games(" game ")) == 30
+    assert len(stub_bgg.thing_requests) == 1
+
+
+def test_bgg_cache_revalidates_stale_entries_in_the_background(stub_bgg, bgg_cache_file, settings):
+    settings.BGG_CACHE_TTL = 0  # everything is stale as soon as it is cached
+    bgg.get_game_details(["1"])
+
+    start = time.monotonic()
+    assert bgg.get_game_details(["1"])["1"]["name"] == "Game 1"
+    assert time.monotonic() - start < stub_bgg.latency
+    bgg_cache._refresher.submit(lambda: None).result()
+    assert stub_bgg.thing_requests == [["1"], ["1"]]
+
+
+def test_bgg_cache_falls_back_to_expired_entries_during_an_outage(stub_bgg, bgg_cache_file, settings, monkeypatch):
+    settings.BGG_CACHE_TTL = 0
+    monkeypatch.setattr(bgg_cache, "STALE_WINDOW", 0)
+    bgg.get_game_details(["1"])
+    bgg.search_games("Game")
+
+    stub_bgg.fail = True
+    assert bgg.get_game_details(["1", "2"]) == {"1": bgg_cache_file.get("thing:1")[0]}
+    assert len(bgg.search_games("Game")) == 30
+    assert stub_bgg.thing_requests == [["1"]]
+
+
+def test_bgg_cache_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(bgg_cache, "ACCESS_RESOLUTION", 0)
+    cache = bgg_cache.ResponseCache(tmp_path / "cache.sqlite3", max_bytes=300)
+    for key in ["a", "b", "c"]:
+        cache.set(key, "x" * 90, ttl=60)
+    cache.get("a")
+
+    cache.set("d", "x" * 90, ttl=60)
+    assert cache.get("b") is None
+    assert [cache.get(key)[1] for key in ["a", "c", "d"]] == [bgg_cache.FRESH] * 3
+    cache.close()
+
+
+def test_bgg_cache_keeps_a_running_total_of_its_size(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+
+    def sizes(cache):
+        return [
+            cache._db.execute(sql).fetchone()[0] for sql in ("SELECT size FROM total", "SELECT SUM(size) FROM entries")
+        ]
+
+    cache = bgg_cache.ResponseCache(path, max_bytes=10000)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for key, value in [("a", "x" * 10), ("a", "x" * 20), ("b", "y")]:
+        cache.set(key, value, ttl=60)
+    cache._db.set_trace_callback(None)
+    # Writes don't sum the entries
+    assert not any("SUM" in statement for statement in statements)
+    total, summed = sizes(cache)
+    assert total == summed
+    cache.close()
+
+    # A cache from before the total was kept counts it once when opened
+    db = sqlite3.connect(path)
+    db.executescript(
+        "DROP TRIGGER entries_insert; DROP TRIGGER entries_update; DROP TRIGGER entries_delete; DROP TABLE total;"
+    )
+    db.close()
+    cache = bgg_cache.ResponseCache(path, max_bytes=10000)
+    assert sizes(cache) == [total, summed]
+    cache.clear()
+    assert sizes(cache)[0] == 0
+    cache.close()
+
+
+def _bgg_game(bgg_id):
+    return GameFactory(
+        BGG_id=bgg_id, name=f"Old name {bgg_id}", min_playtime=30, max_playtime=90, expected_playtime=45, complexity=1
+    )
+
+
+def test_sync_bgg_games_updates_changed_fields(stub_bgg, tmp_path):
+    stub_bgg.latency = 0
+    games = [_bgg_game(bgg_id) for bgg_id in range(1, 6)]
+    unchanged = GameFactory(
+        BGG_id=6,
+        name="Game 6",
+        description="About game 6",
+        year_published=2001,
+        min_players=2,
+        max_players=4,
+        min_playtime=30,
+        max_playtime=90,
+        expected_playtime=60,
+        complexity=Decimal("2.35"),
+    )
+    GameFactory(BGG_id=None, min_players=5, max_players=6)
+
+    out = io.StringIO()
+    with CaptureQueriesContext(connection) as queries:
+        call_command("sync_bgg_games", checkpoint=tmp_path / "checkpoint.json", rate=1000, batch_size=4, stdout=out)
+    # Validating the changed games doesn't look up their (unchanged) BGG ids one by one
+    assert not [query for query in queries if query["sql"].startswith('SELECT 1 AS "a" FROM "games_game"')]
+
+    assert "Synced 6 games" in out.getvalue() and "(5 updated, 6 given new categories" in out.getvalue()
+    assert stub_bgg.thing_requests == [["1", "2", "3", "4"], ["5", "6"]]
+    game = Game.objects.get(pk=games[0].pk)
+    assert (game.name, game.description, game.complexity) == ("Game 1", "About game 1", Decimal("2.35"))
+    assert game.sort_name == "game 1"
+    assert game.min_playtime == 30  # BGG has no value for it
+    assert list(Game.objects.filter(playable_with(3)).order_by("pk")) == [*games, unchanged]
+    # Categories and mechanics are linked by name, and created if they don't exist yet
+    assert game.categories.filter(name="Card Game").exists()
+    assert Category.objects.get(name="Card Game").description.startswith("Card Games use cards")
+    assert unchanged.mechanics.filter(name="Mechanic 6").exists()
+    assert not (tmp_path / "checkpoint.json").exists()
+
+
+def test_sync_bgg_games_rejects_non_positive_rates(tmp_path):
+    for rate in (0, -1):
+        with pytest.raises(CommandError, match="--rate"):
+            call_command("sync_bgg_games", checkpoint=tmp_path / "checkpoint.json", rate=rate, stdout=io.StringIO())
+
+
+def test_sync_bgg_games_retries_queued_requests(stub_bgg, tmp_path, monkeypatch):
+    monkeypatch.setattr("chigame.games.bgg_sync.INITIAL_BACKOFF", 0.01)
+    stub_bgg.latency = 0
+    stub_bgg.thing_statuses = [202, 202]
+    game = _bgg_game(1)
+
+    call_command("sync_bgg_games", checkpoint=tmp_path / "checkpoint.json", rate=1000, stdout=io.StringIO())
+
+    assert len(stub_bgg.thing_requests) == 3
+    assert Game.objects.get(pk=game.pk).name == "Game 1"
+
+
+def test_sync_bgg_games_resumes_from_its_checkpoint(stub_bgg, tmp_path):
+    stub_bgg.latency = 0
+    stub_bgg.thing_statuses = [None, 500]
+    games = [_bgg_game(bgg_id) for bgg_id in range(1, 5)]
+    checkpoint = tmp_path / "checkpoint.json"
+
+    with pytest.raises(CommandError, match="run again to resume"):
+        call_command("sync_bgg_games", checkpoint=checkpoint, rate=1000, batch_size=2, stdout=io.StringIO())
+    assert json.loads(checkpoint.read_text()) == {"last_pk": games[1].pk}
+    assert Game.objects.filter(name__startswith="Game").count() == 2
+
+    stub_bgg.thing_requests.clear()
+    out = io.StringIO()
+    call_command("sync_bgg_games", checkpoint=checkpoint, rate=1000, batch_size=2, stdout=out)
+    assert f"Resuming after game {games[1].pk}" in out.getvalue()
+    assert stub_bgg.thing_requests == [["3", "4"]]
+    assert Game.objects.filter(name__startswith="Game").count() == 4
+
+
+def test_token_bucket_limits_the_rate():
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(6):
+        bucket.take()
+    # A burst of 2, then one every half second
+    assert now[0] == 2.0
+
+
+def test_link_games_resolves_names_in_bulk(django_assert_num_queries, django_capture_on_commit_callbacks):
+    card_game = CategoryFactory(name="Card Game")
+    games = GameFactory.create_batch(20)
+    new_games = GameFactory.create_batch(20)
+    details = [{"categories": ["card game", "Dice"], "mechanics": [f"Mechanic {i % 3}"]} for i in range(20)]
+
+    # The names created are added to the map when their transaction commits
+    with django_capture_on_commit_callbacks(execute=True):
+        assert link_games(list(zip(games, details))) == {game.pk for game in games}
+    assert {card_game, Category.objects.get(name="Dice")} <= set(games[0].categories.all())
+    assert Category.objects.filter(name__iexact="card game").count() == 1
+
+    # Once every name is known, linking a batch takes one read and one insert per through table
+    with django_assert_num_queries(4):
+        link_games(list(zip(new_games, details)))
+    assert new_games[-1].mechanics.filter(name="Mechanic 1").exists()
+    assert link_games(list(zip(new_games, details))) == set()
+
+
+def test_bgg_autofill_selects_existing_categories_and_mechanics(client, stub_bgg):
+    stub_bgg.latency = 0
+    card_game = CategoryFactory(name="Card Game")
+    mechanic = MechanicFactory(name="Mechanic 1")
+
+    games = client.get(reverse("bgg_search_by_name"), {"search_term": "Game"}).json()["games_list"]
+    assert (games[0]["categories"], games[0]["mechanics"]) == ([card_game.pk], [mechanic.pk])
+    assert (games[1]["categories"], games[1]["mechanics"]) == ([card_game.pk], [])
+    # Nothing is created during a web request
+    assert not Mechanic.objects.filter(name="Mechanic 2").exists()
@@ -10,10 +10,10 @@ urlpatterns = [
     path("lobby/<int:pk>/", views.ViewLobbyDetails.as_view(), name="lobby-details"),
     path("lobby/<int:pk>/join", views.lobby_join, name="lobby-join"),
     path("lobby/<int:pk>/leave", views.lobby_leave, name="lobby-leave"),
+    path("lobby/<int:pk>/events/", views.lobby_events, name="lobby-events"),
+    path("matchmaking/", views.matchmaking, name="matchmaking"),
     path("lobby/<int:pk>/edit/", views.LobbyUpdateView.as_view(), name="lobby-edit"),
     path("lobby/<int:pk>/delete/", views.LobbyDeleteView.as_view(), name="lobby-delete"),
-    # For AJAX req. See lobby_details.html for invocation.
-    path("lobby/<int:pk>/update_match_status/", views.update_match_status, name="update_match_status"),
     # games
     path("", views.GameListView.as_view(), name="game-list"),
     path("create/", views.GameCreateView.as_view(), name="game-create"),
@@ -1,29 +1,40 @@
-import xml.etree.ElementTree as ET
+import time
 from functools import wraps
 from random import choice
 
 import requests
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.db.models.functions import Lower
-from django.http import HttpResponseForbidden, HttpResponseRedirect, JsonResponse
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.timezone import now
+from django.views.decorators.http import require_http_methods
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
 from django.views.generic.edit import FormMixin
+from django_tables2 import RequestConfig
+from django_tables2.paginators import LazyPaginator
 
 from chigame.users.models import User
 
+from . import bgg
+from .bgg_links import lookup_links
+from .facets import FACETS, filter_by_facets, get_facets
 from .filters import LobbyFilter
-from .forms import GameForm, LobbyForm, ReviewForm
-from .models import Chat, Game, Lobby, Match, Player, Review, Tournament
+from .forms import GameCreateForm, GameForm, LobbyForm, ReviewForm
+from .fuzzy import fuzzy_search_games
+from .lobby_events import publish_lobby_events
+from .matchmaking import MATCHED, QUEUED, get_matchmaker
+from .models import Chat, Game, Lobby, Player, Review, ReviewSummary, Tournament, playable_with
+from .pagination import KeysetPaginator, sort_queryset
+from .results import record_match_results
+from .search import search_games
 from .tables import LobbyTable
 
 
@@ -38,13 +49,31 @@ class GameListView(ListView):
         Returns a queryset of Game objects sorted and filtered based on the URL parameters.
         https://docs.djangoproject.com/en/4.2/ref/models/querysets/
         """
-        queryset = super().get_queryset()
+        # The cards show each game's rating, kept in its review summary
+        queryset = super().get_queryset().select_related("review_summary")
         sort = self.request.GET.get("sort_by", "name-asc")
         players = self.request.GET.get("players", "")
         queryset = apply_sorting_and_filtering(queryset, sort, players)
+        queryset = filter_by_facets(queryset, self.request.GET)
 
         return queryset
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Counts of matching games for each filter option, see facets.py
+        filtered = any(self.request.GET.get(name) for name, _ in FACETS)
+        context["facets"] = get_facets(self.object_list, self.request.GET, filtered=filtered)
+        return context
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginates with an opaque cursor (the "cursor" URL parameter) instead of page numbers,
+        so every page costs the same no matter how deep it is. See pagination.py.
+        """
+        sort = self.request.GET.get("sort_by", "name-asc")
+        page = KeysetPaginator(queryset, sort, page_size).page(self.request.GET.get("cursor"))
+        return (None, page, page.object_list, page.has_other_pages())
+
 
 class GameDetailView(LoginRequiredMixin, FormMixin, DetailView):
     model = Game
@@ -58,7 +87,8 @@ class GameDetailView(LoginRequiredMixin, FormMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["form"] = self.get_form()
-        context["reviews"] = Review.objects.filter(game=self.object)
+        # Rating statistics kept up to date as reviews change, see ReviewSummary
+        context["review_summary"] = ReviewSummary.objects.filter(game=self.object).first()
         return context
 
     def post(self, request, *args, **kwargs):
@@ -78,7 +108,7 @@ class GameDetailView(LoginRequiredMixin, FormMixin, DetailView):
 
 class GameCreateView(UserPassesTestMixin, CreateView):
     model = Game
-    form_class = GameForm
+    form_class = GameCreateForm
     template_name = "games/game_form.html"
     success_url = reverse_lazy("game-list")  # URL to redirect after successful creation
     raise_exception = True  # if user is not staff member, raise exception
@@ -87,6 +117,16 @@ class GameCreateView(UserPassesTestMixin, CreateView):
     def test_func(self):
         return self.request.user.is_staff
 
+    def form_valid(self, form):
+        if form.instance.BGG_id is None:
+            return super().form_valid(form)
+        # A game autofilled from BGG that is already in the catalog is updated rather than duplicated
+        self.object = form.save(commit=False)
+        if not Game.upsert_one(self.object):
+            messages.info(self.request, f"{self.object.name} was already in the catalog, so it was updated.")
+        form.save_m2m()
+        return HttpResponseRedirect(self.get_success_url())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -122,9 +162,7 @@ class GameEditView(UserPassesTestMixin, UpdateView):
 
 
 # =============== BGG Searching =================
-# The following functions involve using the BoardGameGeek API to search for games.
-# API documentation: https://boardgamegeek.com/wiki/page/BGG_XML_API2
-# ChiGame's documentation: https://github.com/uchicago-cs/chigame/wiki/Games-~-BoardGameGeek-(BGG)-API
+# The BoardGameGeek API client is in bgg.py
 
 
 def bgg_search_by_name(request):
@@ -135,22 +173,22 @@ def bgg_search_by_name(request):
 
     if request.method == "GET":
         search_term = request.GET.get("search_term")
-        BGG_BASE_URL = "https://www.boardgamegeek.com/xmlapi2/"
-        url = f"{BGG_BASE_URL}search?type=boardgame&query={search_term}&exact=1"
-        response = requests.get(url)
-        # Parse the XML response
-        root = ET.fromstring(response.text)
-
-        # Initialize a list to store game data
-        games_list = []
-
-        # Iterates over all 'item' elements in the XML tree and retrieves the game details
-        # An example XML response can be found here:
-        # https://boardgamegeek.com/xmlapi2/search/search?type=boardgame&query=13&exact=1%22
-        for game in root.findall(".//item"):
-            bgg_id = game.get("id")
-            game_data = bgg_get_game_details(bgg_id)
-            games_list.append(game_data)
+        # The whole lookup, search and details, must fit in the time budget
+        deadline = time.monotonic() + settings.BGG_REQUEST_BUDGET
+        try:
+            hits = bgg.search_games(search_term, timeout=settings.BGG_REQUEST_BUDGET)
+        except requests.RequestException as error:
+            return JsonResponse({"games_list": [], "error": f"BoardGameGeek is unavailable: {error}"}, status=502)
+
+        # The details of all hits are fetched in a few concurrent batches. Hits whose details
+        # did not arrive in time are returned with just their id, name and year.
+        details = bgg.get_game_details([hit["BGG_id"] for hit in hits], budget=deadline - time.monotonic())
+        games_list = [
+            {**details[hit["BGG_id"]], **lookup_links(details[hit["BGG_id"]])}
+            if hit["BGG_id"] in details
+            else {**hit, "image": bgg.DEFAULT_IMAGE}
+            for hit in hits
+        ]
 
         return JsonResponse({"games_list": games_list})
 
@@ -162,70 +200,30 @@ def bgg_search_by_id(request):
     """
     if request.method == "GET":
         game_id = request.GET.get("game_id")
-        game_data = bgg_get_game_details(game_id)
+        game_data = bgg.get_game_details([game_id]).get(game_id)
+        if game_data is not None:
+            game_data = {**game_data, **lookup_links(game_data)}
         return JsonResponse({"game_details": game_data})
 
 
-def bgg_get_game_details(bgg_id):
-    """
-    Retrieves detailed information about a game from the BoardGameGeek (BGG) API using a given BGG ID.
-    The information includes the game's name, image, description, year of publication, player range,
-    playtime, suggested age, and complexity rating.
-
-    Args:
-    bgg_id (str): The BoardGameGeek ID of the game.
-
-    Returns:
-    dict: A dictionary containing various details about the game.
-    """
-    BGG_BASE_URL = "https://www.boardgamegeek.com/xmlapi2/"
-
-    # Construct the URL to get details of the game with the specified BGG ID
-    details_url = f"{BGG_BASE_URL}thing?id={bgg_id}&stats=1"
-    details_response = requests.get(details_url)
-    # Parse the XML response
-    details_root = ET.fromstring(details_response.text)
-
-    # Retrieve the complexity value from the API response, convert it to a float,
-    # and round it to two decimal places. If the value is not found, default to None.
-    complexity_value = details_root.find(".//averageweight").get("value")
-    rounded_complexity = round(float(complexity_value), 2) if complexity_value else None
-
-    # Function to safely get the value from the XML tree
-    def get_value(xml_root, tag, attribute="value", default=None):
-        element = xml_root.find(f".//{tag}")
-        if element is not None:
-            return element.get(attribute) if attribute else element.text
-        return default
-
-    # Refactored game data structure
-    game_data = {
-        "BGG_id": bgg_id,
-        "name": get_value(details_root, "name"),
-        "image": get_value(details_root, "image", attribute=None, default="/static/images/no_picture_available.png"),
-        "description": get_value(details_root, "description", attribute=None),
-        "year_published": int(get_value(details_root, "yearpublished", default=0)) or None,
-        "min_players": get_value(details_root, "minplayers"),
-        "max_players": get_value(details_root, "maxplayers"),
-        "expected_playtime": get_value(details_root, "playingtime"),
-        "min_playtime": get_value(details_root, "minplaytime"),
-        "max_playtime": get_value(details_root, "maxplaytime"),
-        "suggested_age": get_value(details_root, "minage"),
-        "complexity": rounded_complexity,  # The rounded complexity rating of the game
-        # Missing fields: category, mechanics
-        # No rules field in BGG API
-    }
-
-    return game_data
-
-
 # =============== Lobby Views ===============
+LOBBIES_PER_PAGE = 25
 
 
 def lobby_list(request):
-    queryset = Lobby.objects.all()
+    """
+    The lobbies, newest first, a page at a time. Each page takes the same few queries however
+    many lobbies there are: the game and creator are joined in, the member counts are stored on
+    the lobbies, and the pages aren't counted (LazyPaginator).
+    """
+    queryset = (
+        Lobby.objects.select_related("game", "created_by")
+        .annotate(open_seats=F("max_players") - F("member_count"))
+        .order_by("-lobby_created", "-id")
+    )
     filter = LobbyFilter(request.GET, queryset=queryset)
     table = LobbyTable(filter.qs)
+    RequestConfig(request, paginate={"per_page": LOBBIES_PER_PAGE, "paginator_class": LazyPaginator}).configure(table)
 
     return render(request, "games/lobby_list.html", {"table": table, "filter": filter})
 
@@ -233,36 +231,90 @@ def lobby_list(request):
 @login_required
 def lobby_join(request, pk):
     lobby = get_object_or_404(Lobby, pk=pk)
-    joined = Lobby.objects.filter(members=request.user.id)
-    print(joined, lobby)
-    if lobby in joined:
+    outcome = lobby.join(request.user)
+    if outcome == Lobby.JOINED:
+        publish_lobby_events("join", [lobby.pk], request.user)
+    elif outcome == Lobby.ALREADY_JOINED:
         messages.error(request, "Already joined.")
-        return redirect(reverse("lobby-details", kwargs={"pk": lobby.id}))
-    lobby.members.add(request.user)
-    if lobby.members.all().count() == lobby.max_players:
-        lobby.match_status = 2
-    lobby.save()
+    elif outcome == Lobby.FULL:
+        messages.error(request, "Lobby is full.")
     return redirect(reverse("lobby-details", kwargs={"pk": lobby.id}))
 
 
 @login_required
 def lobby_leave(request, pk):
     lobby = get_object_or_404(Lobby, pk=pk)
-    joined = Lobby.objects.filter(members=request.user.id)
-    print(joined, lobby)
-    if lobby not in joined:
+    if lobby.leave(request.user):
+        publish_lobby_events("leave", [lobby.pk], request.user)
+    else:
         messages.error(request, "Haven't joined.")
-        return redirect(reverse("lobby-details", kwargs={"pk": lobby.id}))
-    lobby.members.remove(request.user)
     return redirect(reverse("lobby-details", kwargs={"pk": lobby.id}))
 
 
+def lobby_events(request, pk):
+    """
+    The event stream of a lobby is served by the ASGI application (see chigame/games/asgi.py).
+    Served by Django instead, e.g. by the development server, it has no events: 204 tells
+    browsers not to reconnect.
+    """
+    get_object_or_404(Lobby, pk=pk)
+    return HttpResponse(status=204)
+
+
+@login_required
+@require_http_methods(["GET", "POST", "DELETE"])
+def matchmaking(request):
+    """
+    The current user's place in the matchmaking queues, as JSON (see matchmaking.py). GET tells
+    whether they are waiting or were placed in a lobby, POST queues them for the `game` with
+    `players` players, and DELETE takes them out of the queue.
+    """
+    matchmaker = get_matchmaker()
+    if request.method == "POST":
+        game_id, players = request.POST.get("game", ""), request.POST.get("players", "")
+        game = Game.objects.filter(pk=game_id).first() if game_id.isdigit() else None
+        if game is None:
+            return JsonResponse({"error": "Unknown game."}, status=400)
+        if not players.isdigit() or not max(game.min_players, 2) <= int(players) <= game.max_players:
+            return JsonResponse(
+                {"error": f"{game.name} is played by {game.min_players} to {game.max_players} players."}, status=400
+            )
+        matchmaker.enqueue(request.user.pk, game.pk, int(players))
+    elif request.method == "DELETE":
+        matchmaker.dequeue(request.user.pk)
+
+    status = matchmaker.status(request.user.pk)
+    if status is None:
+        return JsonResponse({"status": None})
+    if status[0] == MATCHED:
+        return JsonResponse(
+            {"status": MATCHED, "lobby": status[1], "url": reverse("lobby-details", kwargs={"pk": status[1]})}
+        )
+    ticket = status[1]
+    return JsonResponse(
+        {
+            "status": QUEUED,
+            "game": ticket.game_id,
+            "players": ticket.players,
+            "waited": round(matchmaker.clock() - ticket.enqueued_at),
+        }
+    )
+
+
 class LobbyCreateView(LoginRequiredMixin, CreateView):
     model = Lobby
     form_class = LobbyForm
     template_name = "games/lobby_form.html"
     success_url = reverse_lazy("lobby-list")
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        # ?players=N only offers the games playable with N players
+        players = self.request.GET.get("players", "")
+        if players.isdigit():
+            form.fields["game"].queryset = Game.objects.filter(playable_with(int(players))).order_by("sort_name")
+        return form
+
     def form_valid(self, form):
         form.instance.created_by = self.request.user
         form.instance.lobby_created = timezone.now()
@@ -274,18 +326,20 @@ class ViewLobbyDetails(DetailView):
     template_name = "games/lobby_details.html"
     context_object_name = "lobby_detail"
 
+    def get_object(self, queryset=None):
+        lobby = super().get_object(queryset)
+        # The lobby timers close expired lobbies every few seconds; a page opened in between
+        # (such as the reload when the countdown ends) closes its lobby itself
+        if lobby.match_status == Lobby.Lobbied and lobby.expires_at <= timezone.now():
+            if Lobby.expire(Lobby.objects.filter(pk=lobby.pk)):
+                publish_lobby_events("status", [lobby.pk])
+            lobby.refresh_from_db(fields=["match_status"])
+        return lobby
 
-def update_match_status(request, pk):
-    # A bit weird: sends Ajax request to change match status when timer runs out.
-    lobby = get_object_or_404(Lobby, id=pk)
-
-    if lobby.members.all().count() >= lobby.min_players:
-        lobby.match_status = 2
-    else:
-        lobby.match_status = 3
-    lobby.save()
-
-    return JsonResponse({"message": "Match status updated successfully"})
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["seconds_left"] = max(0, round((self.object.expires_at - timezone.now()).total_seconds()))
+        return context
 
 
 class LobbyUpdateView(UpdateView):
@@ -319,52 +373,41 @@ class LobbyDeleteView(DeleteView):
 
 def apply_sorting_and_filtering(queryset, sort_param, players_param):
     # Example value of sort_param: "name-asc" or "year_published-desc".
+    # "relevance" keeps the ranking of a search queryset (see search_games).
+    # Ties are broken by id so the results can be paginated with a cursor (see pagination.py).
     if sort_param:
-        sort_field, sort_direction = sort_param.rsplit("-", 1)
-        sort_order = "-" if sort_direction == "desc" else ""
-
-        if sort_field == "name":
-            if sort_direction == "desc":
-                queryset = queryset.order_by(Lower("name").desc())
-            else:
-                queryset = queryset.order_by(Lower("name"))
-        else:
-            queryset = queryset.order_by(f"{sort_order}{sort_field}")
+        queryset = sort_queryset(queryset, sort_param)
 
     # Filter by number of players. Handles numeric values and '10+' case.
+    # Both are an indexed lookup on the player count bitmask (see playable_with).
     if players_param:
         if players_param.isdigit():
-            players = int(players_param)
-            queryset = queryset.filter(min_players__lte=players, max_players__gte=players)
+            queryset = queryset.filter(playable_with(int(players_param)))
         elif players_param == "10+":
-            queryset = queryset.filter(max_players__gte=10)
+            queryset = queryset.filter(playable_with(10, or_more=True))
 
     return queryset
 
 
 def search_results(request):
     query_input = request.GET.get("q")
-    sort = request.GET.get("sort_by", "name-asc")
+    sort = request.GET.get("sort_by", "relevance")
     players = request.GET.get("players", "")
-    page_number = request.GET.get("page")
+    cursor = request.GET.get("cursor")
+    fuzzy = request.GET.get("fuzzy") == "1"
 
-    """
-    The Q object is an object used to encapsulate a collection of keyword
-    arguments that can be combined with logical operators (&, |, ~) which
-    allows for more advanced searches. More info can be found here at
-    https://docs.djangoproject.com/en/4.2/topics/db/queries/#complex-lookups-with-q-objects
-    """
-    object_list = Game.objects.filter(
-        Q(name__icontains=query_input)
-        | Q(categories__name__icontains=query_input)
-        | Q(people__name__icontains=query_input)
-        | Q(publishers__name__icontains=query_input)
-    ).distinct()  # only show unique game objects (no duplicates)
+    if fuzzy:
+        # Typo-tolerant matching on game names only, closest names first. See fuzzy.py.
+        object_list = fuzzy_search_games(query_input)
+    else:
+        # Matches the query against the full-text index over game names, descriptions, categories,
+        # mechanics, people and publishers. Results come back ordered by relevance. See search.py.
+        object_list = search_games(query_input)
 
     object_list = apply_sorting_and_filtering(object_list, sort, players)
+    object_list = filter_by_facets(object_list, request.GET).select_related("review_summary")
 
-    paginator = Paginator(object_list, 20)
-    page_obj = paginator.get_page(page_number)
+    page_obj = KeysetPaginator(object_list, sort, 20).page(cursor)
 
     context = {
         "query_type": "games",
@@ -372,6 +415,8 @@ def search_results(request):
         "page_obj": page_obj,
         "current_sort": sort,
         "current_players": players,
+        "facets": get_facets(object_list, request.GET),
+        "fuzzy": fuzzy,
         # Any changes to these variables must be reflected in the games_grid.html template
         "query_input": query_input,
     }
@@ -787,34 +832,14 @@ def check_guess(request, pk):
     correct_guess = user_guess == coin_result
 
     lobby = get_object_or_404(Lobby, id=pk)
-
-    # allows two users to play the game
-    if Match.objects.filter(lobby__id=pk).exists():
-        match = get_object_or_404(Match, lobby__id=pk)
-    else:
-        # Create Match instance linked to the fetched Lobby
-        match = Match.objects.create(
-            game_id=lobby.game.id,
-            lobby=lobby,
-            date_played=timezone.now()
-            # Add other fields as needed
-        )
-
-    player = Player.objects.create(
-        user=request.user,
-        match=match,
-    )
-    if correct_guess:
-        player.outcome = Player.WIN
-    else:
-        player.outcome = Player.LOSE
-    player.save()
-
-    # Checks if everyone has played
-    if match.players.all().count() == lobby.members.all().count():
-        lobby.match_status = 3
-    match.save()
-    lobby.save()
+    # As MatchResultsSerializer checks: only members of a lobby in progress play, once each
+    if lobby.match_status != Lobby.Viewable or not lobby.members.filter(pk=request.user.pk).exists():
+        return HttpResponseForbidden("You can't play in this lobby.")
+    if Player.objects.filter(user=request.user, match__lobby=lobby, outcome__isnull=False).exists():
+        return render(request, "games/game_already_played.html")
+    # Finishes the lobby once everyone has played
+    outcome = Player.WIN if correct_guess else Player.LOSE
+    record_match_results([{"lobby": lobby, "players": [{"user_id": request.user.pk, "outcome": outcome}]}])
     return render(
         request,
         "games/game_coinresult.html",
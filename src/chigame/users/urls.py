@@ -36,6 +36,7 @@ urlpatterns = [
     path("accept_friend_invitation/<int:pk>", view=accept_friend_invitation, name="accept-friend-invitation"),
     path("decline_friend_invitation/<int:pk>", view=decline_friend_invitation, name="decline-friend-invitation"),
     path("user_history/<int:pk>", views.user_history, name="user-history"),
+    path("match_history/<int:pk>", views.user_match_history, name="user-match-history"),
     path("search-results", view=user_search_results, name="user-search-results"),
     path("notifications/search-results", view=notification_search_results, name="notification-search-results"),
     path("inbox/<int:pk>", view=user_inbox_view, name="user-inbox"),
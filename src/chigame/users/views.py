@@ -7,13 +7,11 @@ from django.db.models import Q
 from django.http import HttpResponseNotFound
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, RedirectView, UpdateView
-from rest_framework import status
-from rest_framework.response import Response
 
-from chigame.games.models import Lobby, Player, Tournament
+from chigame.games.models import Player, UserStats
+from chigame.games.pagination import MatchHistoryPaginator
 
 from .models import FriendInvitation, Notification, UserProfile
 from .tables import FriendsTable, UserTable
@@ -76,30 +74,26 @@ def user_list(request):
 
 
 def user_history(request, pk):
+    """
+    Shows a user's match and tournament statistics, kept up to date in UserStats, so the page
+    reads them with the user in a single query.
+    """
+    user = get_object_or_404(User.objects.select_related("stats"), pk=pk)
     try:
-        user = User.objects.get(pk=pk)
-
-        match_count = Lobby.objects.filter(match_status=3, members__in=[user]).count()
-        match_wins = Player.objects.filter(Q(user=user, outcome=Player.WIN) | Q(team=user, outcome=Player.WIN)).count()
-
-        tournament_count = Tournament.objects.filter(
-            tournament_end_date__lt=timezone.now(), players__in=[user]
-        ).count()
-        tournament_wins = Tournament.objects.filter(winners__in=[user]).count()
-
-        return render(
-            request,
-            "users/user_history.html",
-            {
-                "user": user,
-                "match_count": match_count,
-                "match_wins": match_wins,
-                "tournament_count": tournament_count,
-                "tournament_wins": tournament_wins,
-            },
-        )
-    except User.DoesNotExist:
-        return Response(status=status.HTTP_404_NOT_FOUND)
+        stats = user.stats
+    except UserStats.DoesNotExist:
+        stats = UserStats(user=user)  # Hasn't played yet
+    return render(request, "users/user_history.html", {"user": user, "stats": stats})
+
+
+def user_match_history(request, pk):
+    """
+    Lists the matches a user played, newest first, a page at a time. Pages are keyset paginated,
+    so deep pages of a long history cost the same as the first (see MatchHistoryPaginator).
+    """
+    user = get_object_or_404(User, pk=pk)
+    page = MatchHistoryPaginator(Player.match_history(user), per_page=20).page(request.GET.get("cursor"))
+    return render(request, "users/user_match_history.html", {"history_user": user, "page_obj": page})
 
 
 def user_profile_detail_view(request, pk):
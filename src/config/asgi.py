@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chigame.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up: the lobby event streams are served in front of Django
+from chigame.games.asgi import LobbyEventsRouter  # noqa: E402
+
+application = LobbyEventsRouter(django_application)
@@ -382,3 +382,26 @@ MACHINA_DEFAULT_AUTHENTICATED_USER_FORUM_PERMISSIONS = [
     "can_vote_in_polls",
     "can_download_file",
 ]
+
+# BoardGameGeek
+# ------------------------------------------------------------------------------
+# https://boardgamegeek.com/wiki/page/BGG_XML_API2
+BGG_BASE_URL = env("BGG_BASE_URL", default="https://www.boardgamegeek.com/xmlapi2/")
+# How long (in seconds) a web request may spend waiting on BoardGameGeek in total
+BGG_REQUEST_BUDGET = env.float("BGG_REQUEST_BUDGET", default=10.0)
+# Where BoardGameGeek responses are cached on disk (an empty value disables the cache)
+BGG_CACHE_PATH = env("BGG_CACHE_PATH", default=str(BASE_DIR / ".bgg-cache.sqlite3")) or None
+# How long (in seconds) cached responses are used before asking BoardGameGeek again
+BGG_CACHE_TTL = env.int("BGG_CACHE_TTL", default=7 * 24 * 3600)
+# The size (in bytes) past which the least recently used cached responses are evicted
+BGG_CACHE_MAX_BYTES = env.int("BGG_CACHE_MAX_BYTES", default=64 * 1024 * 1024)
+# How many requests per second the sync_bgg_games command sends to BoardGameGeek
+BGG_SYNC_RATE = env.float("BGG_SYNC_RATE", default=0.5)
+# Where sync_bgg_games records its progress, so an interrupted sync can resume
+BGG_SYNC_CHECKPOINT_PATH = env("BGG_SYNC_CHECKPOINT_PATH", default=str(BASE_DIR / ".bgg-sync-checkpoint.json"))
+
+# Lobby events
+# ------------------------------------------------------------------------------
+# The publish/subscribe backend that carries lobby events to the event streams (see
+# chigame/games/lobby_events.py). The default only reaches streams served by the same process.
+LOBBY_EVENTS_BACKEND = env("LOBBY_EVENTS_BACKEND", default="chigame.games.lobby_events.InProcessBroker")
@@ -24,6 +24,10 @@ PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#caches
 CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "",
+    },
     # django-machina attachments cache
     # https://django-machina.readthedocs.io/en/latest/getting_started.html#django-settings
     "machina_attachments": {
@@ -32,6 +36,11 @@ CACHES = {
     },
 }
 
+# BOARDGAMEGEEK
+# ------------------------------------------------------------------------------
+# Tests that use the BoardGameGeek cache point it at a temporary file
+BGG_CACHE_PATH = None
+
 # EMAIL
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-backend